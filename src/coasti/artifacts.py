@@ -0,0 +1,183 @@
+"""
+Downloads of tool artifacts (release archives, binaries), once per user.
+
+Artifacts are kept in the file store (`coasti.store`) by their sha256. A url
+index, `<store>/urls/<sha256 of url>`, holds the digest of what a url served
+last, so a tool that another product or workspace already fetched is not
+downloaded again. With a pinned `sha256`, the store is checked first and
+downloads are verified.
+
+Concurrent fetches of the same url within one process wait for one download.
+
+```
+artifact = ArtifactCache().fetch(url, sha256="")
+unpack(artifact, artifact_name(url), dst_path)
+```
+"""
+
+from __future__ import annotations
+
+import hashlib
+import shutil
+import stat
+import tarfile
+import threading
+import uuid
+import zipfile
+from collections.abc import Iterator
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+from coasti.logger import log
+from coasti.store import FileStore, stored_digest
+from coasti.timing import count, span
+
+DOWNLOAD_TIMEOUT_SECONDS = 60
+
+_CHUNK = 1 << 20
+_TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+class ChecksumError(ValueError):
+    pass
+
+
+class ArtifactCache:
+    _locks: dict[str, threading.Lock] = {}
+    _locks_lock = threading.Lock()
+
+    def __init__(self, store: FileStore | None = None) -> None:
+        self.store = store or FileStore()
+
+    def fetch(self, url: str, sha256: str = "", refresh: bool = False) -> Path:
+        """The stored artifact served by `url`, downloaded if needed.
+
+        With `refresh`, the url is downloaded again unless `sha256` is pinned
+        and already stored. Raises `ChecksumError` if the download does not
+        match `sha256`.
+        """
+        url = normalize_url(url)
+        with self._lock(url), span("artifact.fetch", url=url) as attrs:
+            digest = sha256 or (None if refresh else self._indexed(url))
+            if digest and (obj := self._stored(digest)) is not None:
+                count("cache_hit.artifact")
+                attrs["cached"] = True
+                return obj
+            count("cache_miss.artifact")
+
+            obj = self._download(url)
+            digest = stored_digest(obj)
+            if sha256 and digest != sha256:
+                raise ChecksumError(
+                    f"Checksum mismatch for {url}: expected {sha256}, got {digest}"
+                )
+            self._index(url, digest)
+            return obj
+
+    def _download(self, url: str) -> Path:
+        tmp = self.store.root / "tmp" / uuid.uuid4().hex
+        tmp.parent.mkdir(parents=True, exist_ok=True)
+        log.info(f"Downloading {url}")
+        try:
+            with (
+                urlopen(url, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response,
+                tmp.open("wb") as f,
+            ):
+                while chunk := response.read(_CHUNK):
+                    f.write(chunk)
+                    count("bytes_fetched", len(chunk))
+            return self.store.add(tmp)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def _stored(self, digest: str) -> Path | None:
+        for executable in (False, True):
+            if (obj := self.store.object_path(digest, executable)).is_file():
+                return obj
+        return None
+
+    def indexed_digests(self) -> set[str]:
+        """Digests of the artifacts that urls served last."""
+        try:
+            paths = list((self.store.root / "urls").iterdir())
+        except FileNotFoundError:
+            return set()
+        return {p.read_text().strip() for p in paths if not p.name.startswith(".")}
+
+    def _index_path(self, url: str) -> Path:
+        return self.store.root / "urls" / hashlib.sha256(url.encode()).hexdigest()
+
+    def _indexed(self, url: str) -> str | None:
+        try:
+            return self._index_path(url).read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _index(self, url: str, digest: str) -> None:
+        path = self._index_path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        tmp.write_text(f"{digest}\n")
+        tmp.replace(path)
+
+    @classmethod
+    def _lock(cls, url: str) -> threading.Lock:
+        with cls._locks_lock:
+            return cls._locks.setdefault(url, threading.Lock())
+
+
+def normalize_url(url: str) -> str:
+    """Urls stay as they are, local paths become `file://` urls."""
+    if urlparse(url).scheme in ("http", "https", "file"):
+        return url
+    return Path(url).expanduser().resolve().as_uri()
+
+
+def artifact_name(url: str) -> str:
+    """File name of the artifact at `url`, e.g. `sling_linux_amd64.tar.gz`."""
+    return Path(urlparse(url).path).name or "artifact"
+
+
+def unpack(artifact: Path, name: str, dst: Path) -> None:
+    """Extract the archive `artifact` into `dst`, or copy it as the executable `name`.
+
+    The type of archive follows from the `name` it was downloaded as.
+    """
+    dst.mkdir(parents=True, exist_ok=True)
+    if name.endswith(_TAR_SUFFIXES):
+        with tarfile.open(artifact) as tar:
+            extract_tar(tar, dst)
+    elif name.endswith(".zip"):
+        with zipfile.ZipFile(artifact) as zf:
+            for info in zf.infolist():
+                path = Path(zf.extract(info, dst))
+                # zipfile drops permissions, executables need their x bit
+                if mode := stat.S_IMODE(info.external_attr >> 16):
+                    path.chmod(mode | stat.S_IWUSR)
+    else:
+        shutil.copyfile(artifact, dst / name)
+        (dst / name).chmod(0o755)
+
+
+def extract_tar(tar: tarfile.TarFile, dst: Path) -> None:
+    """Extract all members of `tar` into `dst`, also from streams (`r|`).
+
+    Raises `ValueError` for members with unsafe paths or special files.
+    """
+    if hasattr(tarfile, "data_filter"):
+        # refuses absolute paths, links out of dst and device files
+        tar.extractall(dst, filter="data")
+    else:  # python < 3.11.4
+        tar.extractall(dst, members=_checked_members(tar))
+
+
+def _checked_members(tar: tarfile.TarFile) -> Iterator[tarfile.TarInfo]:
+    # one at a time, streams can only be read once
+    for member in tar:
+        parts = Path(member.name).parts
+        if Path(member.name).is_absolute() or ".." in parts:
+            raise ValueError(f"Refusing to extract {member.name} from archive")
+        if not (member.isfile() or member.isdir() or member.issym()):
+            raise ValueError(f"Refusing to extract special file {member.name}")
+        yield member
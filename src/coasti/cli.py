@@ -1,11 +1,21 @@
+from pathlib import Path
 from typing import Annotated
 
 import typer
 
-from coasti.logger import log, setup_logging_handler
+from coasti.git.retry import retry_git_network
+from coasti.logger import log, setup_logging_handler, stop_logging
+from coasti.metrics import write_metrics
+from coasti.profiling import CommandProfiler
+from coasti.timing import finish_run, instrument_copier, recorder
 
 from .init import app as init_app
 from .product import app as product_app
+from .run import app as run_app
+from .status import app as status_app
+from .store import app as store_app
+from .tool import app as tool_app
+from .workspace import app as workspace_app
 
 app = typer.Typer()
 
@@ -30,16 +40,87 @@ def main(
             help="Avoid user prompts",
         ),
     ] = False,
+    trace: Annotated[
+        Path | None,
+        typer.Option(
+            "--trace",
+            dir_okay=False,
+            help="Write a trace-event file of this run, for Perfetto or "
+            "chrome://tracing",
+        ),
+    ] = None,
+    metrics_dir: Annotated[
+        Path | None,
+        typer.Option(
+            "--metrics-dir",
+            envvar="COASTI_METRICS_DIR",
+            file_okay=False,
+            help="Write Prometheus metrics of this run to this directory "
+            "(for node_exporter's textfile collector)",
+        ),
+    ] = None,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            "--profile",
+            help="Profile this command with cProfile. Saves a .pstats file to "
+            "logs/coasti/ and prints the top functions",
+        ),
+    ] = False,
+    profile_sample: Annotated[
+        bool,
+        typer.Option(
+            "--profile-sample",
+            help="Profile by sampling the stacks of all threads instead (implies "
+            "--profile)",
+        ),
+    ] = False,
+    profile_out: Annotated[
+        Path | None,
+        typer.Option(
+            "--profile-out",
+            dir_okay=False,
+            help="Where to save the profile (implies --profile)",
+        ),
+    ] = None,
 ):
     """Coasti Installer - Initialize projects and install products."""
     setup_logging_handler(verbose)
+    ctx.call_on_close(stop_logging)
     app.pretty_exceptions_short = False
 
+    # Time the phases of this command, the run log is written when it finishes.
+    recorder.reset(command=ctx.invoked_subcommand)
+    recorder.trace_path = trace
+    instrument_copier()
+    # after the instrumentation, so each attempt is a span
+    retry_git_network()
+    ctx.call_on_close(finish_run)
+    if metrics_dir is not None:
+        ctx.call_on_close(lambda: _write_metrics(metrics_dir))
+
+    if profile or profile_sample or profile_out is not None:
+        profiler = CommandProfiler(
+            mode="sample" if profile_sample else "cprofile", out_path=profile_out
+        )
+        profiler.start()
+        # runs before finish_run (callbacks are called in reverse order)
+        ctx.call_on_close(lambda: profiler.finish(log_dir=recorder.log_dir))
+
     # Store shared state for all subcommands:
     ctx.ensure_object(dict)
     ctx.obj["quiet"] = quiet
 
 
+def _write_metrics(metrics_dir: Path):
+    if recorder.workspace is None:
+        return  # not a workspace command, e.g. `coasti version`
+    try:
+        write_metrics(metrics_dir, recorder)
+    except OSError as e:
+        log.warning(f"Could not write metrics to {str(metrics_dir)}: {e}")
+
+
 @app.command()
 def version():
     """Shows the version of the coasti installer."""
@@ -57,3 +138,8 @@ def get_version():
 
 app.add_typer(init_app)  # only one command so far
 app.add_typer(product_app, name="product", help="List, add or update products.")
+app.add_typer(status_app)
+app.add_typer(run_app)
+app.add_typer(tool_app, name="tool", help="List, add or update tools.")
+app.add_typer(store_app, name="store", help="Manage the shared file store.")
+app.add_typer(workspace_app, name="workspace", help="Inspect the coasti directory.")
@@ -1,6 +1,9 @@
+import os
 import sys
+import threading
 from collections.abc import Iterator
 from contextlib import contextmanager
+from contextvars import ContextVar
 from importlib import resources
 from pathlib import Path
 from typing import Any
@@ -10,25 +13,42 @@ from plumbum.commands.processes import ProcessExecutionError, ProcessTimedOut
 
 from coasti.logger import log
 
+from .credentials import (
+    CredentialStore,
+    credential_host,
+    credential_server,
+    socket_enabled,
+)
+from .ssh import ssh_command
+
+# env for git commands of copier, set per thread (product) by copier_git_injection
+_git_env: ContextVar[dict[str, Any]] = ContextVar("coasti_git_env", default={})
+_git_patched = False
+_git_patch_lock = threading.Lock()
+
 
 @contextmanager
 def copier_git_injection(
     *,
     https_token: str | None = None,
     ssh_key_path: str | Path | None = None,
+    repo_url: str | None = None,
 ) -> Iterator[None]:
     """
     Inject auth settings into all git commands executed by Copier.
 
-    - https_token: used for HTTPS clones/fetches via GIT_ASKPASS.
+    - https_token: used for HTTPS clones/fetches, served from memory by
+      `coasti.git.credentials` (or via GIT_ASKPASS, where that is not used).
     - ssh_key_path: absolute path to an SSH private key to force for SSH clones/fetches.
+    - repo_url: the repo to authenticate at, the token is only sent to its host.
 
-    We monkeypatch copiers get_git() command to keep env vars in a small scope.
+    We monkeypatch copiers get_git() command once, it reads the env from a
+    context variable, so concurrent installs (threads) keep their own auth.
 
     Example
     ```
-    with copier_git_injection(https_token=vcs_auth_token):
-        can_access_git_repo(repo_ulr)
+    with copier_git_injection(https_token=vcs_auth_token, repo_url=repo_url):
+        can_access_git_repo(repo_url)
     ```
     """
     if ssh_key_path is not None and https_token is not None:
@@ -37,53 +57,80 @@ def copier_git_injection(
     if ssh_key_path is not None and not Path(ssh_key_path).is_absolute():
         raise ValueError("ssh_key_path must be an absolute path")
 
-    original_get_git = copier_vcs.get_git
-
+    _patch_get_git()
+
+    extra_env: dict[str, Any] = {}
+    # token served by coasti.git.credentials, until the context exits
+    credential: tuple[CredentialStore, str] | None = None
+
+    if https_token and socket_enabled():
+        server = credential_server()
+        host = credential_host(repo_url) if repo_url else None
+        credential = server.store, server.store.register(https_token, host)
+        extra_env.update(server.git_env(credential[1]))
+        extra_env["GIT_TERMINAL_PROMPT"] = "0"
+        extra_env["GCM_INTERACTIVE"] = "false"
+
+    elif https_token:
+        with resources.as_file(
+            resources.files("coasti.git").joinpath(
+                "askpass" + (".bat" if sys.platform == "win32" else ".sh")
+            )
+        ) as askpass_script:
+            extra_env["GIT_ASKPASS"] = str(askpass_script)
+            # scripts simply return the token env var
+
+        extra_env["GIT_AUTH_TOKEN"] = https_token
+
+        # Some git flows require the following to force askpass in non-tty contexts,
+        # or gui popups (git-for-windows)
+        extra_env["GIT_TERMINAL_PROMPT"] = "0"
+        extra_env["GCM_INTERACTIVE"] = "false"
+
+    elif ssh_key_path:
+        if Path(ssh_key_path).is_file():
+            # reuses connections to the same host, see coasti.git.ssh
+            extra_env["GIT_SSH_COMMAND"] = ssh_command(ssh_key_path)
+        else:
+            # avoid Prompt injection, skip ssh overwrite
+            log.warning(f"'{ssh_key_path}' is not a valid path for an ssh key.")
+
+    token = _git_env.set(extra_env)
     try:
-        extra_env: dict[str, Any] = {}
-
-        if https_token:
-            with resources.as_file(
-                resources.files("coasti.git").joinpath(
-                    "askpass" + (".bat" if sys.platform == "win32" else ".sh")
-                )
-            ) as askpass_script:
-                extra_env["GIT_ASKPASS"] = str(askpass_script)
-                # scripts simply return the token env var
-
-            extra_env["GIT_AUTH_TOKEN"] = https_token
-
-            # Some git flows require the following to force askpass in non-tty contexts,
-            # or gui popups (git-for-windows)
-            extra_env["GIT_TERMINAL_PROMPT"] = "0"
-            extra_env["GCM_INTERACTIVE"] = "false"
-
-        elif ssh_key_path:
-            if Path(ssh_key_path).is_file():
-                extra_env["GIT_SSH_COMMAND"] = (
-                    f"ssh -i {ssh_key_path} -o IdentitiesOnly=yes"
-                )
-            else:
-                # avoid Prompt injection, skip ssh overwrite
-                log.warning(f"'{ssh_key_path}' is not a valid path for an ssh key.")
+        yield
+    finally:
+        _git_env.reset(token)
+        if credential is not None:
+            store, label = credential
+            store.release(label)
+
+
+def _patch_get_git() -> None:
+    """Make copier's get_git() add the env of the current copier_git_injection."""
+    global _git_patched
+    with _git_patch_lock:
+        if _git_patched:
+            return
+        original_get_git = copier_vcs.get_git
 
         def patched_get_git(*args, **kwargs):
-            git = original_get_git()
+            git = original_get_git(*args, **kwargs)
             # Attach env to the command object.
             # (Plumbum supports cmd.with_env(VAR=...))
-            cmd = git.with_env(**extra_env) if extra_env else git
-            return cmd
+            extra_env = _git_env.get()
+            return git.with_env(**extra_env) if extra_env else git
 
         copier_vcs.get_git = patched_get_git
-        yield
-    finally:
-        copier_vcs.get_git = original_get_git
+        _git_patched = True
 
 
-def can_access_git_repo(repo_url: str, *, timeout_seconds: float = 15) -> bool:
+def can_access_git_repo(repo_url: str, *, timeout_seconds: float | None = None) -> bool:
     """
     Probe if we can reach a repo using Copier's git command.
 
+    Transient failures are retried (`coasti.git.retry`) within `timeout_seconds`,
+    by default `COASTI_GIT_PROBE_TIMEOUT` (30 seconds).
+
     This is a *non-authenticated* probe:
     - no tokens
     - no ssh key overrides
@@ -92,11 +139,14 @@ def can_access_git_repo(repo_url: str, *, timeout_seconds: float = 15) -> bool:
     Implementation: `git ls-remote <repo_url> -q`
     """
 
+    if timeout_seconds is None:
+        timeout_seconds = float(os.getenv("COASTI_GIT_PROBE_TIMEOUT", 30))
+
     cmd = copier_vcs.get_git()["ls-remote", str(repo_url), "-q"]
     try:
         _code, _stdout, _stderr = cmd.run(timeout=timeout_seconds)
         return True
-    except ProcessTimedOut:
+    except (ProcessTimedOut, TimeoutError):
         log.debug(
             f"Git repo access check timed out after {timeout_seconds}: {repo_url}"
         )
@@ -0,0 +1,185 @@
+"""
+Templates from a snapshot archive, instead of a git clone.
+
+A product that is pinned to a tag or commit sha does not need the history of
+its template. With `transport: archive` in products.yml, its install downloads
+the archive of that ref over HTTP(S) (one compressed stream, no packfile
+negotiation), extracts it while it arrives, and copier renders from the
+extracted dir:
+
+- GitHub (`github.com`): `api.github.com/repos/<repo>/tarball/<ref>`
+- any other host is taken for GitLab:
+  `<host>/api/v4/projects/<repo>/repository/archive.tar.gz?sha=<ref>`
+
+The product's token goes into an auth header, which is not sent on to the
+hosts that these endpoints redirect to.
+
+Copier's answers file then names the repo and ref, as after a clone
+(`record_source`), so updates work as usual (with git). Branches, SSH urls
+and failed downloads fall back to the clone.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+from http.client import HTTPResponse
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import quote, urlsplit
+from urllib.request import Request, urlopen
+
+import copier._vcs as copier_vcs
+from plumbum.commands.processes import ProcessExecutionError, ProcessTimedOut
+from ruamel.yaml import YAML
+
+from coasti.artifacts import extract_tar
+from coasti.logger import log
+from coasti.timing import count, span
+
+from .limits import network_limiter
+
+if TYPE_CHECKING:
+    from _typeshed import WriteableBuffer
+
+DOWNLOAD_TIMEOUT_SECONDS = 60
+
+_SHA_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+
+
+def archive_url(repo_url: str, ref: str) -> str:
+    """Url of the tar.gz archive of `repo_url` (GitHub or GitLab) at `ref`.
+
+    Raises `ValueError` for repos that are not served over HTTP(S).
+    """
+    parts = urlsplit(repo_url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"No archive for {repo_url}, not an HTTP(S) url")
+    path = parts.path.strip("/").removesuffix(".git")
+    if parts.hostname == "github.com":
+        return f"https://api.github.com/repos/{path}/tarball/{quote(ref, safe='')}"
+    # without user info, the token goes into a header
+    host = parts.netloc.rpartition("@")[2]
+    return (
+        f"{parts.scheme}://{host}/api/v4/projects/{quote(path, safe='')}"
+        f"/repository/archive.tar.gz?sha={quote(ref, safe='')}"
+    )
+
+
+def pinned_ref(repo_url: str, vcs_ref: str) -> str | None:
+    """`vcs_ref` if it always names the same commit (a sha or tag), else None."""
+    if _SHA_PATTERN.match(vcs_ref):
+        return vcs_ref
+    output = copier_vcs.get_git()("ls-remote", repo_url, vcs_ref)
+    names = {line.partition("\t")[2] for line in output.splitlines()}
+    if f"refs/tags/{vcs_ref}" in names and f"refs/heads/{vcs_ref}" not in names:
+        return vcs_ref
+    return None
+
+
+@contextmanager
+def template_snapshot(
+    repo_url: str, vcs_ref: str, token: str | None = None
+) -> Iterator[tuple[Path, str] | None]:
+    """The extracted archive of `repo_url` at `vcs_ref`, and the pinned ref.
+
+    Yields None if the template has to be cloned instead. The snapshot is
+    removed on exit.
+    """
+    try:
+        ref = pinned_ref(repo_url, vcs_ref)
+    except (ProcessExecutionError, ProcessTimedOut, TimeoutError) as e:
+        log.warning(f"Could not resolve {vcs_ref} of {repo_url}, cloning: {e}")
+        ref = None
+    if ref is None:
+        log.info(f"{vcs_ref} of {repo_url} is not a tag or sha, cloning")
+        yield None
+        return
+
+    tmp = Path(tempfile.mkdtemp(prefix="coasti-archive-"))
+    try:
+        snapshot: tuple[Path, str] | None = None
+        try:
+            snapshot = fetch_archive(repo_url, ref, tmp, token), ref
+        except (OSError, ValueError, tarfile.TarError) as e:
+            log.warning(f"Could not download {repo_url} at {ref}, cloning: {e}")
+        yield snapshot
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def fetch_archive(
+    repo_url: str, ref: str, dst_path: Path, token: str | None = None
+) -> Path:
+    """Download and extract the archive of `repo_url` at `ref` into `dst_path`.
+
+    Returns the root of the template, the one dir that archives wrap it in.
+    """
+    url = archive_url(repo_url, ref)
+    request = Request(url)
+    if token and urlsplit(repo_url).hostname == "github.com":
+        request.add_unredirected_header("Authorization", f"Bearer {token}")
+    elif token:
+        request.add_unredirected_header("Private-Token", token)
+
+    host = urlsplit(url).hostname or ""
+    with (
+        network_limiter().slot(host, "archive"),
+        span("archive.fetch", host=host, ref=ref),
+        urlopen(request, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response,
+    ):
+        log.info(f"Downloading the archive of {repo_url} at {ref}")
+        stream = _CountingReader(response)
+        # extract while downloading, "r|" reads the stream once, in order
+        with tarfile.open(fileobj=stream, mode="r|gz") as archive:
+            extract_tar(archive, dst_path)
+
+    entries = list(dst_path.iterdir())
+    if len(entries) == 1 and entries[0].is_dir():
+        return entries[0]
+    return dst_path
+
+
+def snapshot_files(root: Path) -> list[str]:
+    """Paths of all files below `root`, like `git ls-tree -r --name-only`."""
+    return sorted(
+        (Path(parent) / name).relative_to(root).as_posix()
+        for parent, _, names in os.walk(root)
+        for name in names
+    )
+
+
+def record_source(answers_path: Path, repo_url: str, ref: str) -> None:
+    """Make copier's answers file name the repo and ref, instead of the snapshot.
+
+    Copier wrote the path of the snapshot dir, and no commit.
+    """
+    yaml = YAML()
+    answers = yaml.load(answers_path)
+    answers.pop("_commit", None)
+    answers["_src_path"] = repo_url
+    answers.insert(0, "_commit", ref)
+    with answers_path.open("w") as f:
+        yaml.dump(answers, f)
+
+
+class _CountingReader(io.RawIOBase):
+    """Counts the bytes read from a response, as `bytes_fetched`."""
+
+    def __init__(self, response: HTTPResponse) -> None:
+        super().__init__()
+        self._response = response
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: WriteableBuffer) -> int:
+        n = self._response.readinto(buffer)
+        count("bytes_fetched", n)
+        return n
@@ -0,0 +1,210 @@
+"""
+Tokens for git over HTTP(S), served from memory.
+
+Products that authenticate with a token register it here for as long as their
+git commands run (`copier_git_injection`). A server thread of coasti answers
+git's credential requests over a unix socket in a private (0700) temp dir, so
+the token is not put into the environment of git (and every process it
+starts), and no shell script runs per credential prompt.
+
+Git talks to the socket with its built-in `credential-cache` helper, whose
+protocol this server speaks. The git config for that comes from the
+environment (`GIT_CONFIG_COUNT`, git 2.31+), per git command:
+
+- `credential.helper` is reset, then set to `cache --socket=<socket>`, so the
+  user's helpers neither answer nor store product tokens
+- `credential.username` is the label of the registered token
+
+A token is only served to the host of the product's repo (any host, if that is
+not known), products with the same token and host share one entry, looked up
+once per git command. Store and
+erase requests of git are ignored, entries go away with the last product that
+uses them.
+
+Set `COASTI_GIT_CREDENTIAL_SOCKET=0` to use the askpass script with the token
+in `GIT_AUTH_TOKEN` instead. Not used on Windows.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import secrets
+import shlex
+import shutil
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from coasti.logger import log
+from coasti.timing import count
+
+_server: CredentialServer | None = None
+_server_lock = threading.Lock()
+
+
+@dataclass
+class _Entry:
+    token: str
+    host: str | None
+    users: int = 0
+
+
+class CredentialStore:
+    """Thread-safe tokens by label, each for one host (or any)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: dict[str, _Entry] = {}
+
+    def register(self, token: str, host: str | None = None) -> str:
+        """Label under which `token` is served to `host`, until `release`d."""
+        with self._lock:
+            label = next(
+                (
+                    label
+                    for label, e in self._entries.items()
+                    if e.token == token and e.host == host
+                ),
+                None,
+            )
+            if label is None:
+                label = f"coasti-{secrets.token_hex(8)}"
+                self._entries[label] = _Entry(token, host)
+            self._entries[label].users += 1
+            return label
+
+    def release(self, label: str) -> None:
+        with self._lock:
+            entry = self._entries[label]
+            entry.users -= 1
+            if not entry.users:
+                del self._entries[label]
+
+    def lookup(self, label: str, host: str | None) -> str | None:
+        """The token of `label` for `host`.
+
+        Urls with a user name override the label, their token is found by host,
+        if only one is registered for it.
+        """
+        with self._lock:
+            if (entry := self._entries.get(label)) is not None:
+                return entry.token if entry.host in (None, host) else None
+            tokens = {e.token for e in self._entries.values() if e.host == host}
+        return tokens.pop() if len(tokens) == 1 else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: _UnixServer
+
+    def handle(self) -> None:
+        # `action=...` and `timeout=...`, then git's credential lines, then EOF
+        request: dict[str, str] = {}
+        for line in self.rfile.read().decode().splitlines():
+            key, sep, value = line.partition("=")
+            if sep:
+                request.setdefault(key, value)
+        if request.get("action") != "get":
+            return
+        token = self.server.store.lookup(
+            request.get("username", ""), request.get("host", "").lower()
+        )
+        if token is None:
+            return
+        count("git_credential_lookups")
+        # like the askpass script, which answered both prompts with the token
+        self.wfile.write(f"username={token}\npassword={token}\n".encode())
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    store: CredentialStore
+
+
+class CredentialServer:
+    """A `CredentialStore`, served on a unix socket by a daemon thread."""
+
+    def __init__(self) -> None:
+        self.store = CredentialStore()
+        # socket paths are limited to ~100 bytes, keep the dir short
+        base = "/tmp" if Path("/tmp").is_dir() else None
+        self._dir = Path(tempfile.mkdtemp(prefix="coasti-git-", dir=base))
+        self.socket_path = self._dir / "credentials"
+        self._server = _UnixServer(str(self.socket_path), _Handler)
+        self._server.store = self.store
+        threading.Thread(
+            target=self._server.serve_forever,
+            name="coasti-git-credentials",
+            daemon=True,
+        ).start()
+        log.debug(f"Serving git credentials on {str(self.socket_path)}")
+
+    def git_env(self, label: str) -> dict[str, str]:
+        """Env for git commands, to get the token registered as `label`."""
+        helper = f"cache --socket={shlex.quote(str(self.socket_path))}"
+        return _git_config_env(
+            [
+                ("credential.helper", ""),
+                ("credential.helper", helper),
+                ("credential.username", label),
+            ]
+        )
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+def socket_enabled() -> bool:
+    return (
+        sys.platform != "win32"
+        and hasattr(socket, "AF_UNIX")
+        and os.getenv("COASTI_GIT_CREDENTIAL_SOCKET", "1") != "0"
+    )
+
+
+def credential_server() -> CredentialServer:
+    """The server of this process, started on first use."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = CredentialServer()
+        return _server
+
+
+def close_server() -> None:
+    """Stop the server of this process, forgetting all tokens."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            _server.close()
+            _server = None
+
+
+def credential_host(repo_url: str) -> str | None:
+    """Host (and port) of `repo_url`, as git sends it in credential requests."""
+    netloc = urlsplit(repo_url).netloc.rpartition("@")[2]
+    return netloc.lower() or None
+
+
+def _git_config_env(entries: list[tuple[str, str]]) -> dict[str, str]:
+    """`GIT_CONFIG_*` env vars that add `entries`, after those already set."""
+    start = int(os.getenv("GIT_CONFIG_COUNT", "0") or 0)
+    env = {"GIT_CONFIG_COUNT": str(start + len(entries))}
+    for i, (key, value) in enumerate(entries, start):
+        env[f"GIT_CONFIG_KEY_{i}"] = key
+        env[f"GIT_CONFIG_VALUE_{i}"] = value
+    return env
+
+
+atexit.register(close_server)
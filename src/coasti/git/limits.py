@@ -0,0 +1,195 @@
+"""
+Limits on concurrent git network operations (clone, fetch, ls-remote).
+
+Parallel installs should not open dozens of connections to one (self-hosted)
+server at once. Each operation takes a slot before it runs:
+
+- at most `COASTI_GIT_MAX_PER_HOST` at a time per host of the repo url
+- at most `COASTI_GIT_MAX_CONNECTIONS` at a time in total
+
+Waiting operations start by priority, then in the order they arrived. An
+operation only waits for one of higher priority if that one could start
+(its host has a free slot), so a busy host never holds back others, and all
+slots are used whenever there is work for them.
+
+Priorities come from the git subcommand, `COASTI_GIT_PRIORITIES` lists them
+first to last (default `ls-remote,fetch,clone`: probes, then the small fetches
+of template questions, then clones).
+
+Archive downloads (`coasti.git.archive`) take slots too, with the priority of
+`archive`. Local repos (paths, `file://`) are not limited. Each retry of an operation
+takes a new slot, backoff does not hold one.
+
+Operations that had to wait count `git_queue_waits.<host>` and
+`git_queue_wait_ms.<host>`, and show up as `git.queue` spans.
+"""
+
+from __future__ import annotations
+
+import itertools
+import os
+import re
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from coasti.logger import log
+from coasti.timing import count, span
+
+DEFAULT_MAX_CONNECTIONS = 16
+DEFAULT_MAX_PER_HOST = 4
+DEFAULT_PRIORITIES = ("ls_remote", "fetch", "clone")
+
+# `[user@]host:path`, but not `C:\path` or `./a:b`
+_SCP_LIKE = re.compile(r"^(?:[^@/:]+@)?(?P<host>[^/:\\]{2,}):(?!//)")
+
+_limiter: NetworkLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+class QueueTimeoutError(TimeoutError):
+    pass
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    host: str = field(compare=False)
+
+
+class NetworkLimiter:
+    """Priority-ordered slots for network operations, per host and in total."""
+
+    def __init__(
+        self,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_per_host: int = DEFAULT_MAX_PER_HOST,
+        priorities: tuple[str, ...] = DEFAULT_PRIORITIES,
+    ) -> None:
+        if max_connections < 1 or max_per_host < 1:
+            raise ValueError("Git connection limits must be at least 1")
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.priorities = priorities
+        self._cond = threading.Condition()
+        self._running: Counter[str] = Counter()
+        self._waiting: list[_Waiter] = []
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_env(cls) -> NetworkLimiter:
+        listed = os.getenv("COASTI_GIT_PRIORITIES", "").split(",")
+        priorities = tuple(p.strip().replace("-", "_") for p in listed if p.strip())
+        return cls(
+            max_connections=int(
+                os.getenv("COASTI_GIT_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)
+            ),
+            max_per_host=int(
+                os.getenv("COASTI_GIT_MAX_PER_HOST", DEFAULT_MAX_PER_HOST)
+            ),
+            priorities=priorities or DEFAULT_PRIORITIES,
+        )
+
+    def priority(self, subcommand: str) -> int:
+        """Rank of `subcommand`, lower starts first. Unlisted ones go last."""
+        try:
+            return self.priorities.index(subcommand)
+        except ValueError:
+            return len(self.priorities)
+
+    @property
+    def running(self) -> int:
+        with self._cond:
+            return self._running.total()
+
+    @property
+    def queued(self) -> int:
+        with self._cond:
+            return len(self._waiting)
+
+    @contextmanager
+    def slot(
+        self, host: str, subcommand: str, timeout: float | None = None
+    ) -> Iterator[float]:
+        """Hold a slot for an operation on `host`, yields the seconds it waited.
+
+        Raises `QueueTimeoutError` if none is free within `timeout`.
+        """
+        waiter = _Waiter(self.priority(subcommand), next(self._seq), host)
+        with self._cond:
+            if self._can_start(waiter):
+                self._running[host] += 1
+                waited = None
+            else:
+                waited = self._wait(waiter, subcommand, timeout)
+        try:
+            yield waited or 0.0
+        finally:
+            with self._cond:
+                self._running[host] -= 1
+                if not self._running[host]:
+                    del self._running[host]
+                self._cond.notify_all()
+
+    def _wait(self, waiter: _Waiter, subcommand: str, timeout: float | None) -> float:
+        # called with self._cond held
+        host = waiter.host
+        deadline = None if timeout is None else time.monotonic() + timeout
+        t0 = time.monotonic()
+        self._waiting.append(waiter)
+        try:
+            with span("git.queue", host=host, subcommand=subcommand):
+                while not self._can_start(waiter):
+                    left = None if deadline is None else deadline - time.monotonic()
+                    if left is not None and left <= 0:
+                        raise QueueTimeoutError(
+                            f"No free git connection to {host} within {timeout:.0f}s"
+                        )
+                    self._cond.wait(left)
+        finally:
+            self._waiting.remove(waiter)
+            # others might have waited behind this one
+            self._cond.notify_all()
+        self._running[host] += 1
+        waited = time.monotonic() - t0
+        count(f"git_queue_waits.{host}")
+        count(f"git_queue_wait_ms.{host}", round(waited * 1000))
+        log.debug(f"git {subcommand.replace('_', '-')} waited {waited:.1f}s for {host}")
+        return waited
+
+    def _can_start(self, waiter: _Waiter) -> bool:
+        if self._running.total() >= self.max_connections:
+            return False
+        if self._running[waiter.host] >= self.max_per_host:
+            return False
+        # earlier waiters go first, unless their host is busy
+        return not any(
+            other < waiter and self._running[other.host] < self.max_per_host
+            for other in self._waiting
+        )
+
+
+def network_limiter() -> NetworkLimiter:
+    """The limiter of this process, configured from the environment on first use."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = NetworkLimiter.from_env()
+        return _limiter
+
+
+def repo_host(url: str) -> str | None:
+    """Host of the remote repo at `url`, None for local repos."""
+    if "://" in url:
+        parts = urlsplit(url)
+        if parts.scheme == "file":
+            return None
+        return (parts.hostname or "").lower() or None
+    if match := _SCP_LIKE.match(url):
+        return match.group("host").lower()
+    return None
@@ -0,0 +1,284 @@
+"""
+Retries of git network operations (clone, fetch, ls-remote).
+
+A transient failure (DNS, a dropped connection, a timeout, a 5xx from the
+server) is retried with exponential backoff and full jitter, so concurrent
+installs do not retry in lockstep. Errors that would fail again (auth, a
+missing repo or ref) are raised right away.
+
+Time is bounded twice:
+
+- per operation: all attempts of one git command, `COASTI_GIT_TIMEOUT` (if set)
+- per batch: `batch_budget()`, e.g. `product install --budget`; operations
+  are not retried after the batch's deadline, and get at most its remaining time
+
+`retry_git_network()` patches plumbum's `BaseCommand.run` once per process,
+similar to `instrument_copier`, so copier's git commands are retried too. Each
+attempt waits for a connection slot to its host first (`coasti.git.limits`).
+
+Settings (environment):
+
+- `COASTI_GIT_RETRIES` (default 3), retries after the first attempt
+- `COASTI_GIT_TIMEOUT` (default: none), seconds per operation, all attempts
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import re
+import shutil
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, TypeVar, cast
+
+from plumbum import local
+from plumbum.commands.processes import ProcessExecutionError, ProcessTimedOut
+
+from coasti.logger import log
+from coasti.timing import _git_subcommand, count
+
+from .limits import network_limiter, repo_host
+
+T = TypeVar("T")
+
+NETWORK_SUBCOMMANDS = {"clone", "fetch", "ls_remote"}
+
+# options of `git clone` that take a separate value
+_CLONE_OPTIONS_WITH_VALUE = {
+    "-b", "--branch", "-o", "--origin", "-c", "--config", "-u", "--upload-pack",
+    "--depth", "--reference", "--template", "--separate-git-dir", "-j", "--jobs",
+}  # fmt: skip
+
+# `git fetch origin`, a remote of the repo instead of a url
+_REMOTE_NAME = re.compile(r"^[\w.-]+$")
+
+# failures that will not go away by trying again
+_FATAL = re.compile(
+    r"authentication failed|could not read (username|password)"
+    r"|terminal prompts disabled|permission denied|host key verification failed"
+    r"|repository .* not found|not found|does not appear to be a git repository"
+    r"|couldn't find remote ref|invalid username or password"
+    r"|certificate|returned error: 40[0-9]",
+    re.IGNORECASE,
+)
+# failures of the network or the server
+_TRANSIENT = re.compile(
+    r"could not resolve host|temporary failure in name resolution"
+    r"|connection (refused|reset)|failed to connect|couldn't connect to server"
+    r"|timed out|early eof|rpc failed"
+    r"|remote end hung up|unexpected disconnect|gnutls|ssl_read|tls"
+    r"|network is unreachable|no route to host"
+    r"|returned error: (5[0-9][0-9]|429)|http/2 stream",
+    re.IGNORECASE,
+)
+
+# end of the current batch (time.monotonic()), None if unbounded
+_batch_deadline: float | None = None
+_patched = False
+_patch_lock = threading.Lock()
+
+
+class BudgetExceededError(TimeoutError):
+    pass
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    retries: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    # seconds for all attempts of one operation, None for no limit
+    timeout: float | None = None
+
+    @classmethod
+    def from_env(cls) -> RetryPolicy:
+        timeout = os.getenv("COASTI_GIT_TIMEOUT")
+        return cls(
+            retries=int(os.getenv("COASTI_GIT_RETRIES", cls.retries)),
+            timeout=float(timeout) if timeout else None,
+        )
+
+    def delay(self, retry: int) -> float:
+        """Seconds to wait before `retry` (0 based), with full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed git command might succeed when run again."""
+    if isinstance(error, ProcessTimedOut):
+        return True
+    if not isinstance(error, ProcessExecutionError):
+        return False
+    stderr = error.stderr or ""
+    return _FATAL.search(stderr) is None and _TRANSIENT.search(stderr) is not None
+
+
+def with_retries(
+    run: Callable[[float | None], T],
+    name: str,
+    policy: RetryPolicy | None = None,
+    timeout: float | None = None,
+) -> T:
+    """Call `run(timeout)` until it succeeds, fails for good or time is up.
+
+    `timeout` bounds all attempts, in addition to the policy's and the batch's
+    budget. `run` gets the seconds left for its attempt.
+    """
+    policy = policy or RetryPolicy.from_env()
+    now = time.monotonic()
+    deadlines = [now + t for t in (timeout, policy.timeout) if t]
+    if _batch_deadline is not None:
+        deadlines.append(_batch_deadline)
+    deadline = min(deadlines, default=None)
+
+    retry = 0
+    while True:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise BudgetExceededError(f"No time left for {name}")
+        try:
+            return run(remaining)
+        except (ProcessExecutionError, ProcessTimedOut) as e:
+            if retry >= policy.retries or not is_transient(e):
+                raise
+            delay = policy.delay(retry)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            retry += 1
+            count("git_retries")
+            log.warning(
+                f"{name} failed ({_reason(e)}), retrying in {delay:.1f}s "
+                f"({retry}/{policy.retries})"
+            )
+            time.sleep(delay)
+
+
+@contextmanager
+def batch_budget(seconds: float | None) -> Iterator[None]:
+    """Bound the git operations of a batch to `seconds`, from now."""
+    global _batch_deadline
+    previous = _batch_deadline
+    if seconds is not None:
+        _batch_deadline = time.monotonic() + seconds
+    try:
+        yield
+    finally:
+        _batch_deadline = previous
+
+
+def batch_time_left() -> float | None:
+    """Seconds left of the current batch's budget, None if unbounded."""
+    if _batch_deadline is None:
+        return None
+    return _batch_deadline - time.monotonic()
+
+
+def retry_git_network() -> None:
+    """Retry clone, fetch and ls-remote run through plumbum (copier and coasti)."""
+    global _patched
+    with _patch_lock:
+        if _patched:
+            return
+
+        from plumbum.commands.base import BaseCommand
+
+        original_run = BaseCommand.run
+
+        def run_with_retries(self, args=(), **kwargs):
+            argv = [str(a) for a in self.formulate(args=args)]
+            if not argv or Path(argv[0]).stem != "git":
+                return original_run(self, args, **kwargs)
+            subcommand = _git_subcommand(argv)
+            if subcommand not in NETWORK_SUBCOMMANDS:
+                return original_run(self, args, **kwargs)
+
+            clone_dst = _clone_destination(argv) if subcommand == "clone" else None
+            # copier clones into a fresh temp dir, git refuses non-empty ones
+            clean_clone_dst = clone_dst is not None and not (
+                clone_dst.is_dir() and any(clone_dst.iterdir())
+            )
+            url = _remote_url(argv, subcommand)
+            if url is not None and _REMOTE_NAME.match(url):
+                url = _remote_get_url(argv, subcommand, url, kwargs.get("cwd"))
+            host = repo_host(url) if url is not None else None
+            attempts = 0
+
+            def attempt(remaining: float | None) -> Any:
+                nonlocal attempts
+                if attempts and clean_clone_dst:
+                    # a failed clone leaves a partial repo behind
+                    _empty_dir(cast(Path, clone_dst))
+                attempts += 1
+                if host is None:
+                    return original_run(self, args, **{**kwargs, "timeout": remaining})
+                limiter = network_limiter()
+                with limiter.slot(host, subcommand, remaining) as waited:
+                    if remaining is not None:
+                        # plumbum takes a timeout of 0 as none
+                        remaining = max(remaining - waited, 0.001)
+                    return original_run(self, args, **{**kwargs, "timeout": remaining})
+
+            name = f"git {subcommand.replace('_', '-')}"
+            return with_retries(attempt, name, timeout=kwargs.get("timeout"))
+
+        BaseCommand.run = run_with_retries  # type: ignore[method-assign]
+        _patched = True
+
+
+def _remote_url(argv: list[str], subcommand: str) -> str | None:
+    """The repo url of `git <subcommand> [options] <url> ...`."""
+    args = iter(argv[argv.index(subcommand.replace("_", "-")) + 1 :])
+    for arg in args:
+        if arg in _CLONE_OPTIONS_WITH_VALUE:
+            next(args, None)
+        elif not arg.startswith("-"):
+            return arg
+    return None
+
+
+def _remote_get_url(
+    argv: list[str], subcommand: str, remote: str, cwd: str | None
+) -> str:
+    """The url of `remote` in the repo that `argv` runs in, else `remote`."""
+    # keep options like `-C <repo>` before the subcommand
+    options = argv[1 : argv.index(subcommand.replace("_", "-"))]
+    get_url = local[argv[0]][(*options, "remote", "get-url", remote)]
+    code, stdout, _ = get_url.run(retcode=None, cwd=cwd)
+    return stdout.strip() if code == 0 else remote
+
+
+def _clone_destination(argv: list[str]) -> Path | None:
+    """The directory `git clone <url> <dir>` clones into, if given."""
+    positional: list[str] = []
+    args = iter(argv[argv.index("clone") + 1 :])
+    for arg in args:
+        if arg in _CLONE_OPTIONS_WITH_VALUE:
+            next(args, None)
+        elif not arg.startswith("-"):
+            positional.append(arg)
+    if len(positional) != 2:
+        return None
+    return Path(str(local.cwd), positional[1])
+
+
+def _empty_dir(path: Path) -> None:
+    if not path.is_dir():
+        return
+    for entry in path.iterdir():
+        if entry.is_dir() and not entry.is_symlink():
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            entry.unlink(missing_ok=True)
+
+
+def _reason(error: BaseException) -> str:
+    if isinstance(error, ProcessTimedOut):
+        return "timed out"
+    stderr = getattr(error, "stderr", "") or ""
+    match = _TRANSIENT.search(stderr)
+    return match.group(0) if match else type(error).__name__
@@ -0,0 +1,137 @@
+"""
+Cheap access to a template's questions, without cloning the whole repo.
+
+Copier needs a full clone of a template to read its `copier.yml`. To show the
+first prompt quickly, we only fetch the commit (blobless, depth 1) and check out
+`copier.yml` and the files it `!include`s. The result is cached by commit sha, so
+asking the same questions twice does not touch the network beyond `ls-remote`.
+
+The full clone still happens at install time, where copier does it anyway.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import shutil
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+
+import copier._vcs as copier_vcs
+from platformdirs import user_cache_dir
+
+from coasti.logger import log
+from coasti.timing import count
+
+CONFIG_FILENAMES = ("copier.yml", "copier.yaml")
+
+_SHA_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+_INCLUDE_PATTERN = re.compile(r"!include\s+['\"]?([^'\"\s#]+)")
+
+
+def fetch_template_metadata(repo_url: str, vcs_ref: str | None = None) -> Path:
+    """
+    Get a local directory holding only the copier config of a template repo.
+
+    Fetches `copier.yml` (and its `!include` files) at `vcs_ref` and caches them
+    by commit sha. The returned directory can be used as copier `src_path` to
+    read the questions.
+
+    Git commands go through copier's `get_git()`, so they respect
+    `copier_git_injection`.
+    """
+    sha = resolve_ref(repo_url, vcs_ref)
+    if sha is not None and (target := _metadata_cache_dir() / sha).is_dir():
+        log.debug(f"Using cached template metadata for {repo_url} at {sha}")
+        count("cache_hit.template_metadata")
+        return target
+    count("cache_miss.template_metadata")
+
+    repo_dir = _fetch_blobless(repo_url, sha or vcs_ref or "HEAD")
+    git = copier_vcs.get_git(repo_dir)
+    sha = git("rev-parse", "FETCH_HEAD").strip()
+
+    target = _metadata_cache_dir() / sha
+    if target.is_dir():
+        return target
+
+    log.debug(f"Extracting template metadata of {repo_url} at {sha}")
+    files = git("ls-tree", "-r", "--name-only", sha).splitlines()
+    tmp_target = target.with_name(f"{sha}.tmp")
+    if tmp_target.exists():
+        shutil.rmtree(tmp_target)
+    for path in _config_with_includes(files, git, sha):
+        dst = tmp_target / path
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        dst.write_text(git("show", f"{sha}:{path}"))
+
+    # rename last, so a crashed extraction never looks like a complete cache entry
+    tmp_target.rename(target)
+    return target
+
+
+def resolve_ref(repo_url: str, vcs_ref: str | None = None) -> str | None:
+    """
+    Resolve a branch, tag or HEAD to a commit sha via `git ls-remote`.
+
+    Returns None if the ref is not advertised by the remote (e.g. short shas).
+    """
+    if vcs_ref is not None and _SHA_PATTERN.match(vcs_ref):
+        return vcs_ref
+
+    ref = vcs_ref or "HEAD"
+    output = copier_vcs.get_git()("ls-remote", repo_url, ref, f"{ref}^{{}}")
+    resolved: dict[str, str] = {}
+    for line in output.splitlines():
+        sha, _, name = line.partition("\t")
+        resolved[name] = sha
+
+    # annotated tags are advertised twice, the peeled one points to the commit
+    for name in (f"refs/tags/{ref}^{{}}", f"refs/heads/{ref}", f"refs/tags/{ref}"):
+        if name in resolved:
+            return resolved[name]
+    return resolved.get(ref)
+
+
+def _fetch_blobless(repo_url: str, ref: str) -> Path:
+    """Fetch a single commit without blobs into a per-repo cache dir."""
+    url_hash = hashlib.sha256(repo_url.encode()).hexdigest()[:16]
+    repo_dir = _metadata_cache_dir() / "repos" / url_hash
+    if not (repo_dir / ".git").is_dir():
+        repo_dir.mkdir(parents=True, exist_ok=True)
+        copier_vcs.get_git(repo_dir)("init", "--quiet")
+
+    log.debug(f"Fetching template metadata of {repo_url} ({ref})")
+    copier_vcs.get_git(repo_dir)(
+        "fetch", "--quiet", "--depth=1", "--filter=blob:none", repo_url, ref
+    )
+    return repo_dir
+
+
+def _config_with_includes(files: list[str], git, sha: str) -> list[str]:
+    """The copier config file and all files it (transitively) includes."""
+    config = next((f for f in CONFIG_FILENAMES if f in files), None)
+    if config is None:
+        raise ValueError(f"No copier.yml found in template at {sha}")
+
+    todo = [config]
+    found: list[str] = []
+    while todo:
+        path = todo.pop()
+        if path in found:
+            continue
+        found.append(path)
+        parent = PurePosixPath(path).parent
+        for pattern in _INCLUDE_PATTERN.findall(git("show", f"{sha}:{path}")):
+            # like copier, includes are globs relative to the including file
+            full_pattern = str(parent / pattern) if str(parent) != "." else pattern
+            todo.extend(f for f in files if fnmatch(f, full_pattern))
+    return found
+
+
+def _metadata_cache_dir() -> Path:
+    """Location of cached template metadata.
+
+    Separate function for easy mocking in tests.
+    """
+    return Path(user_cache_dir("coasti")) / "template-metadata"
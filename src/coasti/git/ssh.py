@@ -0,0 +1,91 @@
+"""
+SSH for git commands of products that authenticate with a key.
+
+Every clone, fetch and ls-remote over SSH would do a full handshake. Instead,
+the first connection to a host becomes a master (`ControlMaster=auto`), and
+later git commands to the same host, user and port reuse it. Masters stay up
+for `CONTROL_PERSIST_SECONDS` after their last use, and are stopped when the
+process exits.
+
+Control sockets live in a private (0700) temp dir per process. Their names
+include the key, so products with different keys for the same host never
+share a connection (and with it, an identity).
+
+Set `COASTI_SSH_MULTIPLEX=0` to connect once per git command. Not used on
+Windows, whose OpenSSH has no connection sharing.
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+from coasti.logger import log
+
+CONTROL_PERSIST_SECONDS = 60
+
+_control_dir: Path | None = None
+_control_dir_lock = threading.Lock()
+
+
+def ssh_command(ssh_key_path: str | Path) -> str:
+    """`GIT_SSH_COMMAND` to authenticate with the key at `ssh_key_path`."""
+    command = ["ssh", "-i", str(ssh_key_path), "-o", "IdentitiesOnly=yes"]
+    if multiplexing_enabled():
+        key = hashlib.sha256(str(ssh_key_path).encode()).hexdigest()[:8]
+        command += [
+            "-o",
+            "ControlMaster=auto",
+            # %C: hash of local host, remote host, port and user
+            "-o",
+            f"ControlPath={control_dir() / key}-%C",
+            "-o",
+            f"ControlPersist={CONTROL_PERSIST_SECONDS}",
+        ]
+    return shlex.join(command)
+
+
+def multiplexing_enabled() -> bool:
+    return sys.platform != "win32" and os.getenv("COASTI_SSH_MULTIPLEX", "1") != "0"
+
+
+def control_dir() -> Path:
+    """The private dir for control sockets of this process, created on first use."""
+    global _control_dir
+    with _control_dir_lock:
+        if _control_dir is None:
+            # socket paths are limited to ~100 bytes, keep the dir short
+            base = "/tmp" if Path("/tmp").is_dir() else None
+            _control_dir = Path(tempfile.mkdtemp(prefix="coasti-ssh-", dir=base))
+        return _control_dir
+
+
+def close_connections() -> None:
+    """Stop the masters of this process and remove their control dir."""
+    global _control_dir
+    with _control_dir_lock:
+        if _control_dir is None:
+            return
+        for socket in _control_dir.iterdir():
+            try:
+                subprocess.run(
+                    ["ssh", "-o", f"ControlPath={socket}", "-O", "exit", "coasti"],
+                    capture_output=True,
+                    timeout=10,
+                    check=False,
+                )
+            except (OSError, subprocess.TimeoutExpired) as e:
+                log.debug(f"Could not stop ssh master {str(socket)}: {e}")
+        shutil.rmtree(_control_dir, ignore_errors=True)
+        _control_dir = None
+
+
+atexit.register(close_connections)
@@ -11,6 +11,7 @@ import os
 import shutil
 import stat
 import subprocess
+import time
 from importlib import metadata, resources
 from pathlib import Path
 from typing import Annotated, Any
@@ -20,6 +21,7 @@ import typer
 from platformdirs import user_cache_dir
 
 from coasti.prompt import prompt_single
+from coasti.timing import bytes_written_since, count, recorder, span
 
 from .logger import log
 
@@ -89,31 +91,39 @@ def init(
     try:
         if (coasti_dir / "config" / "install_answers.yml").exists() and not recopy:
             log.debug(f"Using copier update on {coasti_dir}")
-            copier.run_update(
-                dst_path=coasti_dir,
-                answers_file="./config/install_answers.yml",
-                data=copier_data,
-                vcs_ref=vcs_ref,
-                unsafe=True,
-                overwrite=True,
-            )
+            with span("init.copier_update") as attrs:
+                started = time.time()
+                copier.run_update(
+                    dst_path=coasti_dir,
+                    answers_file="./config/install_answers.yml",
+                    data=copier_data,
+                    vcs_ref=vcs_ref,
+                    unsafe=True,
+                    overwrite=True,
+                )
+                attrs["bytes_written"] = bytes_written_since(coasti_dir, started)
         else:
             log.debug(
                 f"Using copier copy on {coasti_dir} with template from "
                 f"{str(template_repo)}"
             )
-            copier.run_copy(
-                src_path=str(template_repo),
-                dst_path=coasti_dir,
-                answers_file="./config/install_answers.yml",
-                data=copier_data,
-                vcs_ref=vcs_ref,
-                unsafe=True,
-            )
+            with span("init.copier_copy") as attrs:
+                started = time.time()
+                copier.run_copy(
+                    src_path=str(template_repo),
+                    dst_path=coasti_dir,
+                    answers_file="./config/install_answers.yml",
+                    data=copier_data,
+                    vcs_ref=vcs_ref,
+                    unsafe=True,
+                )
+                attrs["bytes_written"] = bytes_written_since(coasti_dir, started)
     except copier.ProcessExecutionError as e:
         log.error("Failed to init from template")
         log.info(e)
 
+    recorder.workspace = coasti_dir
+
 
 def materialize_template_repo() -> Path:
     """
@@ -134,7 +144,12 @@ def materialize_template_repo() -> Path:
     log.debug(f"Materializing template repo at {str(repo_dir)}")
 
     bundle_resource = _get_template_bundle_path()
-    with resources.as_file(bundle_resource) as bundle_path:
+    with (
+        span("init.materialize_template"),
+        resources.as_file(bundle_resource) as bundle_path,
+        span("git.clone"),
+    ):
+        count("git_commands")
         subprocess.check_call(
             ["git", "clone", "--quiet", str(bundle_path), str(repo_dir)]
         )
@@ -1,6 +1,23 @@
 from __future__ import annotations
 
+import atexit
+import copy
+import gzip
 import logging
+import os
+import queue
+import shutil
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import (
+    MemoryHandler,
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+)
+from pathlib import Path
 
 from rich.console import Console, ConsoleRenderable
 from rich.highlighter import NullHighlighter
@@ -11,12 +28,22 @@ from rich.traceback import install
 
 log = logging.getLogger("coasti")
 
+# Records are queued by the calling threads and rendered by a single listener
+# thread. This keeps (rich) rendering out of hot loops and worker threads, and
+# guarantees that lines of concurrent workers never interleave.
+_queue: queue.Queue[logging.LogRecord] = queue.Queue()
+_listener: QueueListener | None = None
+_console: Console | None = None
+
 
 def setup_logging_handler(
     verbose_level: int = 0,
 ) -> None:
     """
     Configure the logging handler for the cli app give its verbosity level.
+
+    On a terminal, we render with rich. Otherwise (pipes, CI), we fall back to
+    a plain formatter, which is much cheaper.
     """
 
     console = Console(
@@ -43,40 +70,212 @@ def setup_logging_handler(
         3: logging.DEBUG,  # debug incl. other modules with extended formatting
     }
 
+    global _console
+    _console = console
+
     level = level_mapping.get(verbose_level, logging.INFO)
-    handler = ColoredHandler(
-        console=console,
-        markup=False,
-        tracebacks_max_frames=1,
-        tracebacks_show_locals=(verbose_level >= 2),
-        show_path=(verbose_level >= 1),
-        show_level=(verbose_level >= 2),
-        show_time=(verbose_level >= 2),
-        highlighter=NullHighlighter(),  # otherwise we get bold numbers etc
-    )
+    handler: logging.Handler
+    if console.is_terminal:
+        handler = ColoredHandler(
+            console=console,
+            markup=False,
+            tracebacks_max_frames=1,
+            tracebacks_show_locals=(verbose_level >= 2),
+            show_path=(verbose_level >= 1),
+            show_level=(verbose_level >= 2),
+            show_time=(verbose_level >= 2),
+            highlighter=NullHighlighter(),  # otherwise we get bold numbers etc
+        )
+        fmt = "%(message)s"
+    else:
+        handler = PlainHandler()
+        fmt = "%(levelname)-8s %(message)s" if verbose_level >= 2 else "%(message)s"
+        if verbose_level >= 2:
+            fmt = "%(asctime)s " + fmt
+
+    if verbose_level == 3:
+        fmt = "[%(name)s] " + fmt
+    handler.setFormatter(logging.Formatter(fmt, datefmt="[%X]"))
+
+    queue_handler = _start_listener(handler)
     if verbose_level == 3:
         logging.basicConfig(
             level=logging.DEBUG,
-            format="[%(name)s] %(message)s",
             datefmt="[%X]",
-            handlers=[handler],
+            handlers=[queue_handler],
         )
     else:
         log.handlers.clear()
         log.propagate = False
-
-        handler.setFormatter(
-            logging.Formatter(
-                "%(message)s",
-                datefmt="[%X]",
-            ),
-        )
-        log.addHandler(handler)
+        log.addHandler(queue_handler)
         log.setLevel(level)
 
     log.debug(f"Set logging level to {logging.getLevelName(level)}")
 
 
+def get_console() -> Console:
+    """The console that log records are rendered to.
+
+    Use it for live displays, so log lines print above them.
+    """
+    global _console
+    if _console is None:
+        _console = Console()
+    return _console
+
+
+def flush_logging() -> None:
+    """Block until all queued log records are rendered.
+
+    Call before writing to the terminal directly, e.g. for prompts.
+    """
+    if _listener is not None:
+        _queue.join()
+
+
+def stop_logging() -> None:
+    """Render all queued records and stop the listener thread.
+
+    Later records are rendered directly, on the calling thread.
+    """
+    global _listener
+    if _listener is None:
+        return
+
+    _listener.stop()
+    for logger in (log, logging.getLogger()):
+        for handler in list(logger.handlers):
+            if isinstance(handler, _RecordQueueHandler):
+                logger.removeHandler(handler)
+                logger.addHandler(handler.target)
+    _listener = None
+
+
+def _start_listener(handler: logging.Handler) -> QueueHandler:
+    global _listener
+    stop_logging()
+    _listener = QueueListener(_queue, handler, respect_handler_level=True)
+    _listener.start()
+    return _RecordQueueHandler(_queue, target=handler)
+
+
+atexit.register(stop_logging)
+
+
+# ----------------------------- Per-product files ----------------------------- #
+
+# id of the product whose operation runs in this thread / context
+_current_product: ContextVar[str | None] = ContextVar(
+    "coasti_current_product", default=None
+)
+
+
+def current_product() -> str | None:
+    """Id of the product whose operation runs in this thread, if any."""
+    return _current_product.get()
+
+
+@contextmanager
+def product_log_file(product_id: str, log_dir: Path) -> Iterator[None]:
+    """
+    Additionally write records of this product's operation to `log_dir/coasti.log`.
+
+    Only records from the current thread / context are written, so concurrent
+    operations on other products do not end up in this file. Records are buffered
+    in memory and written in batches (or right away for errors).
+
+    Rotation is configured via env vars:
+    - `COASTI_LOG_MAX_BYTES` (default 5 MB), size at which the file is rotated
+    - `COASTI_LOG_BACKUP_COUNT` (default 5), number of rotated files to keep
+    - `COASTI_LOG_COMPRESS` (default 1), gzip rotated files
+    """
+    file_handler = CompressingRotatingFileHandler(
+        log_dir / "coasti.log",
+        maxBytes=int(os.getenv("COASTI_LOG_MAX_BYTES", 5_000_000)),
+        backupCount=int(os.getenv("COASTI_LOG_BACKUP_COUNT", 5)),
+        compress=os.getenv("COASTI_LOG_COMPRESS", "1") != "0",
+    )
+    file_handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)-8s %(message)s")
+    )
+    buffered = MemoryHandler(
+        capacity=200, flushLevel=logging.ERROR, target=file_handler
+    )
+    buffered.addFilter(lambda record: _current_product.get() == product_id)
+
+    token = _current_product.set(product_id)
+    log.addHandler(buffered)
+    try:
+        yield
+    finally:
+        log.removeHandler(buffered)
+        _current_product.reset(token)
+        buffered.close()  # flushes
+        file_handler.close()
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """
+    Size-rotated log file that optionally gzips rotated files.
+
+    The file (and its directory) is only created on the first write.
+    """
+
+    def __init__(self, filename: Path, *, compress: bool = True, **kwargs) -> None:
+        super().__init__(filename, delay=True, **kwargs)
+        if compress:
+            self.namer = lambda name: f"{name}.gz"
+            self.rotator = self._gzip_rotator
+
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
+    @staticmethod
+    def _gzip_rotator(source: str, dest: str) -> None:
+        with Path(source).open("rb") as f_in, gzip.open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        Path(source).unlink()
+
+
+# ---------------------------------- Handlers --------------------------------- #
+
+
+class _RecordQueueHandler(QueueHandler):
+    """
+    Queue records for the listener thread.
+
+    Unlike the default, we do not format the message here: the target handler
+    formats it (rich or plain), and keeps the exception info for tracebacks.
+    """
+
+    def __init__(
+        self, queue: queue.Queue[logging.LogRecord], target: logging.Handler
+    ) -> None:
+        super().__init__(queue)
+        self.target = target
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # resolve args now, they might change before the record is rendered
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class PlainHandler(logging.Handler):
+    """Cheap handler for non-terminals: one write per record to stdout."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            # resolve stdout on each emit, it might have been swapped (tests)
+            stream = sys.stdout
+            stream.write(self.format(record) + "\n")
+            stream.flush()
+        except Exception:
+            self.handleError(record)
+
+
 class ColoredHandler(RichHandler):
     def render_message(
         self, record: logging.LogRecord, message: str
@@ -0,0 +1,227 @@
+"""
+Prometheus metrics for node_exporter's textfile collector.
+
+After each command, we write `coasti_<workspace>.prom` into the metrics dir
+(`--metrics-dir` or `COASTI_METRICS_DIR`). Gauges describe the last run, counters
+and last-success timestamps accumulate across runs via a small json state file
+next to it.
+
+Both files are written atomically (temp file + rename), so the collector never
+reads a partial file.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+from coasti.logger import log
+from coasti.timing import Recorder
+
+# span name -> operation label
+OPERATIONS = {
+    "product.install": "install",
+    "product.update": "update",
+    "product.probe": "probe",
+    "product.rollback": "rollback",
+    "product.run": "run",
+}
+
+
+def write_metrics(metrics_dir: Path, recorder: Recorder) -> Path:
+    """Write the metrics of the finished run of `recorder` to `metrics_dir`."""
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    workspace = str(recorder.workspace or "")
+    stem = f"coasti_{_workspace_key(workspace)}"
+    state_path = metrics_dir / f".{stem}.state.json"
+
+    state = _load_state(state_path)
+    now = time.time()
+
+    durations: dict[tuple[str, str], float] = {}
+    fetched: dict[str, int] = defaultdict(int)
+    for span in recorder.spans:
+        if (operation := OPERATIONS.get(span.name)) is None:
+            continue
+        product = str(span.attrs.get("product", ""))
+        status = "success" if span.attrs.get("status") == "ok" else "failure"
+        durations[product, operation] = span.duration
+        fetched[product] += span.counters.get("bytes_fetched", 0)
+
+        key = f"{product}\t{operation}\t{status}"
+        state["operations"][key] = state["operations"].get(key, 0) + 1
+        if status == "success":
+            state["last_success"][f"{product}\t{operation}"] = (
+                span.start + span.duration
+            )
+    for product, n in fetched.items():
+        state["bytes_fetched"][product] = state["bytes_fetched"].get(product, 0) + n
+
+    for name, n in recorder.counters.items():
+        for result in ("hit", "miss"):
+            if name.startswith(f"cache_{result}."):
+                key = f"{name.partition('.')[2]}\t{result}"
+                state["cache"][key] = state["cache"].get(key, 0) + n
+        # coasti.git.limits: operations that waited for a connection slot
+        if name.startswith("git_queue_waits."):
+            host = name.partition(".")[2]
+            state["git_queue_waits"][host] = state["git_queue_waits"].get(host, 0) + n
+        elif name.startswith("git_queue_wait_ms."):
+            host = name.partition(".")[2]
+            waited = state["git_queue_wait_seconds"].get(host, 0) + n / 1000
+            state["git_queue_wait_seconds"][host] = waited
+
+    ws = {"workspace": workspace}
+    lines: list[str] = []
+    _metric(
+        lines,
+        "coasti_product_operation_duration_seconds",
+        "gauge",
+        "Duration of the last install, update, probe or rollback of a product.",
+        [
+            ({**ws, "product": p, "operation": o}, d)
+            for (p, o), d in sorted(durations.items())
+        ],
+    )
+    _metric(
+        lines,
+        "coasti_product_operations_total",
+        "counter",
+        "Product operations by result.",
+        [
+            ({**ws, **dict(zip(("product", "operation", "status"), k.split("\t")))}, n)
+            for k, n in sorted(state["operations"].items())
+        ],
+    )
+    _metric(
+        lines,
+        "coasti_product_last_success_timestamp_seconds",
+        "gauge",
+        "Unix time of the last successful operation on a product.",
+        [
+            ({**ws, **dict(zip(("product", "operation"), k.split("\t")))}, t)
+            for k, t in sorted(state["last_success"].items())
+        ],
+    )
+    _metric(
+        lines,
+        "coasti_product_fetched_bytes_total",
+        "counter",
+        "Bytes of template repos fetched for a product.",
+        [({**ws, "product": p}, n) for p, n in sorted(state["bytes_fetched"].items())],
+    )
+    _metric(
+        lines,
+        "coasti_cache_requests_total",
+        "counter",
+        "Cache lookups by cache and result (hit, miss).",
+        [
+            ({**ws, **dict(zip(("cache", "result"), k.split("\t")))}, n)
+            for k, n in sorted(state["cache"].items())
+        ],
+    )
+    _metric(
+        lines,
+        "coasti_git_queue_waits_total",
+        "counter",
+        "Git network operations that waited for a free connection, by host.",
+        [({**ws, "host": h}, n) for h, n in sorted(state["git_queue_waits"].items())],
+    )
+    _metric(
+        lines,
+        "coasti_git_queue_wait_seconds_total",
+        "counter",
+        "Time git network operations waited for a free connection, by host.",
+        [
+            ({**ws, "host": h}, t)
+            for h, t in sorted(state["git_queue_wait_seconds"].items())
+        ],
+    )
+    _metric(
+        lines,
+        "coasti_run_duration_seconds",
+        "gauge",
+        "Duration of the last coasti command.",
+        [({**ws, "command": recorder.command or ""}, now - recorder.started)],
+    )
+    _metric(
+        lines,
+        "coasti_run_timestamp_seconds",
+        "gauge",
+        "Unix time when the last coasti command finished.",
+        [(ws, now)],
+    )
+
+    _write_atomic(state_path, json.dumps(state, indent=2))
+    prom_path = metrics_dir / f"{stem}.prom"
+    _write_atomic(prom_path, "\n".join(lines) + "\n")
+    log.debug(f"Wrote metrics to {str(prom_path)}")
+    return prom_path
+
+
+def _metric(
+    lines: list[str],
+    name: str,
+    kind: str,
+    help: str,
+    samples: list[tuple[dict[str, str], float]],
+) -> None:
+    if not samples:
+        return
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        lines.append(f"{name}{{{label_str}}} {_format_value(value)}")
+
+
+def _format_value(value: float) -> str:
+    # `:g` would round timestamps and large counters to 6 digits
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _workspace_key(workspace: str) -> str:
+    """Short, stable, file-name safe key per workspace."""
+    name = "".join(c if c.isalnum() else "_" for c in Path(workspace).name)
+    return f"{name}_{hashlib.sha256(workspace.encode()).hexdigest()[:8]}"
+
+
+def _load_state(path: Path) -> dict[str, dict[str, Any]]:
+    state: dict[str, dict[str, Any]] = {}
+    if path.is_file():
+        try:
+            state = json.loads(path.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            log.debug(f"Ignoring broken metrics state {str(path)}: {e}")
+    for section in (
+        "operations",
+        "last_success",
+        "bytes_fetched",
+        "cache",
+        "git_queue_waits",
+        "git_queue_wait_seconds",
+    ):
+        state.setdefault(section, {})
+    return state
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        Path(tmp).chmod(0o644)
+        Path(tmp).replace(path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
@@ -2,6 +2,9 @@ from __future__ import annotations
 
 import json
 import os
+import sys
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from pathlib import Path
 from typing import Annotated, Any
@@ -13,24 +16,43 @@ from rich.table import Table
 from ruamel.yaml import YAML
 
 from coasti.git import can_access_git_repo, copier_git_injection
+from coasti.git.retry import BudgetExceededError, batch_budget, batch_time_left
 from coasti.logger import log
+from coasti.progress import ProductProgress
 from coasti.prompt import (
     prompt_like_copier,
     prompt_single,
 )
+from coasti.scheduler import run_dag
+from coasti.timing import recorder, span
 
+from .journal import BatchJournal
 from .product import Product, ProductsYamlIO
 from .questions import PRODUCT_QUESTIONS
+from .threads import thread_safe_copier
 
 yaml = YAML()
 app = typer.Typer()
 
+# concurrent product installs and updates, dependencies go first
+DEFAULT_JOBS = 1
+
 
 @app.callback()
 def entrypoint(ctx: typer.Context):
     """Callback to make sure requirements are met to work with products."""
 
     quiet: bool = ctx.obj.get("quiet", False)
+    coasti_base_dir = coasti_base_dir_from_env_or_prompt(quiet)
+    ctx.obj["coasti_base_dir"] = coasti_base_dir
+    recorder.workspace = coasti_base_dir
+
+
+def coasti_base_dir_from_env_or_prompt(quiet: bool) -> Path:
+    """The coasti dir from COASTI_BASE_DIR or cwd, asking if neither is valid.
+
+    Exits if we do not end up with a valid coasti dir.
+    """
     coasti_base_dir = Path(os.getenv("COASTI_BASE_DIR", Path.cwd())).absolute()
 
     dir_is_valid = (coasti_base_dir / "config" / "products.yml").is_file()
@@ -50,11 +72,11 @@ def entrypoint(ctx: typer.Context):
         log.error(f"Invalid coasti base dir: {str(coasti_base_dir)}")
         raise typer.Exit(code=1)
 
-    ctx.obj["coasti_base_dir"] = coasti_base_dir
+    return coasti_base_dir
 
 
-@app.command()
-def list(ctx: typer.Context):
+@app.command("list")
+def list_products(ctx: typer.Context):
     """List installed products"""
 
     table = Table(title="Installed Products")
@@ -138,11 +160,16 @@ def add(
     product = Product(yaml_io=yaml_io, data=p_res)
 
     # FIXME: add single prompt verification via function so we can verify in place
-    with copier_git_injection(
-        https_token=product.vcs_auth_token,
-        ssh_key_path=product.vcs_auth_sshkeypath,
+    with (
+        copier_git_injection(
+            https_token=product.vcs_auth_token,
+            ssh_key_path=product.vcs_auth_sshkeypath,
+            repo_url=vcs_repo,
+        ),
+        span("product.probe", product=product.id) as attrs,
     ):
         if not can_access_git_repo(vcs_repo):
+            attrs["status"] = "error"
             log.error("Could not access repo, despite authentication.")
             raise typer.Exit(code=1)
 
@@ -160,11 +187,134 @@ def add(
     if not quiet and prompt_single(
         f"Do you want to install {product.id} now?", type=bool, default=True
     ):
-        install(ctx, product.id)
+        install(ctx, [product.id])
 
 
 @app.command()
 def install(
+    ctx: typer.Context,
+    pids: Annotated[
+        list[str] | None,
+        typer.Argument(
+            help="Ids of the products.",
+        ),
+    ] = None,
+    all_products: Annotated[
+        bool,
+        typer.Option("--all", help="Install all products in products.yml."),
+    ] = False,
+    jobs: Annotated[
+        int,
+        typer.Option("--jobs", "-j", min=1, help="Products to install concurrently."),
+    ] = DEFAULT_JOBS,
+    resume: Annotated[
+        bool,
+        typer.Option(
+            "--resume",
+            help="Continue the last install: skip the products it finished, run the "
+            "others again.",
+        ),
+    ] = False,
+    budget: Annotated[
+        float | None,
+        typer.Option(
+            "--budget",
+            help="Seconds the batch may take. Git operations get at most the time "
+            "left, products not started in time fail (see --resume).",
+        ),
+    ] = None,
+):
+    """
+    Fetch resources for products that have already been added
+
+    Uses copier, git and details from config/products.yml. Products are
+    installed after those they depend on (`depends_on` in products.yml).
+    """
+    yaml_io = ProductsYamlIO(ctx.obj["coasti_base_dir"])
+    journal = _start_or_resume_batch(yaml_io, "install", pids, all_products, resume)
+    _run_batch(
+        yaml_io,
+        journal,
+        "install",
+        lambda product, commit: product.install(commit),
+        jobs,
+        budget,
+    )
+
+
+@app.command()
+def update(
+    ctx: typer.Context,
+    pids: Annotated[
+        list[str] | None,
+        typer.Argument(
+            help="Ids of the products.",
+        ),
+    ] = None,
+    all_products: Annotated[
+        bool,
+        typer.Option("--all", help="Update all products in products.yml."),
+    ] = False,
+    vcs_ref: Annotated[
+        str | None,
+        typer.Option(
+            "--vcs-ref", help="Version control reference, e.g. git branch or commit"
+        ),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option("--jobs", "-j", min=1, help="Products to update concurrently."),
+    ] = DEFAULT_JOBS,
+    resume: Annotated[
+        bool,
+        typer.Option(
+            "--resume",
+            help="Continue the last update: skip the products it finished, run the "
+            "others again.",
+        ),
+    ] = False,
+    budget: Annotated[
+        float | None,
+        typer.Option(
+            "--budget",
+            help="Seconds the batch may take. Git operations get at most the time "
+            "left, products not started in time fail (see --resume).",
+        ),
+    ] = None,
+):
+    """
+    Update installed products
+
+    Uses copier, git and details from config/products.yml. Products are
+    updated after those they depend on (`depends_on` in products.yml).
+    """
+    yaml_io = ProductsYamlIO(ctx.obj["coasti_base_dir"])
+    if resume and vcs_ref is not None:
+        log.error("--vcs-ref cannot be used with --resume, the last update's is used.")
+        raise typer.Exit(code=1)
+
+    def check(pids: list[str], options: dict[str, Any]) -> None:
+        if options.get("vcs_ref") is not None and len(pids) > 1:
+            log.error("--vcs-ref can only be used when updating a single product.")
+            raise typer.Exit(code=1)
+
+    journal = _start_or_resume_batch(
+        yaml_io, "update", pids, all_products, resume, {"vcs_ref": vcs_ref}, check
+    )
+    vcs_ref = journal.options.get("vcs_ref")
+
+    _run_batch(
+        yaml_io,
+        journal,
+        "update",
+        lambda product, commit: product.update(vcs_ref, commit),
+        jobs,
+        budget,
+    )
+
+
+@app.command()
+def diff(
     ctx: typer.Context,
     pid: Annotated[
         str | None,
@@ -172,29 +322,51 @@ def install(
             help="Id of the product.",
         ),
     ] = None,
+    vcs_ref: Annotated[
+        str | None,
+        typer.Option(
+            "--vcs-ref",
+            help="Version control reference to compare with, default from products.yml",
+        ),
+    ] = None,
+    as_json: Annotated[
+        bool,
+        typer.Option("--json", help="Print a summary of changed files as JSON."),
+    ] = False,
+    exit_code: Annotated[
+        bool,
+        typer.Option("--exit-code", help="Exit with code 1 if there are changes."),
+    ] = False,
 ):
     """
-    Fetch resources for a product that has already been added
+    Preview the changes of an update as a unified diff
 
-    Uses copier, git and details from config/products.yml
+    Renders the new version (without running template tasks) and compares it to
+    the installed product. Local changes show up as differences too, files that
+    the template does not render are only counted as untracked.
     """
     yaml_io = ProductsYamlIO(ctx.obj["coasti_base_dir"])
     pid = _product_id_from_yaml_or_prompt(yaml_io, pid)
+    product = yaml_io.get_product(pid)
+    if not product.dst_path.is_dir():
+        log.error(f"{pid} is not installed.")
+        raise typer.Exit(code=1)
+
     try:
-        product = yaml_io.get_product(pid)
-        product.install()
+        result = product.diff(vcs_ref, out=None if as_json else sys.stdout)
     except copier.ProcessExecutionError as e:
-        log.error(f"Failed to install {pid}. Check your connection and authentication.")
+        log.error(f"Failed to render {pid}. Check your connection and authentication.")
         log.info(e)
         raise typer.Exit(code=1)
-    except Exception as e:
-        # use typer to exit and avoid stack trace (which might contain auth info).
-        log.error(e)
+
+    if as_json:
+        typer.echo(json.dumps(result.as_dict(), indent=2))
+    if exit_code and result.changes:
         raise typer.Exit(code=1)
 
 
 @app.command()
-def update(
+def rollback(
     ctx: typer.Context,
     pid: Annotated[
         str | None,
@@ -202,37 +374,168 @@ def update(
             help="Id of the product.",
         ),
     ] = None,
-    vcs_ref: Annotated[
-        str | None,
-        typer.Option(
-            "--vcs-ref", help="Version control reference, e.g. git branch or commit"
-        ),
-    ] = None,
 ):
     """
-    Update an installed product
+    Swap a product back to its version before the last install or update
 
-    Uses copier, git and details from config/products.yml
+    Data and logs stay as they are. Rolling back twice undoes the rollback.
     """
     yaml_io = ProductsYamlIO(ctx.obj["coasti_base_dir"])
     pid = _product_id_from_yaml_or_prompt(yaml_io, pid)
     try:
-        product = yaml_io.get_product(pid)
+        yaml_io.get_product(pid).rollback()
+    except FileNotFoundError:
+        log.error(f"{pid} has no previous version to roll back to.")
+        raise typer.Exit(code=1)
 
-        if vcs_ref is None:
-            vcs_ref = product.data["vcs_ref"]
 
-        product.update(vcs_ref)
-    except copier.ProcessExecutionError as e:
-        log.error(f"Failed to update {pid}. Check your connection and authentication.")
-        log.info(e)
+def _start_or_resume_batch(
+    yaml_io: ProductsYamlIO,
+    operation: str,
+    pids: list[str] | None,
+    all_products: bool,
+    resume: bool,
+    options: dict[str, Any] | None = None,
+    check: Callable[[list[str], dict[str, Any]], None] | None = None,
+) -> BatchJournal:
+    """The journal of a new batch of `operation`, or of the last one to resume.
+
+    `check(pids, options)` can reject the batch (raise), before a new journal
+    replaces the last one. A new journal pins the commit that the ref of each
+    product (or the `vcs_ref` option) points to now, resuming keeps those.
+    """
+    coasti_base_dir = yaml_io.coasti_base_dir
+    if not resume:
+        pids = _product_ids_from_yaml_or_prompt(yaml_io, pids, all_products)
+        if check is not None:
+            check(pids, options or {})
+        commits = _resolve_commits(yaml_io, pids, (options or {}).get("vcs_ref"))
+        return BatchJournal.start(coasti_base_dir, operation, pids, options, commits)
+
+    if pids or all_products:
+        log.error("Pass either product ids, --all or --resume.")
+        raise typer.Exit(code=1)
+    journal = BatchJournal.load(coasti_base_dir, operation)
+    if journal is None:
+        log.error(f"There is no {operation} to resume.")
+        raise typer.Exit(code=1)
+    for pid in [pid for pid in journal.entries if pid not in yaml_io.product_ids]:
+        log.warning(f"{pid} is no longer in products.yml, not resuming it.")
+        del journal.entries[pid]
+    if check is not None:
+        check(list(journal.entries), journal.options)
+    return journal
+
+
+def _resolve_commits(
+    yaml_io: ProductsYamlIO, pids: list[str], vcs_ref: str | None
+) -> dict[str, str | None]:
+    """The commits that `vcs_ref` (default: each product's) points to now."""
+    products = [yaml_io.get_product(pid) for pid in pids]
+    with (
+        span("batch.resolve", products=len(pids)),
+        ThreadPoolExecutor(thread_name_prefix="coasti-resolve") as pool,
+    ):
+        commits = pool.map(lambda product: product.resolve_commit(vcs_ref), products)
+        return dict(zip(pids, commits, strict=True))
+
+
+def _run_batch(
+    yaml_io: ProductsYamlIO,
+    journal: BatchJournal,
+    operation: str,
+    run: Callable[[Product, str | None], None],
+    jobs: int = 1,
+    budget: float | None = None,
+):
+    """Run `operation` on the unfinished products of `journal` concurrently,
+    continuing after failures, and record their state in the journal.
+
+    `run(product, commit)` gets the commit that the journal pinned the product to.
+
+    A product starts once the products it depends on succeeded, and is skipped
+    if one of them failed. Dependencies that are not in the batch are not
+    waited for. Products that would start after `budget` seconds fail.
+    Exits with code 1 at the end if any product failed or was skipped.
+    """
+    pids = journal.unfinished()
+    if finished := [pid for pid in journal.entries if pid not in pids]:
+        log.info(
+            f"Resuming the {operation} started at {journal.started_at}, "
+            f"skipping finished products: {', '.join(finished)}"
+        )
+    if not pids:
+        return
+
+    try:
+        dependencies = yaml_io.dependencies
+    except ValueError as e:
+        log.error(f"Invalid depends_on in products.yml: {e}")
         raise typer.Exit(code=1)
-    except Exception as e:
-        # use typer to exit and avoid stack trace (which might contain auth info).
-        log.error(e)
+
+    if jobs > 1 and not thread_safe_copier():
+        jobs = 1
+    products = {pid: yaml_io.get_product(pid) for pid in pids}
+
+    with ProductProgress(pids, operation) as progress:
+
+        def job(pid: str) -> Callable[[], None]:
+            def run_tracked():
+                if (left := batch_time_left()) is not None and left <= 0:
+                    journal.mark(pid, "failed", error=BudgetExceededError.__name__)
+                    log.error(f"Not starting to {operation} {pid}, out of time.")
+                    raise BudgetExceededError(f"No time left for {pid}")
+                journal.mark(pid, "running")
+                try:
+                    with progress.track(pid):
+                        run(products[pid], journal.entries[pid].commit)
+                except copier.ProcessExecutionError as e:
+                    log.error(
+                        f"Failed to {operation} {pid}. "
+                        "Check your connection and authentication."
+                    )
+                    log.info(e)
+                    journal.mark(pid, "failed", error=type(e).__name__)
+                    raise
+                except Exception as e:
+                    # avoid a stack trace (which might contain auth info)
+                    log.error(e)
+                    journal.mark(pid, "failed", error=type(e).__name__)
+                    raise
+                journal.mark(pid, "done")
+
+            return run_tracked
+
+        with batch_budget(budget):
+            results = run_dag(
+                {pid: job(pid) for pid in pids}, dependencies, max_workers=jobs
+            )
+
+    failed = [pid for pid, result in results.items() if result.status != "ok"]
+    for pid, result in results.items():
+        if result.status == "skipped":
+            log.error(f"Skipped {pid}, a product it depends on failed to {operation}.")
+    if failed:
+        if len(pids) > 1:
+            log.error(f"Failed to {operation}: {', '.join(failed)}")
         raise typer.Exit(code=1)
 
 
+def _product_ids_from_yaml_or_prompt(
+    yaml_io: ProductsYamlIO,
+    pids: list[str] | None,
+    all_products: bool = False,
+) -> list[str]:
+    if all_products:
+        if pids:
+            log.error("Pass either product ids or --all, not both.")
+            raise typer.Exit(code=1)
+        return yaml_io.product_ids
+    if not pids:
+        return [_product_id_from_yaml_or_prompt(yaml_io, None)]
+    return [_product_id_from_yaml_or_prompt(yaml_io, pid) for pid in pids]
+
+
 def _product_id_from_yaml_or_prompt(
     yaml_io: ProductsYamlIO,
     pid: str | None,
@@ -0,0 +1,252 @@
+"""
+Preview of a product update, for `coasti product diff`.
+
+The target version of the template is rendered with the product's answers
+(without running template tasks) into a cached tree, `<store>/previews/<key>`,
+keyed like the `render_cache` by repo, resolved commit and answers. A second
+preview of the same version is only a lookup.
+
+Comparing against the installed product is cheap first: files that are the same
+inode (both linked to the file store) are equal, files of different size or
+type differ, both from one `lstat`. Only files of equal size are hashed, on a
+thread pool, and contents are only read to print the diff of changed files.
+
+Only paths that the template renders are compared: those of the new version,
+and of the installed version (its render from the `render_cache`). Others that
+the product has, e.g. outputs of template tasks or files added by users, are
+only counted as untracked, an update keeps them. A file of the installed version
+that the new one drops is removed.
+
+Unlike `update`, this is not a three-way merge: local changes show up as
+differences too.
+"""
+
+from __future__ import annotations
+
+import difflib
+import os
+import stat
+import tempfile
+from collections.abc import Collection, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Literal, TextIO
+
+import copier
+
+from coasti.git.sparse import resolve_ref
+from coasti.logger import log
+from coasti.store import default_store_dir, file_digest
+from coasti.timing import count
+
+from . import render_cache
+from .staging import RUNTIME_PARTS
+
+Status = Literal["added", "removed", "modified"]
+
+
+@dataclass(frozen=True)
+class FileChange:
+    path: str  # posix, relative to the product
+    status: Status
+
+
+@dataclass
+class ProductDiff:
+    product: str
+    vcs_ref: str
+    commit: str | None
+    changes: list[FileChange]
+    unchanged: int
+    # files of the product that the template does not render
+    untracked: int
+
+    def as_dict(self) -> dict[str, Any]:
+        by_status: dict[str, list[str]] = {"added": [], "removed": [], "modified": []}
+        for c in self.changes:
+            by_status[c.status].append(c.path)
+        return {
+            "product": self.product,
+            "vcs_ref": self.vcs_ref,
+            "commit": self.commit,
+            **by_status,
+            "unchanged": self.unchanged,
+            "untracked": self.untracked,
+        }
+
+
+def preview_dir() -> Path:
+    return default_store_dir() / "previews"
+
+
+@contextmanager
+def rendered_version(
+    repo_url: str, vcs_ref: str, answers: dict[str, Any]
+) -> Iterator[tuple[Path, str | None]]:
+    """Yield a render of `repo_url` at `vcs_ref`, and the resolved commit sha.
+
+    Cached if the ref resolves to a commit, otherwise rendered into a temp dir
+    that is removed afterwards.
+    """
+    sha = resolve_ref(repo_url, vcs_ref)
+    entry = None
+    if sha is not None:
+        # tasks are not run, so previews are not mixed with update renders
+        key = render_cache.render_key(
+            {**answers, "_src_path": repo_url, "_commit": sha}, ()
+        )
+        entry = preview_dir() / key if key else None
+    if entry is not None and entry.is_dir():
+        count("cache_hit.preview")
+        os.utime(entry)
+        yield entry, sha
+        return
+    count("cache_miss.preview")
+
+    with tempfile.TemporaryDirectory(prefix="coasti-preview-") as tmp:
+        rendered = Path(tmp) / "render"
+        log.debug(f"Rendering {repo_url} at {sha or vcs_ref} for a preview")
+        copier.run_copy(
+            src_path=repo_url,
+            dst_path=rendered,
+            data={k: v for k, v in answers.items() if not k.startswith("_")},
+            vcs_ref=sha or vcs_ref,
+            defaults=True,
+            overwrite=True,
+            quiet=True,
+            unsafe=True,
+            skip_tasks=True,  # a preview must not have side effects
+        )
+        if entry is not None and render_cache.save_tree(rendered, entry):
+            render_cache.prune(preview_dir())
+            yield entry, sha
+        else:
+            yield rendered, sha
+
+
+def tree_files(
+    root: Path, tracked: Collection[str] | None = None
+) -> tuple[dict[str, os.stat_result], int]:
+    """`lstat` of the files and symlinks below `root`, by posix path.
+
+    Without `.git` and the runtime parts (data, logs) of the product. With
+    `tracked`, only of those paths, the others are only counted (returned too).
+    """
+    files: dict[str, os.stat_result] = {}
+    untracked = 0
+    stack = [("", str(root))]
+    while stack:
+        rel, path = stack.pop()
+        with os.scandir(path) as it:
+            for e in it:
+                e_rel = f"{rel}/{e.name}" if rel else e.name
+                if e_rel in RUNTIME_PARTS:
+                    continue  # dirs, or links to the runtime dir of the product
+                if e.is_dir(follow_symlinks=False):
+                    if e.name != ".git":
+                        stack.append((e_rel, e.path))
+                elif tracked is None or e_rel in tracked:
+                    files[e_rel] = e.stat(follow_symlinks=False)
+                else:
+                    untracked += 1
+    return files, untracked
+
+
+def compare_trees(
+    installed: Path,
+    rendered: Path,
+    base: Path | None = None,
+    max_workers: int | None = None,
+) -> tuple[list[FileChange], int, int]:
+    """Changed files (sorted by path), and the numbers unchanged and untracked.
+
+    Files of `installed` are compared if `rendered` or `base` (the render of
+    the installed version) has them, the others are untracked.
+    """
+    new, _ = tree_files(rendered)
+    tracked = set(new)
+    if base is not None:
+        tracked.update(tree_files(base)[0])
+    old, untracked = tree_files(installed, tracked)
+
+    changes: list[FileChange] = []
+    same_size: list[str] = []
+    unchanged = 0
+    for rel in sorted(old.keys() | new.keys()):
+        a, b = old.get(rel), new.get(rel)
+        if a is None:
+            changes.append(FileChange(rel, "added"))
+        elif b is None:
+            changes.append(FileChange(rel, "removed"))
+        elif (a.st_dev, a.st_ino) == (b.st_dev, b.st_ino):
+            unchanged += 1
+        elif _is_link(a) != _is_link(b) or a.st_size != b.st_size:
+            changes.append(FileChange(rel, "modified"))
+        else:
+            same_size.append(rel)
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="coasti-diff"
+    ) as pool:
+        equal = pool.map(
+            lambda rel: _same_content(installed / rel, rendered / rel), same_size
+        )
+        for rel, is_equal in zip(same_size, equal):
+            if is_equal:
+                unchanged += 1
+            else:
+                changes.append(FileChange(rel, "modified"))
+
+    changes.sort(key=lambda c: c.path)
+    return changes, unchanged, untracked
+
+
+def write_diff(
+    changes: list[FileChange], installed: Path, rendered: Path, out: TextIO
+) -> None:
+    """Write a unified diff (installed -> rendered) of `changes` to `out`."""
+    for c in changes:
+        old = None if c.status == "added" else installed / c.path
+        new = None if c.status == "removed" else rendered / c.path
+        from_file = f"a/{c.path}" if old else "/dev/null"
+        to_file = f"b/{c.path}" if new else "/dev/null"
+
+        old_lines, new_lines = _read_lines(old), _read_lines(new)
+        if old_lines is None or new_lines is None:
+            out.write(f"Binary files {from_file} and {to_file} differ\n")
+            continue
+        out.writelines(
+            difflib.unified_diff(
+                old_lines, new_lines, fromfile=from_file, tofile=to_file
+            )
+        )
+
+
+def _is_link(st: os.stat_result) -> bool:
+    return stat.S_ISLNK(st.st_mode)
+
+
+def _same_content(a: Path, b: Path) -> bool:
+    if a.is_symlink():
+        return a.readlink() == b.readlink()
+    return file_digest(a) == file_digest(b)
+
+
+def _read_lines(path: Path | None) -> list[str] | None:
+    """Lines of a text file (or a symlink's target), None for binary files."""
+    if path is None:
+        return []
+    if path.is_symlink():
+        return [f"{str(path.readlink())}\n"]
+    data = path.read_bytes()
+    if b"\0" in data[:8192]:
+        return None
+    try:
+        lines = data.decode().splitlines(keepends=True)
+    except UnicodeDecodeError:
+        return None
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n\\ No newline at end of file\n"
+    return lines
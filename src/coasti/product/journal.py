@@ -0,0 +1,143 @@
+"""
+Journal of the last batch of product installs or updates, for `--resume`.
+
+`.coasti/journal/<operation>.json` holds the state of every product of the
+batch, written atomically whenever one changes:
+
+- pending: not started (yet), or skipped because a dependency failed
+- running: started, but not finished (e.g. the process was killed)
+- done: finished
+- failed: raised an error
+
+Each entry also pins the template commit (sha) that the product's ref pointed
+to when the batch started, and the product is installed or updated to exactly
+that commit. A branch that moves on in between does not leave a batch on mixed
+versions.
+
+`--resume` runs the products that are not done again, at their pinned commits.
+Those that are done are not touched, and a product that was interrupted only
+replaces its live version once its staged install completes
+(`coasti.product.staging`).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Literal
+
+from coasti.logger import log
+
+JOURNAL_DIR = Path(".coasti") / "journal"
+JOURNAL_VERSION = 2
+
+State = Literal["pending", "running", "done", "failed"]
+
+
+def _now() -> str:
+    return datetime.now(UTC).isoformat(timespec="seconds")
+
+
+@dataclass
+class JournalEntry:
+    state: State = "pending"
+    # template commit (sha) the batch installs, None if the ref did not resolve
+    commit: str | None = None
+    # type of the error, messages might contain auth info
+    error: str | None = None
+    updated_at: str = field(default_factory=_now)
+
+
+class BatchJournal:
+    """Thread-safe state of each product in a batch operation."""
+
+    def __init__(
+        self,
+        path: Path,
+        entries: dict[str, JournalEntry],
+        options: dict[str, Any] | None = None,
+        started_at: str | None = None,
+    ) -> None:
+        self.path = path
+        self.entries = entries
+        self.options = options or {}
+        self.started_at = started_at or _now()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(
+        cls,
+        coasti_base_dir: Path,
+        operation: str,
+        pids: list[str],
+        options: dict[str, Any] | None = None,
+        commits: dict[str, str | None] | None = None,
+    ) -> BatchJournal:
+        """A new journal of `pids`, replacing that of the last `operation`.
+
+        `commits` pins the template commit of each product.
+        """
+        commits = commits or {}
+        journal = cls(
+            journal_path(coasti_base_dir, operation),
+            {pid: JournalEntry(commit=commits.get(pid)) for pid in pids},
+            options,
+        )
+        journal.save()
+        return journal
+
+    @classmethod
+    def load(cls, coasti_base_dir: Path, operation: str) -> BatchJournal | None:
+        """The journal of the last `operation`, None if there is none (usable)."""
+        path = journal_path(coasti_base_dir, operation)
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f"Ignoring broken journal {str(path)}: {e}")
+            return None
+        if data.get("version") != JOURNAL_VERSION:
+            return None
+        return cls(
+            path,
+            {pid: JournalEntry(**e) for pid, e in data["products"].items()},
+            data.get("options"),
+            data.get("started_at"),
+        )
+
+    def unfinished(self) -> list[str]:
+        """Ids of the products that are not done, in the order of the batch."""
+        return [pid for pid, e in self.entries.items() if e.state != "done"]
+
+    def mark(self, pid: str, state: State, error: str | None = None) -> None:
+        """Record the new `state` of `pid`, on disk."""
+        with self._lock:
+            self.entries[pid] = JournalEntry(state, self.entries[pid].commit, error)
+            self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": JOURNAL_VERSION,
+            "started_at": self.started_at,
+            "options": self.options,
+            "products": {pid: asdict(e) for pid, e in self.entries.items()},
+        }
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=2)
+            Path(tmp).replace(self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+
+def journal_path(coasti_base_dir: Path, operation: str) -> Path:
+    return coasti_base_dir / JOURNAL_DIR / f"{operation}.json"
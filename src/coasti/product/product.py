@@ -7,9 +7,12 @@ config/products.yml
 
 ProductsYamlIO  (loaded yaml of all products with io features, getters for products)
     .get_product()      -> Product
+    .dependencies       -> ids of the products each product depends on
     .get_product_data() -> ProductData
 
 ProductData  (yaml fields per Prodouct inside config/products.yml)
+    depends_on  products to install and update before this one
+    transport   `archive` to install from a snapshot, see `coasti.git.archive`
 
 Product         (in RAM Instance around ProductData with functions to install etc)
     .write()    to update ProductData and write back into yaml
@@ -17,23 +20,36 @@ Product         (in RAM Instance around ProductData with functions to install et
 
 from __future__ import annotations
 
-import sys
-from contextlib import contextmanager
+import time
+from contextlib import AbstractContextManager, contextmanager, nullcontext
 from copy import deepcopy
 from pathlib import Path
-from typing import cast
+from typing import TextIO, cast
 
 import copier
+from copier._user_data import load_answersfile_data
+from plumbum.commands.processes import ProcessExecutionError, ProcessTimedOut
 from ruamel.yaml import YAML, CommentedMap
 
 from coasti.git import copier_git_injection
-from coasti.logger import log
+from coasti.git.archive import record_source, template_snapshot
+from coasti.git.sparse import resolve_ref
+from coasti.logger import log, product_log_file
 from coasti.prompt import PromptResponse
+from coasti.scheduler import topological_order
+from coasti.store import FileStore
+from coasti.timing import bytes_written_since, span
 
+from . import reconcile, render_cache, staging
+from .diff import ProductDiff, compare_trees, rendered_version, tree_files, write_diff
 from .questions import AUTH_FILE_SENTINEL, AUTH_SKIP_SENTINEL, ProductData
+from .staging import staged
 
 yaml = YAML()
 
+# where copier keeps the answers of a product, relative to its dst_path
+ANSWERS_FILE = "config/install_answers.yml"
+
 
 class ProductsYamlIO:
     """
@@ -94,6 +110,19 @@ class ProductsYamlIO:
         """Product ids"""
         return [p["id"] for p in self.yaml_data["products"]]
 
+    @property
+    def dependencies(self) -> dict[str, list[str]]:
+        """Ids of the products each product depends on, by product id.
+
+        Raises `CycleError` if products depend on each other, or `ValueError`
+        for dependencies that are not in products.yml.
+        """
+        dependencies = {
+            p["id"]: list(p.get("depends_on") or []) for p in self.yaml_data["products"]
+        }
+        topological_order(dependencies)
+        return dependencies
+
     def get_product(self, pid: str):
         entry = self.get_enry(pid)
         return Product(data=entry, yaml_io=self)
@@ -187,6 +216,14 @@ class Product:
     def dst_path(self):
         return self.coasti_base_dir / self.data["dst_path"]
 
+    @property
+    def log_dir(self):
+        """Where this product logs, `logs/<id>` links here (via `dst_path`)."""
+        if self.dst_path.is_dir() and not self.dst_path.is_symlink():
+            # a product dir from before staged versions
+            return self.dst_path / "logs"
+        return staging.runtime_path(self.dst_path) / "logs"
+
     @property
     def vcs_auth_type(self):
         return self.data["vcs_auth_type"]
@@ -255,32 +292,93 @@ class Product:
         # Now we are sure that secrets are in file, so lets remove them from RAM
         self.data["vcs_auth_value"] = AUTH_FILE_SENTINEL
 
-    def install(self):
+    def resolve_commit(self, vcs_ref: str | None = None) -> str | None:
+        """The commit (sha) that `vcs_ref` (default: the product's) points to now.
+
+        None if it cannot be resolved, e.g. the remote is not reachable.
+        """
+        if vcs_ref is None:
+            vcs_ref = self.data["vcs_ref"]
+        try:
+            with copier_git_injection(
+                https_token=self.vcs_auth_token,
+                ssh_key_path=self.vcs_auth_sshkeypath,
+                repo_url=self.data["vcs_repo"],
+            ):
+                return resolve_ref(self.data["vcs_repo"], vcs_ref)
+        except (OSError, ProcessExecutionError, ProcessTimedOut, TimeoutError) as e:
+            log.warning(f"Could not resolve {vcs_ref} of {self.id}: {e}")
+            return None
+
+    def install(self, commit: str | None = None):
         """
         Install this product by getting its resources via copier.
         Authentication is retrieved from disk and injected into the git commands.
-        """
 
-        # Clone template
-        with copier_git_injection(
-            https_token=self.vcs_auth_token,
-            ssh_key_path=self.vcs_auth_sshkeypath,
-        ):
-            log.info(f"Using copier to install {self.id}. Downloading...")
-            copier.run_copy(
-                src_path=self.data["vcs_repo"],
-                dst_path=self.dst_path,
-                vcs_ref=self.data["vcs_ref"],
-                unsafe=True,
-            )
+        `commit` pins the template to a sha of the product's `vcs_ref`, e.g. the
+        one it pointed to when a batch started. Without, `vcs_ref` is used.
+
+        Copier renders a new version of the product, which `dst_path` links to
+        only once complete. A product that was installed before is kept for
+        `rollback`.
 
-        self._create_symlinks()
+        With `transport: archive`, a product pinned to a tag or sha is rendered
+        from a snapshot of that ref instead of a clone, not of `commit`.
+        """
 
-    def update(self, vcs_ref: str | None):
+        with (
+            product_log_file(self.id, self.log_dir),
+            span("product.install", product=self.id),
+        ):
+            # Clone template
+            with (
+                copier_git_injection(
+                    https_token=self.vcs_auth_token,
+                    ssh_key_path=self.vcs_auth_sshkeypath,
+                    repo_url=self.data["vcs_repo"],
+                ),
+                staged(self.dst_path) as version_path,
+                self._snapshot() as snapshot,
+                span("copier.run_copy", product=self.id) as attrs,
+            ):
+                log.info(f"Using copier to install {self.id}. Downloading...")
+                started = time.time()
+                if snapshot is None:
+                    worker = copier.run_copy(
+                        src_path=self.data["vcs_repo"],
+                        dst_path=version_path,
+                        vcs_ref=commit or self.data["vcs_ref"],
+                        unsafe=True,
+                    )
+                else:
+                    snapshot_path, ref = snapshot
+                    worker = copier.run_copy(
+                        src_path=str(snapshot_path), dst_path=version_path, unsafe=True
+                    )
+                    # for updates, which need the repo
+                    record_source(
+                        version_path / ANSWERS_FILE, self.data["vcs_repo"], ref
+                    )
+                attrs["bytes_written"] = bytes_written_since(version_path, started)
+                # the next update diffs against this render
+                render_cache.store(worker)
+                self._link_to_store(version_path)
+
+            with span("product.symlinks", product=self.id):
+                self._create_symlinks()
+
+    def update(self, vcs_ref: str | None, commit: str | None = None):
         """
         Update this product by getting its resources via copier.
         Authentication is retrieved from disk and injected into the git commands.
 
+        `commit` pins the template to a sha of `vcs_ref`, as for `install`.
+        products.yml keeps `vcs_ref` either way.
+
+        Like `install`, copier works on a new version (a copy of the product),
+        and the current version is kept for `rollback`. The render of the installed
+        version, which copier diffs against, comes from the `render_cache`.
+
         Notes
         -----
         - Copier might log "No git tags found in template; using HEAD as ref",
@@ -290,48 +388,143 @@ class Product:
 
         if vcs_ref is None:
             vcs_ref = self.data["vcs_ref"]
-        elif vcs_ref != self.data["vcs_ref"] and self.yaml_io is not None:
-            log.debug(
-                f"Writing product to update products.yml to new vcs_ref '{vcs_ref}'"
-            )
-            self.data["vcs_ref"] = vcs_ref
-            self.write()
 
         # Clone template
-        with copier_git_injection(
-            https_token=self.vcs_auth_token,
-            ssh_key_path=self.vcs_auth_sshkeypath,
+        with (
+            product_log_file(self.id, self.log_dir),
+            span("product.update", product=self.id, vcs_ref=vcs_ref),
+            copier_git_injection(
+                https_token=self.vcs_auth_token,
+                ssh_key_path=self.vcs_auth_sshkeypath,
+                repo_url=self.data["vcs_repo"],
+            ),
+            staged(self.dst_path, snapshot=True) as version_path,
+            render_cache.cached_renders(),
+            span("copier.run_update", product=self.id) as attrs,
         ):
             log.info(
                 f"Using copier to update {self.id} (vcs_ref {vcs_ref}). Downloading..."
             )
+            started = time.time()
             copier.run_update(
-                dst_path=self.dst_path,
-                answers_file="config/install_answers.yml",
+                dst_path=version_path,
+                answers_file=ANSWERS_FILE,
                 unsafe=True,  # trust templates, needed because they might have tasks
                 overwrite=True,  # needs to be true for copier update of subprojects
                 skip_answered=True,
                 skip_tasks=False,  # Content package can and should decide this per task
-                vcs_ref=vcs_ref,
+                vcs_ref=commit or vcs_ref,
+            )
+            attrs["bytes_written"] = bytes_written_since(version_path, started)
+            self._link_to_store(version_path)
+
+        if vcs_ref != self.data["vcs_ref"] and self.yaml_io is not None:
+            log.debug(
+                f"Writing product to update products.yml to new vcs_ref '{vcs_ref}'"
             )
+            self.data["vcs_ref"] = vcs_ref
+            self.write()
+
+    def diff(self, vcs_ref: str | None, out: TextIO | None = None) -> ProductDiff:
+        """
+        Compare the installed product with a fresh render of `vcs_ref`.
+
+        Streams a unified diff to `out`, if given. Nothing is written to the
+        product, see `coasti.product.diff`.
+        """
+        if vcs_ref is None:
+            vcs_ref = self.data["vcs_ref"]
+
+        answers = load_answersfile_data(self.dst_path, ANSWERS_FILE)
+        with (
+            span("product.diff", product=self.id, vcs_ref=vcs_ref) as attrs,
+            copier_git_injection(
+                https_token=self.vcs_auth_token,
+                ssh_key_path=self.vcs_auth_sshkeypath,
+                repo_url=self.data["vcs_repo"],
+            ),
+            rendered_version(self.data["vcs_repo"], vcs_ref, answers) as (
+                rendered,
+                commit,
+            ),
+        ):
+            with span("diff.compare"):
+                changes, unchanged, untracked = compare_trees(
+                    self.dst_path, rendered, render_cache.installed_render(answers)
+                )
+            attrs.update(changed=len(changes), unchanged=unchanged, untracked=untracked)
+            if out is not None:
+                write_diff(changes, self.dst_path, rendered, out)
+
+        return ProductDiff(
+            product=self.id,
+            vcs_ref=vcs_ref,
+            commit=commit,
+            changes=changes,
+            unchanged=unchanged,
+            untracked=untracked,
+        )
+
+    def rollback(self):
+        """Swap back to the version before the last install or update.
+
+        Does not change products.yml, e.g. its `vcs_ref`.
+        """
+        with (
+            product_log_file(self.id, self.log_dir),
+            span("product.rollback", product=self.id),
+        ):
+            staging.rollback(self.dst_path)
+            log.info(f"Rolled back {self.id} to its previous version")
+
+    def _snapshot(self) -> AbstractContextManager[tuple[Path, str] | None]:
+        """The template at its `vcs_ref` as an archive snapshot, and the pinned ref.
+
+        None if the product does not use `transport: archive`, or its ref cannot
+        be installed from an archive.
+        """
+        if self.data.get("transport", "git") != "archive":
+            return nullcontext()
+        return template_snapshot(
+            self.data["vcs_repo"], self.data["vcs_ref"], self.vcs_auth_token
+        )
+
+    def _link_to_store(self, root: Path):
+        """Share the files of the template version at `root` via the store.
+
+        As reflinks, so users may still edit them, and only where the filesystem
+        has them. The files are those of the version's render in the
+        `render_cache` (without config and runtime parts), we skip linking if
+        there is none.
+        """
+        with span("product.store", product=self.id) as attrs:
+            store = FileStore()
+            if not store.can_reflink(root):
+                log.debug(f"Not linking files of {self.id}, no reflinks")
+                return
+            answers = load_answersfile_data(root, ANSWERS_FILE)
+            if (rendered := render_cache.installed_render(answers)) is None:
+                log.debug(f"Not linking files of {self.id}, no cached render")
+                return
+            files, _ = tree_files(rendered)
+            shared = [f for f in files if f.split("/")[0] != "config"]
+            attrs.update(store.link_tree(root, shared, editable=True))
+            log.debug(f"Linked files of {self.id} to the store: {attrs}")
+
+    def expected_symlinks(self) -> dict[Path, Path]:
+        """Links from the coasti dir into this product (link -> target).
+
+        Only for parts that the installed product actually has.
+        """
+        return {
+            self.coasti_base_dir / part / self.id: self.dst_path / part
+            for part in reconcile.LINKED_PARTS
+            if (self.dst_path / part).exists()
+        }
 
     def _create_symlinks(self):
         log.info(f"Creating symlinks for {self.id}")
-        for part in ["config", "config/secrets", "data", "logs"]:
-            if (dst := self.dst_path / part).exists():
-                src = self.coasti_base_dir / part / self.id
-                try:
-                    src.symlink_to(dst)
-                    log.debug(f"Created symlink {str(src)} -> {str(dst)}")
-                except FileExistsError:
-                    log.debug(f"Link target already exists ({str(dst)})")
-                except OSError as e:
-                    if sys.platform == "win32":
-                        log.info(
-                            "Cannot create symlinks on Windows "
-                            f"without admin permissions ({str(dst)})"
-                        )
-                    else:
-                        log.error(e)
-                except Exception as e:
-                    log.error(e)
+        ops = reconcile.plan(
+            self.coasti_base_dir, self.expected_symlinks(), prune=False
+        )
+        reconcile.apply(ops)
@@ -20,6 +20,11 @@ class ProductData(TypedDict):
     vcs_auth_type: Literal["skip", "Auth Token", "SSH Key"]
     vcs_auth_value: str
 
+    # ids of products to install (and update) before this one, not asked for
+    depends_on: NotRequired[list[str]]
+    # "archive" to install a tag or sha from a snapshot, not asked for
+    transport: NotRequired[Literal["git", "archive"]]
+
     # helper questions
     vcs_auth_token: NotRequired[str]
     vcs_auth_sshkeypath: NotRequired[str]
@@ -0,0 +1,172 @@
+"""
+Reconcile the links from the coasti dir into products.
+
+The desired state follows from products.yml: for every installed product, the
+parts it has (`LINKED_PARTS`) are linked as `<part>/<id>` into the coasti
+dir. We list each of the few link directories once, diff against the desired
+links, and only then touch the disk:
+
+- `mkdir`, a link directory is missing
+- `create`, a link is missing
+- `fix`, a link points elsewhere (replaced atomically)
+- `delete`, a stale link into a product part, e.g. of a removed product
+- `conflict`, a real file or directory where a link belongs (never touched)
+
+A healthy workspace is diffed with a handful of syscalls, and not written to.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal
+
+from coasti.logger import log
+
+if TYPE_CHECKING:
+    from .product import Product
+
+# parts of a product that are linked into the coasti dir, e.g. data/<id>
+LINKED_PARTS = ("config", "config/secrets", "data", "logs")
+
+Action = Literal["mkdir", "create", "fix", "delete", "conflict"]
+
+
+@dataclass(frozen=True)
+class Operation:
+    action: Action
+    path: Path
+    target: Path | None = None
+
+    def __str__(self) -> str:
+        if self.action in ("create", "fix"):
+            return f"{self.action} {str(self.path)} -> {str(self.target)}"
+        return f"{self.action} {str(self.path)}"
+
+
+@dataclass(frozen=True)
+class _Existing:
+    is_symlink: bool
+    link_target: str | None
+
+
+def desired_links(products: Iterable[Product]) -> dict[Path, Path]:
+    """Links from the coasti dir into `products` (link -> target)."""
+    links: dict[Path, Path] = {}
+    for product in products:
+        links.update(product.expected_symlinks())
+    return links
+
+
+def plan(
+    coasti_base_dir: Path,
+    desired: dict[Path, Path],
+    prune: bool = True,
+) -> list[Operation]:
+    """Operations that turn the links on disk into `desired`.
+
+    Without `prune`, links that are not desired are kept, e.g. when reconciling
+    the links of a single product.
+    """
+    wanted_by_dir: dict[Path, dict[str, Path]] = {}
+    if prune:
+        for part in LINKED_PARTS:
+            wanted_by_dir[coasti_base_dir / part] = {}
+    for link, target in desired.items():
+        wanted_by_dir.setdefault(link.parent, {})[link.name] = target
+
+    ops: list[Operation] = []
+    for directory, wanted in wanted_by_dir.items():
+        existing = _scan(directory)
+        if existing is None:
+            if wanted:
+                ops.append(Operation("mkdir", directory))
+            existing = {}
+
+        for name, target in sorted(wanted.items()):
+            link = directory / name
+            if (e := existing.get(name)) is None:
+                ops.append(Operation("create", link, target))
+            elif not e.is_symlink:
+                ops.append(Operation("conflict", link, target))
+            elif not _same_target(link, e.link_target, target):
+                ops.append(Operation("fix", link, target))
+
+        if not prune:
+            continue
+        part = directory.relative_to(coasti_base_dir).as_posix()
+        for name, e in sorted(existing.items()):
+            if name in wanted or not e.is_symlink or e.link_target is None:
+                continue
+            # only links that look like ours, into the same part of a product
+            if Path(e.link_target).as_posix().endswith(f"/{part}"):
+                ops.append(Operation("delete", directory / name))
+    return ops
+
+
+def apply(ops: Iterable[Operation]) -> int:
+    """Apply `ops`, logging each. Returns the number of failed operations."""
+    failed = 0
+    for op in ops:
+        if op.action == "conflict":
+            log.warning(f"Not replacing {str(op.path)}, it is not a symlink")
+            failed += 1
+            continue
+        try:
+            _apply(op)
+        except OSError as e:
+            failed += 1
+            if sys.platform == "win32":
+                log.info(
+                    "Cannot create symlinks on Windows "
+                    f"without admin permissions ({str(op.path)})"
+                )
+            else:
+                log.error(f"Failed to {op}: {e}")
+    return failed
+
+
+def _apply(op: Operation) -> None:
+    log.debug(f"Reconcile: {op}")
+    if op.action == "mkdir":
+        op.path.mkdir(parents=True, exist_ok=True)
+    elif op.action == "create":
+        assert op.target is not None
+        op.path.symlink_to(op.target)
+    elif op.action == "fix":
+        # swap in a new link, so the path never dangles or disappears
+        assert op.target is not None
+        tmp = op.path.with_name(f".{op.path.name}.coasti-tmp")
+        tmp.unlink(missing_ok=True)
+        tmp.symlink_to(op.target)
+        tmp.replace(op.path)
+    elif op.action == "delete":
+        op.path.unlink()
+
+
+def _scan(directory: Path) -> dict[str, _Existing] | None:
+    """Entries of `directory` (None if missing), reading link targets."""
+    try:
+        with os.scandir(directory) as it:
+            return {
+                e.name: _Existing(
+                    is_symlink=e.is_symlink(),
+                    link_target=str(Path(e.path).readlink())
+                    if e.is_symlink()
+                    else None,
+                )
+                for e in it
+            }
+    except FileNotFoundError:
+        return None
+
+
+def _same_target(link: Path, actual: str | None, target: Path) -> bool:
+    if actual is None:
+        return False
+    # relative links are relative to the directory of the link
+    actual_abs = os.path.normpath(link.parent / actual)
+    return actual_abs == os.path.normpath(target)
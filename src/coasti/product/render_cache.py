@@ -0,0 +1,237 @@
+"""
+Cache of rendered template versions, for `copier update`.
+
+To find local changes, `copier update` clones the installed template version
+once more and renders it into a temp dir (the "old copy"), which it diffs
+against the product. That render only depends on the template repo, its
+commit, the answers and the excluded paths, so we keep renders by a hash of
+these (`render_key`):
+
+- an install stores its fresh render, before anything changes it
+- an update stores the new version it renders, for the next update
+- an update that finds no render (e.g. after the cache was cleared) stores the
+  old copy it had to render
+
+While `cached_renders()` is active, copier's old copy is restored from the
+cache instead, which saves a clone and a render of the whole template.
+
+Renders live next to the file store (`<store>/renders/<key>`) and their files
+are linked to it, so a cached render of an installed version costs little disk
+space. The excluded paths come from the template, so `installed_render` finds
+the render of a product by its answers alone, via an index
+(`<store>/renders/.answers/<key>`). Templates with secret questions are not
+cached, their answers are not in the answers file.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, cast
+
+import copier._main as copier_main
+from copier import Worker
+from copier._user_data import load_answersfile_data
+
+from coasti.logger import log
+from coasti.store import FileStore, copy_writable, default_store_dir
+from coasti.timing import count, span
+
+from .staging import rmtree
+
+# renders kept per user, the least recently used are removed first
+MAX_RENDERS = 32
+
+_OLD_COPY_PREFIX = f"{copier_main.__name__}.old_copy."
+_NEW_COPY_PREFIX = f"{copier_main.__name__}.new_copy."
+
+# whether copier runs within cached_renders(), per thread (product)
+_active: ContextVar[bool] = ContextVar("coasti_cached_renders", default=False)
+_patched = False
+_patch_lock = threading.Lock()
+
+
+def render_key(answers: dict[str, Any], exclude: Iterable[str]) -> str | None:
+    """Hash of what a render depends on, None if the answers pin no version."""
+    src_path, commit = answers.get("_src_path"), answers.get("_commit")
+    if not src_path or not commit:
+        return None
+    data = {k: v for k, v in answers.items() if not k.startswith("_")}
+    payload = [str(src_path), str(commit), data, sorted(set(exclude))]
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def cache_dir() -> Path:
+    return default_store_dir() / "renders"
+
+
+def installed_render(answers: dict[str, Any]) -> Path | None:
+    """The cached render that an install with `answers` was made from, if any."""
+    key = render_key(answers, ())
+    if key is None:
+        return None
+    try:
+        entry = cache_dir() / (cache_dir() / ".answers" / key).read_text()
+    except FileNotFoundError:
+        return None
+    return entry if entry.is_dir() else None
+
+
+@contextmanager
+def cached_renders() -> Iterator[None]:
+    """Serve the old copy of `copier.run_update` from the cache, and fill it.
+
+    Patches copier's `Worker.run_copy` once, similar to `copier_git_injection`.
+    The old and new copy are told apart by the temp dirs copier renders them
+    into.
+    """
+    _patch_run_copy()
+    token = _active.set(True)
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def _patch_run_copy() -> None:
+    global _patched
+    with _patch_lock:
+        if _patched:
+            return
+        original_run_copy = Worker.run_copy
+
+        def run_copy(self: Worker) -> None:
+            role = _temp_copy_role(Path(self.dst_path)) if _active.get() else None
+            if role == "old" and restore(self):
+                return
+            original_run_copy(self)
+            if role is not None:
+                store(self)
+
+        Worker.run_copy = run_copy  # type: ignore[method-assign]
+        _patched = True
+
+
+def restore(worker: Worker) -> bool:
+    """Copy the cached render for `worker` into its `dst_path`, if there is one."""
+    key = render_key(worker.data, worker.exclude)
+    if key is None:
+        return False
+    entry = cache_dir() / key
+    if not entry.is_dir():
+        count("cache_miss.render")
+        return False
+
+    with span("render_cache.restore"):
+        log.debug(f"Using cached render of {worker.src_path} at {worker.vcs_ref}")
+        shutil.copytree(
+            entry,
+            worker.dst_path,
+            symlinks=True,
+            dirs_exist_ok=True,
+            # copier commits and edits the old copy
+            copy_function=copy_writable,
+        )
+    count("cache_hit.render")
+    os.utime(entry)  # for pruning, least recently used
+    return True
+
+
+def store(worker: Worker) -> None:
+    """Keep the render that `worker` just made, unless already cached."""
+    dst_path = Path(worker.dst_path)
+    if worker.template.secret_questions:
+        return
+    answers = load_answersfile_data(dst_path, worker.answers_relpath)
+    key = render_key(answers, [*worker.template.exclude, *worker.exclude])
+    if key is None:
+        return
+    entry = cache_dir() / key
+    if not entry.exists():
+        with span("render_cache.store") as attrs:
+            if not save_tree(dst_path, entry, stats=attrs):
+                return
+        log.debug(f"Cached render of {answers['_src_path']} at {answers['_commit']}")
+        prune(cache_dir())
+    _index(answers, key)
+
+
+def _index(answers: dict[str, Any], key: str) -> None:
+    """Make the render `key` the `installed_render` of `answers`."""
+    index = cache_dir() / ".answers"
+    index.mkdir(exist_ok=True)
+    path = index / cast(str, render_key(answers, ()))
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    tmp.write_text(key)
+    tmp.replace(path)
+
+
+def save_tree(src: Path, entry: Path, stats: dict | None = None) -> bool:
+    """Copy the render at `src` (without `.git`) to the cache entry `entry`.
+
+    The copy is complete or missing, never partial. Files are linked to the
+    file store, `stats` gets the counts of `FileStore.link_tree`.
+    """
+    tmp = entry.with_name(f".{entry.name}.{uuid.uuid4().hex}")
+    try:
+        shutil.copytree(
+            src,
+            tmp,
+            symlinks=True,
+            copy_function=copy_writable,
+            ignore=lambda d, names: [".git"] if Path(d) == src else [],
+        )
+        files = [
+            (Path(root) / name).relative_to(tmp).as_posix()
+            for root, _, names in os.walk(tmp)
+            for name in names
+        ]
+        linked = FileStore().link_tree(tmp, files)
+        if stats is not None:
+            stats.update(linked)
+        tmp.rename(entry)
+        return True
+    except OSError as e:
+        log.debug(f"Could not cache render of {str(src)}: {e}")
+        return False
+    finally:
+        rmtree(tmp, missing_ok=True)
+
+
+def prune(root: Path, keep: int = MAX_RENDERS) -> None:
+    """Remove all but the `keep` most recently used renders in `root`."""
+    try:
+        entries = [e for e in os.scandir(root) if not e.name.startswith(".")]
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for e in entries[keep:]:
+        log.debug(f"Removing cached render {e.name}")
+        rmtree(Path(e.path), missing_ok=True)
+
+    index = root / ".answers"
+    if index.is_dir():
+        for e in os.scandir(index):
+            path = Path(e.path)
+            if not e.name.startswith(".") and not (root / path.read_text()).is_dir():
+                path.unlink(missing_ok=True)
+
+
+def _temp_copy_role(dst_path: Path) -> str | None:
+    """Which temp copy of `copier update` renders into `dst_path`, if any."""
+    for path in (dst_path, *dst_path.parents):
+        if path.name.startswith(_OLD_COPY_PREFIX):
+            return "old"
+        if path.name.startswith(_NEW_COPY_PREFIX):
+            return "new"
+    return None
@@ -0,0 +1,237 @@
+"""
+Staged installs and updates, with rollback.
+
+A product dir (`products/<id>`) is a symlink to one of its versions,
+`products/.<id>.versions/<n>`. Copier renders a new version at its final path
+next to the live one, and only a complete render goes live, by replacing the
+symlink in one atomic rename. The replaced version is kept, linked as
+`products/.<id>.previous`, so a rollback is one more flip. Other versions are
+removed on the next install or update.
+
+Runtime state (`data/`, `logs/`) is not part of a version. It lives in
+`products/.<id>.runtime`, and each version links its `data` and `logs` there.
+Entries that a new version renders into them (e.g. a placeholder) are added if
+missing, the live ones win.
+
+Nothing of the live product is moved: the product path, and the links into it
+from the coasti dir, never dangle, and running jobs stay in the version they
+started in. An interrupted install or update leaves an unused version, which
+the next one removes.
+
+Since copier renders at the final path, absolute paths that template tasks
+write (e.g. into a virtualenv) stay valid as long as the version is kept. An
+update starts from a copy of the live version, so its tasks have to rewrite
+files with such paths, as a fresh install does.
+
+Product dirs of earlier coasti versions (plain dirs) become version `0` on their
+first staged install or update. Only this moves runtime state.
+
+```
+with staged(dst_path, snapshot=True) as version_path:
+    copier.run_update(dst_path=version_path, ...)
+```
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from coasti.logger import log
+from coasti.store import copy_writable
+from coasti.timing import count, span
+
+# state of a running product, not part of a template version
+RUNTIME_PARTS = ("data", "logs")
+
+# the version of a product dir from before versions
+_ADOPTED = "0"
+
+
+def versions_path(dst_path: Path) -> Path:
+    return dst_path.with_name(f".{dst_path.name}.versions")
+
+
+def previous_path(dst_path: Path) -> Path:
+    return dst_path.with_name(f".{dst_path.name}.previous")
+
+
+def runtime_path(dst_path: Path) -> Path:
+    return dst_path.with_name(f".{dst_path.name}.runtime")
+
+
+def current_version(link: Path) -> Path | None:
+    """The version that `link` (a product dir, or previous) points to."""
+    if not link.is_symlink():
+        return None
+    return Path(os.path.normpath(link.parent / link.readlink()))
+
+
+@contextmanager
+def staged(dst_path: Path, snapshot: bool = False) -> Iterator[Path]:
+    """
+    Yield the path of a new version of `dst_path`, make it live if no exception.
+
+    The path does not exist yet. With `snapshot`, it starts as a copy of the
+    live version (without runtime parts) committed to a throwaway git repo,
+    which is what `copier update` needs to find local changes.
+    """
+    _adopt(dst_path)
+    remove_unused_versions(dst_path)
+    versions = versions_path(dst_path)
+    versions.mkdir(exist_ok=True)
+    numbers = [int(e.name) for e in os.scandir(versions) if e.name.isdigit()]
+    version = versions / str(max(numbers, default=0) + 1)
+
+    if snapshot:
+        with span("product.snapshot"):
+            live = current_version(dst_path) or dst_path
+            shutil.copytree(
+                live,
+                version,
+                symlinks=True,
+                # linked files of the store are read-only, copier writes to them
+                copy_function=copy_writable,
+                ignore=lambda d, names: RUNTIME_PARTS if Path(d) == live else (),
+            )
+            _git_snapshot(version)
+
+    try:
+        yield version
+    except BaseException:
+        log.debug(f"Discarding new version {str(version)}")
+        rmtree(version, missing_ok=True)
+        raise
+
+    if snapshot:
+        rmtree(version / ".git")
+    with span("product.swap"):
+        swap_in(dst_path, version)
+
+
+def swap_in(dst_path: Path, version: Path) -> None:
+    """Make `version` the live product, keeping the current one as previous."""
+    _link_runtime_parts(version, runtime_path(dst_path))
+    current = current_version(dst_path)
+    _flip(dst_path, version)
+    if current is not None:
+        _flip(previous_path(dst_path), current)
+    remove_unused_versions(dst_path)
+    log.debug(f"Swapped in new version of {str(dst_path)}")
+
+
+def rollback(dst_path: Path) -> None:
+    """Swap the live and the previous version of a product.
+
+    Rolling back twice restores the version before the rollback.
+    """
+    previous = previous_path(dst_path)
+    target = current_version(previous)
+    current = current_version(dst_path)
+    if target is None or current is None or not target.is_dir():
+        raise FileNotFoundError(f"No previous version at {str(previous)}")
+    _flip(dst_path, target)
+    _flip(previous, current)
+
+
+def remove_unused_versions(dst_path: Path) -> None:
+    """Remove versions that are neither live nor previous, e.g. failed renders."""
+    keep = {current_version(dst_path), current_version(previous_path(dst_path))}
+    versions = versions_path(dst_path)
+    if not os.path.lexists(dst_path) and (versions / _ADOPTED).is_dir():
+        # adopting the product dir was interrupted
+        _link_runtime_parts(versions / _ADOPTED, runtime_path(dst_path))
+        _flip(dst_path, versions / _ADOPTED)
+        keep.add(versions / _ADOPTED)
+    if not versions.is_dir():
+        return
+    for e in os.scandir(versions):
+        if Path(os.path.normpath(e.path)) not in keep:
+            log.debug(f"Removing unused version {e.path}")
+            rmtree(Path(e.path))
+    # links of interrupted flips
+    for link in (dst_path, previous_path(dst_path)):
+        for tmp in link.parent.glob(f".{link.name}.*.tmp"):
+            tmp.unlink(missing_ok=True)
+
+
+def _adopt(dst_path: Path) -> None:
+    """Turn a plain product dir into version 0, with linked runtime parts."""
+    if dst_path.is_symlink() or not dst_path.is_dir():
+        return
+    runtime = runtime_path(dst_path)
+    if not any(e.name not in RUNTIME_PARTS for e in os.scandir(dst_path)):
+        # nothing installed, e.g. only logs written
+        _link_runtime_parts(dst_path, runtime)
+        rmtree(dst_path)
+        return
+    log.info(f"Moving {str(dst_path)} into {str(versions_path(dst_path))}")
+    adopted = versions_path(dst_path) / _ADOPTED
+    adopted.parent.mkdir(exist_ok=True)
+    dst_path.rename(adopted)
+    _link_runtime_parts(adopted, runtime)
+    _flip(dst_path, adopted)
+
+
+def _link_runtime_parts(version: Path, runtime: Path) -> None:
+    """Link the data and logs of `version` to the product's `runtime` dir.
+
+    What the version has of them is moved there first, without replacing
+    entries that are already there.
+    """
+    for part in RUNTIME_PARTS:
+        path, shared = version / part, runtime / part
+        if path.is_symlink() or (path.exists() and not path.is_dir()):
+            continue
+        if path.is_dir() and shared.is_dir():
+            for entry in os.scandir(path):
+                if not os.path.lexists(shared / entry.name):
+                    Path(entry.path).rename(shared / entry.name)
+            rmtree(path)
+        elif path.is_dir():
+            runtime.mkdir(exist_ok=True)
+            path.rename(shared)
+        if shared.is_dir():
+            target = os.path.relpath(shared, version)
+            path.symlink_to(target, target_is_directory=True)
+
+
+def _flip(link: Path, target: Path) -> None:
+    """Point `link` to `target`, in one atomic rename."""
+    tmp = link.with_name(f".{link.name}.{uuid.uuid4().hex}.tmp")
+    tmp.symlink_to(os.path.relpath(target, link.parent), target_is_directory=True)
+    try:
+        tmp.replace(link)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _git_snapshot(path: Path) -> None:
+    git = ["git", "-c", "user.name=coasti", "-c", "user.email=coasti@localhost"]
+    commit = ["commit", "--quiet", "--no-verify", "--allow-empty", "-m", "snapshot"]
+    for args in (["init", "--quiet"], ["add", "--all"], commit):
+        with span(f"git.{args[0]}"):
+            count("git_commands")
+            subprocess.run([*git, *args], cwd=path, check=True, capture_output=True)
+
+
+def rmtree(path: Path, missing_ok: bool = False) -> None:
+    """Remove a tree, including read-only files (e.g. .git objects on Windows)."""
+    if missing_ok and not path.exists():
+        return
+
+    def make_writable_and_retry(func, p, _exc):
+        Path(p).chmod(stat.S_IWRITE | stat.S_IRWXU)
+        func(p)
+
+    if sys.version_info >= (3, 12):
+        shutil.rmtree(path, onexc=make_writable_and_retry)
+    else:
+        shutil.rmtree(path, onerror=make_writable_and_retry)
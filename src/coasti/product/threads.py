@@ -0,0 +1,192 @@
+"""
+Run copier in several threads at once, one product per thread.
+
+Copier keeps some state per process, which concurrent installs would share:
+
+- `with local.cwd(path)` (plumbum) changes the working dir of the process,
+  and git commands run wherever another thread last changed it to
+- template tasks run in that working dir, with env vars set by `local.env()`
+- the update step of `copier update` also opens files relative to it
+- questions are prompted on the one terminal we have
+
+`thread_safe_copier()` patches these, for runs with more than one job (until
+`restore_copier()`): the working dir of plumbum becomes a context variable
+(each thread has its own, the process' stays as it is). Prompts, tasks and
+the update step (`Worker._apply_update`, which renders the old and new
+version, and applies their diff) of different products take turns, the
+latter with the working dir of the process. Clones, renders of installs and
+everything coasti does around copier run concurrently.
+
+Auth (`copier_git_injection`) and the render cache (`cached_renders`) are
+per thread already.
+
+The patches reach into internals of copier, so they are only applied to the
+copier versions they were tested with (`TESTED_COPIER_VERSIONS`). With any
+other version, products are installed one at a time.
+"""
+
+from __future__ import annotations
+
+import errno
+import importlib.metadata
+import os
+import stat
+import subprocess
+import threading
+import types
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from coasti.logger import log
+
+# minor versions of copier that the patches are known to work with
+TESTED_COPIER_VERSIONS = ("9.12",)
+
+_cwd: ContextVar[str | None] = ContextVar("coasti_plumbum_cwd", default=None)
+# whether this context may change the working dir of the process
+_owns_process_cwd: ContextVar[bool] = ContextVar(
+    "coasti_owns_process_cwd", default=False
+)
+# (owner, attribute, original value) of each patch, while they are applied
+_originals: list[tuple[object, str, object]] = []
+_patch_lock = threading.Lock()
+
+# one product at a time asks questions, runs its tasks, or applies an update
+_prompt_lock = threading.RLock()
+_tasks_lock = threading.RLock()
+_process_cwd_lock = threading.RLock()
+
+
+def copier_version_tested() -> bool:
+    version = importlib.metadata.version("copier")
+    return ".".join(version.split(".")[:2]) in TESTED_COPIER_VERSIONS
+
+
+def thread_safe_copier() -> bool:
+    """Patch copier and plumbum, so products can be installed in threads.
+
+    Returns False, and patches nothing, if this copier version is untested.
+    """
+    with _patch_lock:
+        if _originals:
+            return True
+        if not copier_version_tested():
+            version = importlib.metadata.version("copier")
+            log.warning(
+                f"Installing products one at a time, concurrent installs are not "
+                f"tested with copier {version}"
+            )
+            return False
+
+        import copier._main as copier_main
+        import dunamai
+        from copier._main import Worker
+        from plumbum.lib import StaticProperty
+        from plumbum.machines.local import LocalMachine, local
+        from plumbum.path.local import LocalPath, LocalWorkdir
+
+        class ContextWorkdir(LocalWorkdir):
+            """`local.cwd`, with a working dir per context instead of process."""
+
+            def __new__(cls):
+                return LocalPath.__new__(cls, _cwd.get() or str(Path.cwd()))
+
+            def chdir(self, newdir):
+                path = Path(str(self), str(newdir))
+                # fail like os.chdir would
+                if not stat.S_ISDIR(path.stat().st_mode):
+                    raise NotADirectoryError(
+                        errno.ENOTDIR, os.strerror(errno.ENOTDIR), str(path)
+                    )
+                _cwd.set(os.path.normpath(path))
+                if _owns_process_cwd.get():
+                    os.chdir(path)
+                return self.__class__()
+
+            @contextmanager
+            def __call__(self, newdir) -> Iterator[ContextWorkdir]:
+                previous = _cwd.get()
+                workdir = self.chdir(newdir)
+                try:
+                    yield workdir
+                finally:
+                    _cwd.set(previous)
+                    if previous is not None and _owns_process_cwd.get():
+                        os.chdir(previous)
+
+        def run_in_cwd(*args, **kwargs):
+            # copier runs tasks where `local.cwd` points, without a `cwd` arg
+            kwargs.setdefault("cwd", str(local.cwd))
+            return subprocess.run(*args, **kwargs)
+
+        task_subprocess = types.ModuleType(subprocess.__name__)
+        task_subprocess.__dict__.update(vars(subprocess))
+        task_subprocess.run = run_in_cwd  # type: ignore[attr-defined]
+
+        original_from_git = dunamai.Version.__dict__["from_git"].__func__
+
+        @wraps(original_from_git)
+        def from_git(cls, *args, path: Path | None = None, **kwargs):
+            # copier reads template versions in `local.cwd`, from the process cwd
+            path = Path(str(local.cwd)) if path is None else path
+            return original_from_git(cls, *args, path=path, **kwargs)
+
+        patches: list[tuple[object, str, object]] = [
+            (LocalMachine, "cwd", StaticProperty(ContextWorkdir)),
+            (copier_main, "subprocess", task_subprocess),
+            (dunamai.Version, "from_git", classmethod(from_git)),
+            (Worker, "_ask", _serialized(Worker._ask, _prompt_lock)),
+            (
+                Worker,
+                "_execute_tasks",
+                _serialized(Worker._execute_tasks, _tasks_lock),
+            ),
+            (Worker, "_apply_update", _with_process_cwd(Worker._apply_update)),
+        ]
+        for owner, name, patched in patches:
+            # from the class dict, to restore descriptors as they were
+            original = vars(owner)[name]
+            _originals.append((owner, name, original))
+            setattr(owner, name, patched)
+        return True
+
+
+def restore_copier() -> None:
+    """Undo the patches of `thread_safe_copier`."""
+    with _patch_lock:
+        while _originals:
+            owner, name, original = _originals.pop()
+            setattr(owner, name, original)
+
+
+def _serialized(method, lock: AbstractContextManager):
+    @wraps(method)
+    def serialized(*args, **kwargs):
+        with lock:
+            return method(*args, **kwargs)
+
+    return serialized
+
+
+def _with_process_cwd(method):
+    """Run `method` alone, with the process in the working dir of this context."""
+
+    @wraps(method)
+    def with_process_cwd(*args, **kwargs):
+        with _process_cwd_lock:
+            process_cwd = Path.cwd()
+            cwd = _cwd.get() or str(process_cwd)
+            owner_token = _owns_process_cwd.set(True)
+            cwd_token = _cwd.set(cwd)
+            os.chdir(cwd)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                _owns_process_cwd.reset(owner_token)
+                _cwd.reset(cwd_token)
+                os.chdir(process_cwd)
+
+    return with_process_cwd
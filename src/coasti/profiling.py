@@ -0,0 +1,147 @@
+"""
+Profile a cli command, e.g. `coasti --profile product update my_product`.
+
+Two modes:
+- `cprofile` (default): deterministic, exact call counts, but only sees the main
+  thread and adds noticeable overhead to function-call heavy code.
+- `sample`: a background thread samples the stacks of all threads every few
+  milliseconds. Low overhead and sees worker threads, but statistical.
+
+Results are saved under `logs/coasti/` of the workspace (`.pstats` for cProfile,
+collapsed stacks `.folded` for sampling, which speedscope and flamegraph.pl read),
+and the top functions by cumulative time are logged.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Literal
+
+from platformdirs import user_log_dir
+
+from coasti.logger import log
+
+ProfileMode = Literal["cprofile", "sample"]
+
+TOP_N = 25
+
+
+class CommandProfiler:
+    """Profile everything between `start()` and `finish()`."""
+
+    def __init__(
+        self,
+        mode: ProfileMode = "cprofile",
+        out_path: Path | None = None,
+        interval: float = 0.005,
+    ) -> None:
+        self.mode = mode
+        self.out_path = out_path
+        self.interval = interval
+        self.started = time.time()
+        self._profile: cProfile.Profile | None = None
+        self._sampler: _StackSampler | None = None
+
+    def start(self) -> None:
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _StackSampler(self.interval)
+            self._sampler.start()
+
+    def finish(self, log_dir: Path | None = None) -> Path:
+        """Stop profiling, save the results and log the top functions.
+
+        `log_dir` is the workspace log dir, used when no explicit path was given.
+        """
+        path = self.out_path or self._default_path(log_dir)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(path)
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=stream)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_N)
+            report = stream.getvalue().strip()
+        elif self._sampler is not None:
+            self._sampler.stop()
+            path.write_text(self._sampler.folded())
+            report = self._sampler.report(TOP_N)
+        else:
+            raise RuntimeError("Profiler was not started")
+
+        log.info(f"Profile saved to {str(path)}\n{report}")
+        return path
+
+    def _default_path(self, log_dir: Path | None) -> Path:
+        if log_dir is None:
+            # not in a workspace (e.g. `coasti version`)
+            log_dir = Path(user_log_dir("coasti"))
+        stamp = datetime.fromtimestamp(self.started).strftime("%Y%m%d-%H%M%S")
+        suffix = ".pstats" if self.mode == "cprofile" else ".folded"
+        return log_dir / f"profile-{stamp}-{os.getpid()}{suffix}"
+
+
+class _StackSampler(threading.Thread):
+    """Samples the stacks of all other threads at a fixed interval."""
+
+    def __init__(self, interval: float) -> None:
+        super().__init__(name="coasti-profiler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                f: FrameType | None = frame
+                while f is not None:
+                    code = f.f_code
+                    stack.append(
+                        f"{code.co_name} ({Path(code.co_filename).name}:"
+                        f"{code.co_firstlineno})"
+                    )
+                    f = f.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def folded(self) -> str:
+        """Collapsed stacks, one `frame;frame;frame count` per line."""
+        return "\n".join(
+            f"{';'.join(stack)} {n}" for stack, n in self.stacks.most_common()
+        )
+
+    def report(self, top_n: int) -> str:
+        """Functions with the most samples on the stack (cumulative)."""
+        cumulative: Counter[str] = Counter()
+        for stack, n in self.stacks.items():
+            for frame in set(stack):
+                cumulative[frame] += n
+        total = sum(self.stacks.values()) or 1
+        lines = [f"{self.samples} samples, every {self.interval * 1000:.0f} ms"]
+        lines += [
+            f"{100 * n / total:6.1f}%  {frame}"
+            for frame, n in cumulative.most_common(top_n)
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,131 @@
+"""
+Live progress of operations on many products.
+
+One row per product, showing its current phase, elapsed time and throughput
+(bytes fetched and written per second). Phases come from the timing spans
+(`coasti.timing`), so anything that is timed also shows up here.
+
+Rendering happens at a fixed, low rate on rich's refresh thread, and log lines
+are printed above the live view (we share the logger's console). Not on a
+terminal, the view is disabled and only the log lines remain.
+
+```
+with ProductProgress(pids, "install") as progress:
+    for pid in pids:
+        with progress.track(pid):
+            ...
+```
+"""
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from rich.progress import (
+    Progress,
+    SpinnerColumn,
+    TaskID,
+    TextColumn,
+    TimeElapsedColumn,
+)
+
+from coasti import timing
+from coasti.logger import current_product, flush_logging, get_console
+from coasti.timing import format_bytes
+
+REFRESH_PER_SECOND = 4
+
+
+class ProductProgress:
+    """Live view of a batch of product operations."""
+
+    def __init__(self, pids: list[str], operation: str) -> None:
+        self.pids = pids
+        self.operation = operation
+        console = get_console()
+        # a single product does not need a table, the log says it all
+        self.enabled = console.is_terminal and len(pids) > 1
+        self._lock = threading.Lock()
+        self._tasks: dict[str, TaskID] = {}
+        self._bytes: dict[str, int] = {}
+        self._progress = Progress(
+            SpinnerColumn(finished_text=" "),
+            TextColumn("[bold]{task.description:<24}"),
+            TextColumn("{task.fields[phase]:<20}"),
+            TimeElapsedColumn(),
+            TextColumn("{task.fields[throughput]}"),
+            console=console,
+            refresh_per_second=REFRESH_PER_SECOND,
+            disable=not self.enabled,
+        )
+
+    def __enter__(self) -> ProductProgress:
+        if not self.enabled:
+            return self
+        for pid in self.pids:
+            self._tasks[pid] = self._progress.add_task(
+                pid, start=False, total=1, phase="pending", throughput=""
+            )
+        flush_logging()  # pending log lines go above, not into, the live view
+        self._progress.start()
+        timing.listeners.append(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if not self.enabled:
+            return
+        timing.listeners.remove(self)
+        flush_logging()
+        self._progress.stop()
+
+    @contextmanager
+    def track(self, pid: str) -> Iterator[None]:
+        """Show the enclosed block as the operation on product `pid`."""
+        if not self.enabled:
+            yield
+            return
+
+        task = self._tasks[pid]
+        self._progress.start_task(task)
+        self._progress.update(task, phase=self.operation)
+        try:
+            yield
+        except BaseException:
+            self._progress.update(task, phase="[red]failed")
+            raise
+        else:
+            self._progress.update(task, completed=1, phase="[green]done")
+        finally:
+            self._progress.stop_task(task)
+
+    # ------------------------------ SpanListener ----------------------------- #
+
+    def span_started(self, name: str, attrs: dict[str, Any]) -> None:
+        if (task := self._task_of_current_product()) is not None:
+            self._progress.update(task, phase=name)
+
+    def span_finished(self, name: str, attrs: dict[str, Any]) -> None:
+        if "bytes_written" in attrs:
+            self._add_bytes(attrs["bytes_written"])
+
+    def counted(self, name: str, n: int) -> None:
+        if name == "bytes_fetched":
+            self._add_bytes(n)
+
+    def _add_bytes(self, n: int) -> None:
+        pid = current_product()
+        if (task := self._task_of_current_product()) is None or pid is None:
+            return
+        with self._lock:
+            self._bytes[pid] = self._bytes.get(pid, 0) + n
+            total = self._bytes[pid]
+        elapsed = self._progress.tasks[task].elapsed or 0
+        rate = f"{format_bytes(total / elapsed)}/s" if elapsed > 0 else ""
+        self._progress.update(task, throughput=f"{format_bytes(total)}  {rate}")
+
+    def _task_of_current_product(self) -> TaskID | None:
+        pid = current_product()
+        return self._tasks.get(pid) if pid is not None else None
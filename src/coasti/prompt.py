@@ -13,6 +13,7 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Generic, TypeVar, cast
 
+import copier._vcs as copier_vcs
 import questionary  # used by copier, we mimic
 from copier import JSONSerializable, Phase, Worker
 from copier._types import MISSING
@@ -20,6 +21,9 @@ from copier._user_data import AnswersMap, Question
 from jinja2.sandbox import SandboxedEnvironment
 from pydantic import ValidationError
 
+from coasti.git.sparse import fetch_template_metadata
+from coasti.logger import flush_logging
+
 # -------------------------- From dict of questions -------------------------- #
 
 T = TypeVar("T")
@@ -229,6 +233,7 @@ def _ask_questions_like_copier(
         else:
             # Use the same machinery as Copier: Question builds a questionary structure.
             structure = q.get_questionary_structure()
+            flush_logging()  # so pending log lines do not end up in the prompt
             try:
                 # questionary returns {var_name: answer}
                 result = questionary.unsafe_prompt(
@@ -349,6 +354,10 @@ def prompt_like_copier_from_template(src_path: str, **kwargs) -> PromptResponse:
     - src_path : str
         needs to contain a copier.yml
 
+    For remote git templates, we do not let copier clone the whole repo. Instead,
+    only `copier.yml` and its includes are fetched at `vcs_ref` (and cached by
+    commit), see `coasti.git.sparse`.
+
     ```python
     prompt_like_copier_from_template(
         src_path = "./template_product"
@@ -356,8 +365,14 @@ def prompt_like_copier_from_template(src_path: str, **kwargs) -> PromptResponse:
     ```
     """
 
+    if _is_remote_repo(src_path):
+        src_path = str(
+            fetch_template_metadata(src_path, vcs_ref=kwargs.pop("vcs_ref", None))
+        )
+
     class AnswerWorker(Worker):
         def get_answers(self):
+            flush_logging()
             with Phase.use(Phase.PROMPT):
                 self._ask()
 
@@ -373,11 +388,18 @@ def prompt_like_copier_from_template(src_path: str, **kwargs) -> PromptResponse:
         return answers
 
 
+def _is_remote_repo(src_path: str) -> bool:
+    """True for git urls that copier would have to clone over the network."""
+    if Path(src_path).expanduser().exists():
+        return False
+    return copier_vcs.get_repo(src_path) is not None
+
+
 # ---------------------------------- Helper ---------------------------------- #
 
 
 def tree(dir_path: Path, prefix: str = ""):
-    """A recursive generator, given a directory Path object
+    """A generator, given a directory Path object
     will yield a visual tree structure line by line
     with each line prefixed by the same characters
 
@@ -386,21 +408,9 @@ def tree(dir_path: Path, prefix: str = ""):
         print(line)
     ```
 
-    https://stackoverflow.com/questions/9727673/list-directory-tree-structure-in-python
+    See `coasti.workspace.walk.tree_lines` for depth limits, ignores and sizes.
     """
-    # prefix components:
-    space = "    "
-    branch = "│   "
-    # pointers:
-    tee = "├── "
-    last = "└── "
-
-    contents = list(dir_path.iterdir())
-    # contents each get pointers that are ├── with a final └── :
-    pointers = [tee] * (len(contents) - 1) + [last]
-    for pointer, path in zip(pointers, contents):
-        yield prefix + pointer + path.name
-        if path.is_dir():  # extend the prefix and recurse:
-            extension = branch if pointer == tee else space
-            # i.e. space because last, └── , above so no more |
-            yield from tree(path, prefix=prefix + extension)
+    # imported here, the workspace package depends on this module
+    from coasti.workspace.walk import tree_lines
+
+    yield from tree_lines(dir_path, ignore=(), prefix=prefix)
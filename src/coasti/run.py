@@ -0,0 +1,326 @@
+"""
+`coasti run`
+
+Runs products, each as defined by the `run` section of its `coasti.yml`:
+
+```yaml
+run:
+  command: ./run_product.sh   # run by sh, or a list of arguments
+  depends_on: [other_product] # started after these succeeded
+  timeout: 3600               # seconds, the process group is killed after
+  cpu_seconds: 7200           # limits of the process (POSIX only)
+  memory_mb: 4096
+```
+
+A product without `coasti.yml` runs its `run_product.sh`, if it has one.
+
+Products run concurrently on a bounded pool, in the order of their dependencies
+(`coasti.scheduler`). Output of each run is streamed, unbuffered, into its own
+file in the product's log dir, `logs/<id>/run-<timestamp>.log`.
+
+Limits are set by `ulimit` in a `sh` wrapper around the command, instead of
+`preexec_fn`, which is not safe with threads. cgroups are not used, they need
+privileges (or delegation) that coasti usually does not have.
+
+Runs are in their own process groups, so the Ctrl-C of the terminal does not
+reach them. When coasti is interrupted (SIGINT) or terminated (SIGTERM), it
+stops all running products itself, and starts no more.
+"""
+
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import sys
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Annotated
+
+import typer
+from rich.console import Console
+from rich.table import Table
+from ruamel.yaml import YAML
+
+from coasti.logger import log, product_log_file
+from coasti.product.cli import coasti_base_dir_from_env_or_prompt
+from coasti.product.product import Product, ProductsYamlIO
+from coasti.scheduler import CycleError, JobResult, run_dag
+from coasti.timing import recorder, span
+
+app = typer.Typer()
+
+DEFINITION_FILE = "coasti.yml"
+DEFAULT_SCRIPT = "run_product.sh"
+DEFAULT_JOBS = 4
+
+# time between SIGTERM and SIGKILL, when a run timed out
+KILL_GRACE_SECONDS = 10
+
+# processes of the products that are running
+_live: set[subprocess.Popen] = set()
+_live_lock = threading.Lock()
+_interrupted = threading.Event()
+
+
+class RunError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class RunDefinition:
+    command: str | list[str]
+    depends_on: list[str] = field(default_factory=list)
+    timeout: float | None = None
+    cpu_seconds: int | None = None
+    memory_mb: int | None = None
+
+
+def load_run_definition(product: Product) -> RunDefinition | None:
+    """How to run `product`, None if it cannot be run."""
+    path = product.dst_path / DEFINITION_FILE
+    if path.is_file():
+        config = YAML(typ="safe").load(path) or {}
+        if (run := config.get("run")) is not None:
+            unknown = set(run) - set(RunDefinition.__dataclass_fields__)
+            if unknown or "command" not in run:
+                raise ValueError(
+                    f"Invalid run section in {str(path)}: needs a command, "
+                    f"unknown keys {sorted(unknown)}"
+                )
+            return RunDefinition(**run)
+    if (product.dst_path / DEFAULT_SCRIPT).is_file():
+        return RunDefinition(command=f"./{DEFAULT_SCRIPT}")
+    return None
+
+
+@app.command()
+def run(
+    ctx: typer.Context,
+    pids: Annotated[
+        list[str] | None,
+        typer.Argument(
+            help="Ids of the products to run, with their dependencies. Default: "
+            "all that can be run.",
+        ),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option("--jobs", "-j", min=1, help="Products to run concurrently."),
+    ] = DEFAULT_JOBS,
+    timeout: Annotated[
+        float | None,
+        typer.Option(
+            "--timeout", help="Seconds per product, unless its coasti.yml says."
+        ),
+    ] = None,
+):
+    """
+    Run products concurrently, in the order of their dependencies
+
+    Exits with code 1 if any product failed or was skipped.
+    """
+    coasti_base_dir = coasti_base_dir_from_env_or_prompt(ctx.obj.get("quiet", False))
+    recorder.workspace = coasti_base_dir
+
+    yaml_io = ProductsYamlIO(coasti_base_dir)
+    definitions: dict[str, RunDefinition] = {}
+    products: dict[str, Product] = {}
+    for pid in yaml_io.product_ids:
+        product = yaml_io.get_product(pid)
+        if (definition := load_run_definition(product)) is not None:
+            definitions[pid] = definition
+            products[pid] = product
+
+    try:
+        selected = _with_dependencies(pids or list(definitions), definitions)
+    except ValueError as e:
+        log.error(e)
+        raise typer.Exit(code=1)
+
+    def job(pid: str):
+        definition = definitions[pid]
+        return lambda: run_product(
+            products[pid], definition, definition.timeout or timeout
+        )
+
+    try:
+        with span("workspace.run", products=len(selected)), _stop_runs_on_signals():
+            results = run_dag(
+                {pid: job(pid) for pid in selected},
+                {pid: definitions[pid].depends_on for pid in selected},
+                max_workers=jobs,
+            )
+    except (CycleError, ValueError) as e:
+        log.error(e)
+        raise typer.Exit(code=1)
+
+    _print_table(results)
+    for result in results.values():
+        if result.status == "failed":
+            log.error(f"Failed to run {result.id}: {result.error}")
+        elif result.status == "skipped":
+            log.warning(f"Skipped {result.id}, a dependency failed")
+    if any(r.status != "ok" for r in results.values()):
+        raise typer.Exit(code=1)
+
+
+def run_product(
+    product: Product, definition: RunDefinition, timeout: float | None = None
+) -> None:
+    """Run `product` to completion, with its output in its log dir.
+
+    Raises `RunError` if it fails or times out.
+    """
+    product.log_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    output_path = product.log_dir / f"run-{stamp}.log"
+
+    with (
+        product_log_file(product.id, product.log_dir),
+        span("product.run", product=product.id) as attrs,
+        output_path.open("ab") as output,
+    ):
+        log.info(f"Running {product.id}, output in {str(output_path)}")
+        with _live_lock:
+            if _interrupted.is_set():
+                raise RunError(f"Not running {product.id}, coasti was interrupted")
+            proc = subprocess.Popen(
+                _command(definition),
+                cwd=product.dst_path,
+                stdin=subprocess.DEVNULL,
+                stdout=output,
+                stderr=subprocess.STDOUT,
+                env={
+                    **os.environ,
+                    "COASTI_BASE_DIR": str(product.coasti_base_dir),
+                    "COASTI_PRODUCT": product.id,
+                },
+                # own process group, so a timeout kills children too
+                start_new_session=sys.platform != "win32",
+            )
+            _live.add(proc)
+        try:
+            code = proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _terminate(proc)
+            attrs["exit_code"] = proc.returncode
+            raise RunError(f"{product.id} timed out after {timeout} seconds")
+        finally:
+            with _live_lock:
+                _live.discard(proc)
+        attrs["exit_code"] = code
+        if _interrupted.is_set():
+            raise RunError(f"{product.id} was stopped, coasti was interrupted")
+        if code != 0:
+            raise RunError(
+                f"{product.id} exited with code {code}, see {str(output_path)}"
+            )
+        log.info(f"{product.id} finished")
+
+
+def _command(definition: RunDefinition) -> list[str]:
+    """Arguments to run the command of `definition`, within its limits."""
+    command = definition.command
+    if sys.platform == "win32":
+        if definition.cpu_seconds or definition.memory_mb:
+            log.warning("CPU and memory limits are not supported on Windows")
+        return ["cmd", "/c", command] if isinstance(command, str) else command
+
+    args = ["sh", "-c", command] if isinstance(command, str) else command
+    limits = []
+    if definition.cpu_seconds:
+        limits.append(f"ulimit -t {int(definition.cpu_seconds)}")
+    if definition.memory_mb:
+        limits.append(f"ulimit -v {int(definition.memory_mb) * 1024}")
+    if not limits:
+        return list(args)
+    return ["sh", "-c", f'{" && ".join(limits)} && exec "$@"', "sh", *args]
+
+
+def _terminate(proc: subprocess.Popen) -> None:
+    """Stop `proc` and its children, forcefully if they do not exit in time."""
+    if sys.platform == "win32":
+        proc.kill()
+        proc.wait()
+        return
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            break
+        try:
+            proc.wait(timeout=KILL_GRACE_SECONDS)
+            break
+        except subprocess.TimeoutExpired:
+            continue
+    proc.wait()
+
+
+@contextmanager
+def _stop_runs_on_signals() -> Iterator[None]:
+    """Stop all runs on SIGINT or SIGTERM, then raise as usual."""
+    _interrupted.clear()
+    if threading.current_thread() is not threading.main_thread():
+        # handlers can only be set from the main thread
+        yield
+        return
+
+    def stop_runs(signum, frame):
+        with _live_lock:
+            _interrupted.set()
+            procs = list(_live)
+        log.warning(f"Interrupted, stopping {len(procs)} running products")
+        stopping = [threading.Thread(target=_terminate, args=(p,)) for p in procs]
+        for thread in stopping:
+            thread.start()
+        for thread in stopping:
+            thread.join()
+        if signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        raise SystemExit(128 + signum)
+
+    previous = {
+        signum: signal.signal(signum, stop_runs)
+        for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    try:
+        yield
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+def _with_dependencies(
+    pids: list[str], definitions: dict[str, RunDefinition]
+) -> list[str]:
+    """`pids` and all they (transitively) depend on."""
+    selected: list[str] = []
+    todo = list(pids)
+    while todo:
+        pid = todo.pop(0)
+        if pid in selected:
+            continue
+        if pid not in definitions:
+            raise ValueError(f"{pid} has no {DEFINITION_FILE} run section or script")
+        selected.append(pid)
+        todo.extend(definitions[pid].depends_on)
+    return selected
+
+
+def _print_table(results: dict[str, JobResult]) -> None:
+    styles = {"ok": "[green]ok[/]", "failed": "[red]failed[/]", "skipped": "skipped"}
+
+    table = Table(title="Product Runs")
+    table.add_column("Product", style="cyan", no_wrap=True)
+    table.add_column("Status")
+    table.add_column("Duration", justify="right")
+    for r in results.values():
+        duration = f"{r.duration:.1f}s" if r.status != "skipped" else "-"
+        table.add_row(r.id, styles[r.status], duration)
+
+    console = Console()
+    console.print(table)
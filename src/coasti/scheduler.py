@@ -0,0 +1,127 @@
+"""
+Run jobs with dependencies (a DAG) concurrently, on a bounded thread pool.
+
+A job starts as soon as all jobs it depends on succeeded, so the longest chain
+of dependencies (the critical path) sets the total time, not the sum of all
+jobs. Jobs whose dependencies failed are skipped. Of several ready jobs, the
+one listed first starts first.
+
+```
+results = run_dag(
+    {"a": run_a, "b": run_b},
+    depends_on={"b": ["a"]},
+    max_workers=4,
+)
+```
+"""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Callable, Iterable, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Literal
+
+JobStatus = Literal["ok", "failed", "skipped"]
+
+
+class CycleError(ValueError):
+    def __init__(self, cycle: list[str]) -> None:
+        self.cycle = cycle
+        super().__init__(f"Dependency cycle: {' -> '.join(cycle)}")
+
+
+@dataclass
+class JobResult:
+    id: str
+    status: JobStatus
+    error: BaseException | None = None
+    duration: float = 0.0
+
+
+def topological_order(depends_on: Mapping[str, Iterable[str]]) -> list[str]:
+    """Ids in `depends_on` with every id after its dependencies.
+
+    Keeps the given order where dependencies allow. Raises `CycleError`, or
+    `ValueError` for dependencies on unknown ids.
+    """
+    deps = {job: list(dict.fromkeys(d)) for job, d in depends_on.items()}
+    for job, job_deps in deps.items():
+        for dep in job_deps:
+            if dep not in deps:
+                raise ValueError(f"{job} depends on unknown {dep}")
+
+    order: list[str] = []
+    done: set[str] = set()
+    pending = list(deps)
+    while pending:
+        ready = [job for job in pending if done.issuperset(deps[job])]
+        if not ready:
+            raise CycleError(_find_cycle({job: deps[job] for job in pending}))
+        order.extend(ready)
+        done.update(ready)
+        pending = [job for job in pending if job not in done]
+    return order
+
+
+def run_dag(
+    jobs: Mapping[str, Callable[[], Any]],
+    depends_on: Mapping[str, Iterable[str]] | None = None,
+    max_workers: int | None = None,
+) -> dict[str, JobResult]:
+    """Run `jobs` concurrently, each after the jobs it depends on.
+
+    Dependencies that are not in `jobs` count as done. Returns the results in
+    topological order. Exceptions of jobs are returned, not raised.
+    """
+    depends_on = depends_on or {}
+    deps = {job: [d for d in depends_on.get(job, ()) if d in jobs] for job in jobs}
+    order = topological_order(deps)
+
+    results: dict[str, JobResult] = {}
+    started: dict[str, float] = {}
+    running: dict[Future, str] = {}
+
+    def run(job: str) -> Any:
+        started[job] = time.perf_counter()
+        return jobs[job]()
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="coasti-dag"
+    ) as pool:
+        while len(results) < len(order):
+            submitted = set(running.values())
+            for job in order:
+                if job in results or job in submitted:
+                    continue
+                statuses = [
+                    results[d].status if d in results else None for d in deps[job]
+                ]
+                if any(s in ("failed", "skipped") for s in statuses):
+                    results[job] = JobResult(job, "skipped")
+                elif all(s == "ok" for s in statuses):
+                    running[pool.submit(run, job)] = job
+            if not running:
+                continue  # only skips were left to record
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                job = running.pop(future)
+                duration = time.perf_counter() - started.get(job, time.perf_counter())
+                error = future.exception()
+                results[job] = JobResult(
+                    job, "ok" if error is None else "failed", error, duration
+                )
+
+    return {job: results[job] for job in order}
+
+
+def _find_cycle(deps: Mapping[str, list[str]]) -> list[str]:
+    """A cycle in `deps`, where every job is part of, or depends on, a cycle."""
+    path: list[str] = []
+    job = next(iter(deps))
+    while job not in path:
+        path.append(job)
+        job = next(d for d in deps[job] if d in deps)
+    return [*path[path.index(job) :], job]
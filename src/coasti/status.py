@@ -0,0 +1,244 @@
+"""
+`coasti status`
+
+Health check of all products in products.yml: installed, local modifications
+of the rendered template, symlinks into the coasti dir, and secrets.
+
+Checks run concurrently per product on a thread pool, without network access.
+Modifications are found by comparing the product with the render of its
+installed version in the `render_cache` (only files the template renders, by
+inode, size and hash, see `coasti.product.diff`). They are unknown if there is
+no cached render, e.g. after the cache was cleared.
+
+Files that are not committed to the coasti dir, the git repo that products are
+rendered into, are listed too, from a single `git status` over all product
+dirs. They do not make a product unhealthy, a fresh install is not committed
+yet.
+"""
+
+from __future__ import annotations
+
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Annotated, Any
+
+import typer
+from copier._user_data import load_answersfile_data
+from rich.console import Console
+from rich.table import Table
+
+from coasti.logger import log
+from coasti.product import render_cache
+from coasti.product.cli import coasti_base_dir_from_env_or_prompt
+from coasti.product.diff import compare_trees
+from coasti.product.product import ANSWERS_FILE, Product, ProductsYamlIO
+from coasti.timing import count, recorder, span
+
+app = typer.Typer()
+
+
+@dataclass
+class ProductStatus:
+    product: str
+    installed: bool
+    # files of the template that were changed or deleted, None if unknown
+    modified: list[str] | None
+    # uncommitted files below dst_path, None if unknown (no git repo)
+    uncommitted: list[str] | None
+    # problems with the links from the coasti dir into the product
+    link_problems: list[str]
+    # None if the product needs no secret
+    secret_ok: bool | None
+
+    @property
+    def healthy(self) -> bool:
+        return (
+            self.installed
+            and not self.modified
+            and not self.link_problems
+            and self.secret_ok is not False
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "healthy": self.healthy}
+
+
+@app.command()
+def status(
+    ctx: typer.Context,
+    as_json: Annotated[
+        bool,
+        typer.Option("--json", help="Print the status as JSON."),
+    ] = False,
+):
+    """
+    Check installed products for local modifications, broken symlinks and
+    missing secrets
+
+    Also lists files that are not committed to the coasti dir. Exits with code 1
+    if any product is not healthy.
+    """
+    coasti_base_dir = coasti_base_dir_from_env_or_prompt(ctx.obj.get("quiet", False))
+    recorder.workspace = coasti_base_dir
+
+    yaml_io = ProductsYamlIO(coasti_base_dir)
+    products = [yaml_io.get_product(pid) for pid in yaml_io.product_ids]
+    with span("workspace.status", products=len(products)):
+        statuses = product_statuses(coasti_base_dir, products)
+
+    if as_json:
+        typer.echo(json.dumps([s.as_dict() for s in statuses], indent=2))
+    else:
+        _print_table(statuses)
+
+    if not all(s.healthy for s in statuses):
+        raise typer.Exit(code=1)
+
+
+def product_statuses(
+    coasti_base_dir: Path, products: list[Product], max_workers: int | None = None
+) -> list[ProductStatus]:
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="coasti-status"
+    ) as pool:
+        # the live versions of the products, `dst_path` links to them
+        versions = [p.dst_path.resolve() for p in products]
+        git_future = pool.submit(git_changes, coasti_base_dir.resolve(), versions)
+        futures = [pool.submit(_check_product, p) for p in products]
+        uncommitted = git_future.result()
+        statuses = [f.result() for f in futures]
+
+    for s, version in zip(statuses, versions):
+        if uncommitted is not None and s.installed:
+            s.uncommitted = uncommitted.get(version)
+    return statuses
+
+
+def _check_product(product: Product) -> ProductStatus:
+    secret_ok = None
+    if product.vcs_auth_type in ("Auth Token", "SSH Key"):
+        secret_ok = product.secret_path.is_file()
+
+    installed = product.dst_path.is_dir()
+    return ProductStatus(
+        product=product.id,
+        installed=installed,
+        modified=modified_files(product) if installed else None,
+        uncommitted=None,
+        link_problems=link_problems(product),
+        secret_ok=secret_ok,
+    )
+
+
+def modified_files(product: Product) -> list[str] | None:
+    """Files of the installed template version that the product changed.
+
+    Compared with the cached render of that version, None if there is none.
+    """
+    answers = load_answersfile_data(product.dst_path, ANSWERS_FILE)
+    if (rendered := render_cache.installed_render(answers)) is None:
+        return None
+    with span("status.compare", product=product.id):
+        changes, _, _ = compare_trees(product.dst_path, rendered)
+    return [c.path for c in changes]
+
+
+def link_problems(product: Product) -> list[str]:
+    """Human readable problems with the symlinks from the coasti dir."""
+    problems = []
+    for link, target in product.expected_symlinks().items():
+        name = link.relative_to(product.coasti_base_dir).as_posix()
+        if not link.is_symlink():
+            problems.append(
+                f"{name} is not a symlink" if link.exists() else f"{name} is missing"
+            )
+        elif link.resolve() != target.resolve():
+            problems.append(f"{name} points to {str(link.readlink())}")
+    return problems
+
+
+def git_changes(repo: Path, paths: list[Path]) -> dict[Path, list[str]] | None:
+    """Changed and untracked files per path, from one `git status` in `repo`.
+
+    Paths outside `repo` get no entry. None if `repo` is not a git repo.
+    """
+    rel_paths: dict[str, Path] = {}
+    for path in paths:
+        try:
+            rel_paths[path.relative_to(repo).as_posix()] = path
+        except ValueError:
+            continue
+    if not rel_paths:
+        return {}
+
+    with span("git.status"):
+        count("git_commands")
+        try:
+            out = subprocess.run(
+                ["git", "status", "--porcelain=v1", "-z", "--untracked-files=all"]
+                + ["--", *rel_paths],
+                cwd=repo,
+                capture_output=True,
+                check=True,
+            ).stdout.decode()
+        except (OSError, subprocess.CalledProcessError) as e:
+            log.debug(f"Cannot check for changes with git: {e}")
+            return None
+
+    changes: dict[Path, list[str]] = {path: [] for path in rel_paths.values()}
+    records = iter(out.split("\0"))
+    for record in records:
+        if not record:
+            continue
+        xy, file = record[:2], record[3:]
+        if "R" in xy or "C" in xy:
+            next(records, None)  # the original path of renames and copies
+        for rel, path in rel_paths.items():
+            if file == rel or file.startswith(f"{rel}/"):
+                changes[path].append(file[len(rel) + 1 :] or file)
+                break
+    return changes
+
+
+def _print_table(statuses: list[ProductStatus]) -> None:
+    ok, bad = "[green]✓[/]", "[red]✗[/]"
+
+    table = Table(title="Product Status")
+    table.add_column("Product", style="cyan", no_wrap=True)
+    table.add_column("Installed", justify="center")
+    table.add_column("Modified")
+    table.add_column("Uncommitted")
+    table.add_column("Symlinks")
+    table.add_column("Secret", justify="center")
+
+    for s in statuses:
+        if not s.installed:
+            modified = "-"
+        elif s.modified is None:
+            modified = "unknown (no cached render)"
+        elif s.modified:
+            modified = f"{bad} {len(s.modified)} files"
+        else:
+            modified = ok
+        if not s.installed:
+            uncommitted = "-"
+        elif s.uncommitted is None:
+            uncommitted = "unknown (no git repo)"
+        elif s.uncommitted:
+            uncommitted = f"{len(s.uncommitted)} files"
+        else:
+            uncommitted = "none"
+        table.add_row(
+            s.product,
+            ok if s.installed else bad,
+            modified,
+            uncommitted,
+            "\n".join(f"{bad} {p}" for p in s.link_problems) or ok,
+            {None: "-", True: ok, False: f"{bad} missing"}[s.secret_ok],
+        )
+
+    console = Console()
+    console.print(table)
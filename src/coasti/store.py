@@ -0,0 +1,303 @@
+"""
+Content-addressed file store, shared by all workspaces of a user.
+
+Files are stored once by their sha256 (and executable bit) under
+`<user cache>/coasti/store` (or `COASTI_STORE_DIR`), read-only. Installs replace
+their copy of a file by a link to the stored one, so installing the same
+version into many workspaces costs the disk space of one:
+
+- editable files (products in workspaces) are only reflinked, copy on write
+  clones that keep their own inode and mode, so editing one never changes the
+  store. Where the filesystem has no reflinks (`can_reflink`, probed once per
+  filesystem), they are not linked at all.
+- immutable files (tools, cached renders) are hardlinked to the read-only
+  stored file, and reflinked where hardlinks are not possible, e.g. across
+  filesystems.
+
+Only files that copier copies verbatim from the template should be linked:
+templated files differ per workspace, and files that products write (data,
+logs) must not be shared.
+
+`coasti store prune` removes stored files that nothing links to anymore.
+"""
+
+from __future__ import annotations
+
+import errno
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import threading
+import uuid
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Annotated, Literal, cast
+
+import typer
+from platformdirs import user_cache_dir
+
+from coasti.logger import log
+from coasti.timing import count, format_bytes, span
+
+LinkKind = Literal["hardlink", "reflink", "copy"]
+
+app = typer.Typer()
+
+_CHUNK = 1 << 20
+_FICLONE = 0x40049409  # linux ioctl, from linux/fs.h
+
+# (store dev, target dev) -> whether files can be reflinked between them
+_reflinks: dict[tuple[int, int], bool] = {}
+_reflinks_lock = threading.Lock()
+
+
+class FileStore:
+    def __init__(self, root: Path | None = None) -> None:
+        self.root = root or default_store_dir()
+
+    def object_path(self, digest: str, executable: bool) -> Path:
+        suffix = "-x" if executable else ""
+        return self.root / "files" / digest[:2] / f"{digest}{suffix}"
+
+    def can_reflink(self, directory: Path) -> bool:
+        """Whether stored files can be reflinked into `directory`.
+
+        Probed with one clone per pair of filesystems, in this process.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        key = (self.root.stat().st_dev, directory.stat().st_dev)
+        with _reflinks_lock:
+            if key not in _reflinks:
+                probe = self.root / f".probe.{uuid.uuid4().hex}"
+                clone = directory / f".coasti-probe.{uuid.uuid4().hex}"
+                try:
+                    probe.write_bytes(b"coasti")
+                    _reflinks[key] = _reflink(probe, clone)
+                finally:
+                    probe.unlink(missing_ok=True)
+                    clone.unlink(missing_ok=True)
+                log.debug(f"Reflinks into {str(directory)}: {_reflinks[key]}")
+            return _reflinks[key]
+
+    def add(self, path: Path) -> Path:
+        """Put the file at `path` into the store (if new), return the stored file."""
+        return cast(Path, self._add(path, editable=False))
+
+    def _add(self, path: Path, editable: bool) -> Path | None:
+        # editable files are only stored as a reflink, None without reflinks
+        st = path.stat()
+        executable = bool(st.st_mode & stat.S_IXUSR)
+        obj = self.object_path(file_digest(path), executable)
+        if obj.exists():
+            count("cache_hit.file_store")
+            return obj
+
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        tmp = obj.with_name(f".{obj.name}.{uuid.uuid4().hex}")
+        try:
+            if editable:
+                if not _reflink(path, tmp):
+                    return None
+            else:
+                try:
+                    # no need to copy, the file is replaced by a link to itself
+                    os.link(path, tmp)
+                except OSError:
+                    shutil.copyfile(path, tmp)
+            tmp.chmod(0o555 if executable else 0o444)
+            tmp.replace(obj)
+        finally:
+            tmp.unlink(missing_ok=True)
+        count("cache_miss.file_store")
+        return obj
+
+    def link(self, path: Path, editable: bool = False) -> LinkKind:
+        """Replace the file at `path` by a link to its stored copy.
+
+        `editable` files keep their own inode and mode (a reflink), or stay a
+        copy. Others may become a hardlink to the read-only stored file.
+        """
+        mode = stat.S_IMODE(path.stat().st_mode)
+        obj = self._add(path, editable)
+        if obj is None:
+            return "copy"
+        if _same_file(obj, path):
+            return "hardlink"
+
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        try:
+            if editable:
+                if not _reflink(obj, tmp):
+                    return "copy"
+                tmp.chmod(mode)
+                kind: LinkKind = "reflink"
+            else:
+                kind = self._hardlink_or_reflink(obj, tmp)
+                if kind == "copy":
+                    return kind
+            tmp.replace(path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return kind
+
+    def link_tree(
+        self, root: Path, rel_paths: Iterable[str], editable: bool = False
+    ) -> dict[str, int]:
+        """Link the regular, non-empty files `rel_paths` below `root`.
+
+        Returns counts per kind of link, and the bytes now shared.
+        """
+        paths = []
+        for rel in rel_paths:
+            path = root / rel
+            try:
+                st = path.lstat()
+            except FileNotFoundError:
+                continue
+            if stat.S_ISREG(st.st_mode) and st.st_size > 0:
+                paths.append(path)
+
+        def link_or_keep(path: Path) -> LinkKind:
+            try:
+                return self.link(path, editable)
+            except OSError as e:
+                log.debug(f"Keeping a copy of {str(path)}: {e}")
+                return "copy"
+
+        stats = {"hardlink": 0, "reflink": 0, "copy": 0, "shared_bytes": 0}
+        with ThreadPoolExecutor(thread_name_prefix="coasti-store") as pool:
+            for path, kind in zip(paths, pool.map(link_or_keep, paths)):
+                stats[kind] += 1
+                if kind != "copy":
+                    stats["shared_bytes"] += path.stat().st_size
+        return stats
+
+    def prune(self, keep: Iterable[str] = (), dry_run: bool = False) -> Usage:
+        """Remove stored files that are not hardlinked anywhere.
+
+        Reflinked files do not need the stored one, their data stays. Files
+        with a digest in `keep` are kept.
+        """
+        keep = set(keep)
+        removed = Usage()
+        for path in (self.root / "files").glob("??/*"):
+            if path.name.startswith(".") or stored_digest(path) in keep:
+                continue
+            try:
+                st = path.lstat()
+                if st.st_nlink > 1:
+                    continue
+                if not dry_run:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+            removed.files += 1
+            removed.bytes += st.st_size
+        return removed
+
+    @staticmethod
+    def _hardlink_or_reflink(obj: Path, tmp: Path) -> LinkKind:
+        try:
+            os.link(obj, tmp)
+            return "hardlink"
+        except OSError as e:
+            # other filesystem, too many links, or no hardlinks at all
+            if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+                raise
+        return "reflink" if _reflink(obj, tmp) else "copy"
+
+
+@dataclass
+class Usage:
+    files: int = 0
+    bytes: int = 0
+
+
+@app.command()
+def prune(
+    dry_run: Annotated[
+        bool,
+        typer.Option("--dry-run", "-n", help="Only show what would be removed."),
+    ] = False,
+):
+    """
+    Remove files from the shared file store that are not hardlinked anymore
+
+    Reflinked copies in workspaces keep their data. Downloaded tool artifacts
+    and the files of cached renders are kept.
+    """
+    from coasti.artifacts import ArtifactCache
+
+    store = FileStore()
+    with span("store.prune") as attrs:
+        removed = store.prune(ArtifactCache(store).indexed_digests(), dry_run)
+        attrs.update(files=removed.files, bytes=removed.bytes)
+    verb = "Would remove" if dry_run else "Removed"
+    log.info(
+        f"{verb} {removed.files} files ({format_bytes(removed.bytes)}) "
+        f"from {str(store.root)}"
+    )
+
+
+def default_store_dir() -> Path:
+    """`COASTI_STORE_DIR`, or the user cache.
+
+    Hardlinks need the store on the same filesystem as the workspaces.
+    """
+    if env := os.getenv("COASTI_STORE_DIR"):
+        return Path(env)
+    return Path(user_cache_dir("coasti")) / "store"
+
+
+def stored_digest(obj: Path) -> str:
+    """sha256 of a file in the store, from its name."""
+    return obj.name.removesuffix("-x")
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def copy_writable(src: str, dst: str) -> str:
+    """Copy a (possibly linked, read-only) file into an independent writable one.
+
+    Clones where the filesystem supports it. Use as `copy_function` of copytree.
+    """
+    if not _reflink(Path(src), Path(dst)):
+        shutil.copyfile(src, dst, follow_symlinks=False)
+    shutil.copystat(src, dst, follow_symlinks=False)
+    mode = Path(dst).lstat().st_mode
+    if not stat.S_ISLNK(mode):
+        Path(dst).chmod(stat.S_IMODE(mode) | stat.S_IWUSR)
+    return dst
+
+
+def _same_file(a: Path, b: Path) -> bool:
+    try:
+        return a.samefile(b)
+    except FileNotFoundError:
+        return False
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    """Clone `src` to the new file `dst` (copy on write). False if unsupported."""
+    if sys.platform != "linux":
+        return False
+    import fcntl
+
+    try:
+        with src.open("rb") as fsrc, dst.open("wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+    shutil.copymode(src, dst)
+    return True
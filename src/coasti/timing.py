@@ -0,0 +1,378 @@
+"""
+Timing spans for the phases of a coasti run.
+
+Spans are collected in memory while a command runs. At the end of the command,
+they are written as JSON lines to `logs/coasti/` of the workspace, and a summary
+is logged at debug level (`-v`).
+
+```
+with span("product.install", product=pid) as attrs:
+    ...
+    attrs["bytes_written"] = 123
+```
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Protocol
+
+from coasti.logger import log
+
+
+@dataclass
+class Span:
+    """A finished, timed phase of a run."""
+
+    name: str
+    start: float  # seconds since epoch
+    duration: float  # seconds
+    thread_id: int
+    thread_name: str
+    depth: int
+    parent: str | None
+    attrs: dict[str, Any] = field(default_factory=dict)
+    counters: Counter[str] = field(default_factory=Counter)
+
+
+@dataclass
+class _OpenSpan:
+    name: str
+    attrs: dict[str, Any]
+    counters: Counter[str]
+
+
+# spans that are currently open in this thread / context, innermost last
+_open_spans: ContextVar[tuple[_OpenSpan, ...]] = ContextVar(
+    "coasti_open_spans", default=()
+)
+
+
+class SpanListener(Protocol):
+    """Gets notified about spans and counters as they happen, e.g. to show progress.
+
+    Called on the thread that runs the span, so keep it cheap.
+    """
+
+    def span_started(self, name: str, attrs: dict[str, Any]) -> None: ...
+
+    def span_finished(self, name: str, attrs: dict[str, Any]) -> None: ...
+
+    def counted(self, name: str, n: int) -> None: ...
+
+
+listeners: list[SpanListener] = []
+
+
+class Recorder:
+    """Thread-safe collection of spans and counters for one cli invocation."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, command: str | None = None) -> None:
+        with self._lock:
+            self.command = command
+            self.started = time.time()
+            self.spans: list[Span] = []
+            self.counters: Counter[str] = Counter()
+            self.workspace: Path | None = None
+            self.trace_path: Path | None = None
+
+    @property
+    def log_dir(self) -> Path | None:
+        """Where run logs of the current workspace go (if we know the workspace)."""
+        if self.workspace is None:
+            return None
+        return self.workspace / "logs" / "coasti"
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def write_jsonl(self, log_dir: Path) -> Path:
+        """Write all spans and a closing run record as JSON lines."""
+        log_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.fromtimestamp(self.started).strftime("%Y%m%d-%H%M%S")
+        path = log_dir / f"run-{stamp}-{os.getpid()}.jsonl"
+
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+            counters = dict(self.counters)
+
+        with path.open("w") as f:
+            for s in spans:
+                record = {"type": "span", **vars(s), "counters": dict(s.counters)}
+                f.write(json.dumps(record, default=str) + "\n")
+            run = {
+                "type": "run",
+                "command": self.command,
+                "start": self.started,
+                "duration": time.time() - self.started,
+                "counters": counters,
+            }
+            f.write(json.dumps(run, default=str) + "\n")
+        return path
+
+    def write_chrome_trace(self, path: Path) -> Path:
+        """
+        Write spans in the Chrome trace-event format.
+
+        Load the file in https://ui.perfetto.dev or chrome://tracing. Each thread
+        gets its own lane, nested spans are stacked.
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+            counters = dict(self.counters)
+
+        pid = os.getpid()
+        tids: dict[int, int] = {}
+        events: list[dict[str, Any]] = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {"name": f"coasti {self.command or ''}".strip()},
+            }
+        ]
+        for s in spans:
+            if s.thread_id not in tids:
+                tids[s.thread_id] = len(tids)
+                events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": pid,
+                        "tid": tids[s.thread_id],
+                        "args": {"name": s.thread_name},
+                    }
+                )
+            events.append(
+                {
+                    "name": s.name,
+                    "cat": s.name.partition(".")[0],
+                    "ph": "X",
+                    "ts": (s.start - self.started) * 1e6,
+                    "dur": s.duration * 1e6,
+                    "pid": pid,
+                    "tid": tids[s.thread_id],
+                    "args": {**s.attrs, **s.counters},
+                }
+            )
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        trace = {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"command": self.command, "counters": counters},
+        }
+        path.write_text(json.dumps(trace, default=str))
+        return path
+
+    def summary_lines(self) -> list[str]:
+        """Human readable, indented timing summary, one line per span."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        lines = []
+        for s in spans:
+            details = [
+                f"{k}={v}"
+                for k, v in s.attrs.items()
+                if k != "bytes_written" and (k, v) != ("status", "ok")
+            ]
+            details += [f"{k}={v}" for k, v in s.counters.items()]
+            if "bytes_written" in s.attrs:
+                details.append(f"written={format_bytes(s.attrs['bytes_written'])}")
+            lines.append(
+                f"{'  ' * s.depth}{s.name:<{28 - 2 * s.depth}} {s.duration:6.2f}s  "
+                + " ".join(details)
+            )
+        return lines
+
+
+recorder = Recorder()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[dict[str, Any]]:
+    """
+    Time the enclosed block as a span named `name`.
+
+    Yields the span's attributes, so the block can add details (e.g. bytes written).
+    The attribute `status` is set to `ok` or `error` on exit.
+    """
+    parents = _open_spans.get()
+    current = _OpenSpan(name=name, attrs=dict(attrs), counters=Counter())
+    token = _open_spans.set((*parents, current))
+    thread = threading.current_thread()
+    for listener in listeners:
+        listener.span_started(name, current.attrs)
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield current.attrs
+        current.attrs.setdefault("status", "ok")
+    except BaseException:
+        current.attrs["status"] = "error"
+        raise
+    finally:
+        _open_spans.reset(token)
+        for listener in listeners:
+            listener.span_finished(name, current.attrs)
+        recorder.add(
+            Span(
+                name=name,
+                start=start,
+                duration=time.perf_counter() - t0,
+                thread_id=thread.ident or 0,
+                thread_name=thread.name,
+                depth=len(parents),
+                parent=parents[-1].name if parents else None,
+                attrs=current.attrs,
+                counters=current.counters,
+            )
+        )
+
+
+def count(name: str, n: int = 1) -> None:
+    """Increment a counter for the run and for all currently open spans."""
+    recorder.count(name, n)
+    for s in _open_spans.get():
+        s.counters[name] += n
+    for listener in listeners:
+        listener.counted(name, n)
+
+
+def bytes_written_since(path: Path, since: float) -> int:
+    """Size of all files below `path` that were modified after `since`."""
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    if st.st_mtime >= since:
+                        total += st.st_size
+    return total
+
+
+def format_bytes(n: float) -> str:
+    for unit in ("B", "kB", "MB", "GB"):
+        if abs(n) < 1000:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1000
+    return f"{n:.1f} TB"
+
+
+def finish_run() -> None:
+    """Persist the run log (if a workspace is known), the trace (if requested)
+    and log a summary."""
+    if recorder.trace_path is not None:
+        path = recorder.write_chrome_trace(recorder.trace_path)
+        log.info(f"Wrote trace to {str(path)}")
+
+    if not recorder.spans:
+        return
+
+    if recorder.log_dir is not None:
+        try:
+            path = recorder.write_jsonl(recorder.log_dir)
+            log.debug(f"Wrote run log to {str(path)}")
+        except OSError as e:
+            log.debug(f"Could not write run log: {e}")
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Timing summary:\n" + "\n".join(recorder.summary_lines()))
+
+
+# --------------------------- Copier instrumentation -------------------------- #
+
+_copier_instrumented = False
+
+# git options that take a separate value, before the subcommand
+_GIT_OPTIONS_WITH_VALUE = {"-C", "-c", "--git-dir", "--work-tree", "--namespace"}
+
+
+def instrument_copier() -> None:
+    """
+    Record copier's phases (prompt, render, tasks, migrate) as spans,
+    and every git subprocess run through plumbum (copier and coasti) as a span.
+    Template clones are counted as `bytes_fetched`.
+
+    Patches copier and plumbum once per process, similar to `copier_git_injection`.
+    """
+    global _copier_instrumented
+    if _copier_instrumented:
+        return
+
+    import copier._template as copier_template
+    from copier._types import Phase
+    from plumbum.commands.base import BaseCommand
+
+    original_use = Phase.__dict__["use"].__func__
+    original_run = BaseCommand.run
+    original_clone = copier_template.clone
+
+    @contextmanager
+    def use_with_span(cls, phase: Phase) -> Iterator[None]:
+        if phase is Phase.UNDEFINED:
+            with original_use(cls, phase):
+                yield
+            return
+        with original_use(cls, phase), span(f"copier.{phase.value}"):
+            yield
+
+    def run_with_span(self, args=(), **kwargs):
+        argv = [str(a) for a in self.formulate(args=args)]
+        if not argv or Path(argv[0]).stem != "git":
+            return original_run(self, args, **kwargs)
+
+        count("git_commands")
+        with span(f"git.{_git_subcommand(argv)}"):
+            return original_run(self, args, **kwargs)
+
+    def clone_with_size(*args, **kwargs):
+        with span("copier.clone"):
+            location = original_clone(*args, **kwargs)
+        # blobless clone plus checkout: the .git dir is what came over the wire
+        count("bytes_fetched", bytes_written_since(Path(location) / ".git", 0))
+        return location
+
+    Phase.use = classmethod(use_with_span)  # type: ignore[method-assign, assignment]
+    BaseCommand.run = run_with_span  # type: ignore[method-assign]
+    copier_template.clone = clone_with_size
+    _copier_instrumented = True
+
+
+def _git_subcommand(argv: list[str]) -> str:
+    """Name of the git subcommand in `argv`, e.g. `clone` for `git -C x clone`."""
+    args = iter(argv[1:])
+    for arg in args:
+        if arg in _GIT_OPTIONS_WITH_VALUE:
+            next(args, None)
+        elif not arg.startswith("-"):
+            return arg.replace("-", "_")
+    return "unknown"
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Callable
+from typing import Annotated, Any
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from coasti.logger import log
+from coasti.product.cli import coasti_base_dir_from_env_or_prompt
+from coasti.progress import ProductProgress
+from coasti.prompt import prompt_like_copier, prompt_single
+from coasti.timing import recorder
+
+from .questions import TOOL_QUESTIONS
+from .tool import Tool, ToolsYamlIO, run_parallel
+
+app = typer.Typer()
+
+# concurrent tool installs, downloads of the same artifact are shared
+DEFAULT_JOBS = 4
+
+
+@app.callback()
+def entrypoint(ctx: typer.Context):
+    """Callback to make sure requirements are met to work with tools."""
+
+    coasti_base_dir = coasti_base_dir_from_env_or_prompt(ctx.obj.get("quiet", False))
+    ctx.obj["coasti_base_dir"] = coasti_base_dir
+    recorder.workspace = coasti_base_dir
+
+
+@app.command("list")
+def list_tools(ctx: typer.Context):
+    """List tools in tools.yml"""
+    yaml_io = ToolsYamlIO(ctx.obj["coasti_base_dir"])
+
+    table = Table(title="Tools")
+    table.add_column("Id", style="cyan", no_wrap=True)
+    table.add_column("Url")
+    table.add_column("Installed", justify="center")
+    for tid in yaml_io.tool_ids:
+        tool = yaml_io.get_tool(tid)
+        installed = tool.installed_digest is not None
+        table.add_row(tid, tool.data["url"], "[green]✓[/]" if installed else "-")
+
+    console = Console()
+    console.print(table)
+
+
+@app.command()
+def add(
+    ctx: typer.Context,
+    url: Annotated[
+        str | None,
+        typer.Argument(
+            help="Url (or local path) of the tool's release archive or binary.",
+        ),
+    ] = None,
+    data: Annotated[
+        str | None,
+        typer.Option(
+            "--data",
+            help="Avoid prompts by providing answers as a JSON object like: "
+            ' \'{"id": "sling"}\'',
+        ),
+    ] = None,
+):
+    """Add a tool to coasti"""
+
+    quiet: bool = ctx.obj.get("quiet", False)
+
+    tool_data: dict[str, Any] = {}
+    if data is not None:
+        try:
+            tool_data = json.loads(data)
+        except json.JSONDecodeError as e:
+            log.error(f"Invalid JSON in --data: {e}")
+            log.error(f"Input was: {data!r}")
+            raise typer.Exit(code=1)
+
+    tool_data["url"] = (
+        url
+        or tool_data.get("url")
+        or prompt_single("Url of the tool's release archive or binary:", type=str)
+    )
+
+    yaml_io = ToolsYamlIO(ctx.obj["coasti_base_dir"])
+    tool = Tool(
+        yaml_io=yaml_io,
+        data=prompt_like_copier(questions=TOOL_QUESTIONS, data=tool_data),
+    )
+
+    if tool.id in yaml_io.tool_ids:
+        if quiet or not prompt_single(
+            f"Tool id {tool.id} already exists. Overwrite?",
+            type=bool,
+            default=True,
+        ):
+            log.info("Not overwriting tool, exiting.")
+            raise typer.Exit(code=1)
+
+    tool.write()
+
+    if not quiet and prompt_single(
+        f"Do you want to install {tool.id} now?", type=bool, default=True
+    ):
+        install(ctx, [tool.id])
+
+
+@app.command()
+def install(
+    ctx: typer.Context,
+    tids: Annotated[
+        list[str] | None,
+        typer.Argument(
+            help="Ids of the tools.",
+        ),
+    ] = None,
+    all_tools: Annotated[
+        bool,
+        typer.Option("--all", help="Install all tools in tools.yml."),
+    ] = False,
+    jobs: Annotated[
+        int,
+        typer.Option("--jobs", "-j", min=1, help="Tools to install concurrently."),
+    ] = DEFAULT_JOBS,
+):
+    """
+    Install tools, downloading each artifact only once per user
+    """
+    yaml_io = ToolsYamlIO(ctx.obj["coasti_base_dir"])
+    tids = _tool_ids_from_yaml_or_prompt(yaml_io, tids, all_tools)
+    _run_batch(yaml_io, tids, "install", lambda tool: tool.install(), jobs)
+
+
+@app.command()
+def update(
+    ctx: typer.Context,
+    tids: Annotated[
+        list[str] | None,
+        typer.Argument(
+            help="Ids of the tools.",
+        ),
+    ] = None,
+    all_tools: Annotated[
+        bool,
+        typer.Option("--all", help="Update all tools in tools.yml."),
+    ] = False,
+    url: Annotated[
+        str | None,
+        typer.Option("--url", help="New url of the tool's artifact."),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option("--jobs", "-j", min=1, help="Tools to update concurrently."),
+    ] = DEFAULT_JOBS,
+):
+    """
+    Download tools again, and reinstall those whose artifact changed
+    """
+    yaml_io = ToolsYamlIO(ctx.obj["coasti_base_dir"])
+    tids = _tool_ids_from_yaml_or_prompt(yaml_io, tids, all_tools)
+    if url is not None and len(tids) > 1:
+        log.error("--url can only be used when updating a single tool.")
+        raise typer.Exit(code=1)
+
+    _run_batch(yaml_io, tids, "update", lambda tool: tool.update(url), jobs)
+
+
+def _run_batch(
+    yaml_io: ToolsYamlIO,
+    tids: list[str],
+    operation: str,
+    run: Callable[[Tool], None],
+    jobs: int,
+):
+    """Run `operation` on the tools concurrently, continuing after failures.
+
+    Exits with code 1 at the end if any tool failed.
+    """
+    with ProductProgress(tids, operation) as progress:
+
+        def run_tracked(tool: Tool):
+            with progress.track(tool.id):
+                run(tool)
+
+        errors = run_parallel(
+            [yaml_io.get_tool(tid) for tid in tids], run_tracked, max_workers=jobs
+        )
+
+    for tid, e in errors.items():
+        # avoid a stack trace, urls might contain auth info
+        log.error(f"Failed to {operation} {tid}: {e}")
+    if errors:
+        if len(tids) > 1:
+            log.error(f"Failed to {operation}: {', '.join(errors)}")
+        raise typer.Exit(code=1)
+
+
+def _tool_ids_from_yaml_or_prompt(
+    yaml_io: ToolsYamlIO,
+    tids: list[str] | None,
+    all_tools: bool = False,
+) -> list[str]:
+    if all_tools:
+        if tids:
+            log.error("Pass either tool ids or --all, not both.")
+            raise typer.Exit(code=1)
+        return yaml_io.tool_ids
+    if not tids:
+        tids = [
+            prompt_single("Select the tool to use:", type=str, choices=yaml_io.tool_ids)
+        ]
+
+    for tid in tids:
+        if tid not in yaml_io.tool_ids:
+            log.error(
+                f"{tid} not found in tools. Available tools are:\n  {yaml_io.tool_ids}"
+            )
+            raise typer.Exit(code=1)
+    return tids
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from typing import TypedDict
+
+from coasti.prompt import QuestionsDict
+
+
+class ToolData(TypedDict):
+    """
+    Answers to tool-specific questions,
+
+    which will end up in config/tools.yml
+    """
+
+    id: str
+    # where to download the artifact (archive or binary), or a local path
+    url: str
+    # pins the artifact, empty if not pinned
+    sha256: str
+    dst_path: str
+
+
+TOOL_QUESTIONS: QuestionsDict = {
+    "url": {"type": "str", "help": "Url of the tool's release archive or binary"},
+    "id": {
+        "type": "str",
+        "help": "Unique tool identifier:",
+        # file name without extension, e.g. sling_linux_amd64 for .tar.gz
+        "default": "{{ url | regex_replace('^.*/', '') "
+        "| regex_replace('(\\.tar)?\\.[A-Za-z0-9]+$', '') }}",
+    },
+    "sha256": {
+        "type": "str",
+        "help": "Optional: sha256 of the artifact, to verify and pin it",
+        "default": "",
+    },
+    "dst_path": {
+        "type": "str",
+        "help": "Install location:",
+        "default": "tools/{{ id }}",
+    },
+}
@@ -0,0 +1,246 @@
+"""
+Tool related backend logic.
+
+Tools are stack components shared between products (e.g. superset or sling),
+installed from a release archive or binary. Mirrors `coasti.product.product`:
+
+config/tools.yml
+
+ToolsYamlIO  (loaded yaml of all tools with io features, getters for tools)
+    .get_tool()     -> Tool
+
+ToolData  (yaml fields per tool inside config/tools.yml)
+
+Tool      (in RAM instance around ToolData with functions to install etc)
+    .write()    to update ToolData and write back into yaml
+
+Artifacts are downloaded once per user into the file store (`coasti.artifacts`),
+and their unpacked files are linked to it, so many workspaces with the same
+tool share one copy.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from pathlib import Path
+from typing import cast
+
+from ruamel.yaml import YAML, CommentedMap
+
+from coasti.artifacts import (
+    ArtifactCache,
+    artifact_name,
+    normalize_url,
+    stored_digest,
+    unpack,
+)
+from coasti.logger import log, product_log_file
+from coasti.product.staging import staged
+from coasti.prompt import PromptResponse
+from coasti.store import FileStore
+from coasti.timing import span
+
+from .questions import ToolData
+
+yaml = YAML()
+
+# digest of the artifact a tool was installed from, in its dst_path
+ARTIFACT_MARKER = ".coasti_artifact"
+
+
+class ToolsYamlIO:
+    """
+    Manage tools configuration.
+
+    Convenient r/w access to config/tools.yml
+    """
+
+    coasti_base_dir: Path
+    _yaml_data: CommentedMap | None
+
+    def __init__(self, coasti_base_dir: Path) -> None:
+        self.coasti_base_dir = coasti_base_dir
+        self._yaml_data = None
+
+    @property
+    def yaml_data(self) -> CommentedMap:
+        if self._yaml_data is None:
+            self._yaml_data = self._load_tools_config()
+        return cast(CommentedMap, self._yaml_data)
+
+    @property
+    def yaml_path(self):
+        """Get the abs path to the tools yaml."""
+        tools_yaml_path = self.coasti_base_dir / "config" / "tools.yml"
+        if not tools_yaml_path.is_file():
+            raise ValueError(
+                "Could not find config/tools.yml. Call from a coasti project, "
+                "or set COASTI_BASE_DIR"
+            )
+        return tools_yaml_path
+
+    @property
+    def tool_ids(self) -> list[str]:
+        """Tool ids"""
+        return [t["id"] for t in self.yaml_data["tools"]]
+
+    def get_tool(self, tid: str) -> Tool:
+        return Tool(data=self.get_entry(tid), yaml_io=self)
+
+    def get_entry(self, tid: str):
+        entries = self.yaml_data["tools"]
+        return [e for e in entries if e.get("id") == tid][0]
+
+    def _load_tools_config(self):
+        config = yaml.load(self.yaml_path)
+        if not isinstance(config, CommentedMap) or "tools" not in config.keys():
+            raise ValueError("Could not find the tools section in config/tools.yml.")
+        # this is a list in yaml, but it might not have any entries, and be none.
+        config["tools"] = config.get("tools") or []
+        return config
+
+    def write(self):
+        with self.yaml_path.open("w") as f:
+            yaml.dump(self.yaml_data, f)
+
+    def upsert_tool(self, tool: Tool):
+        """Save tool data to yaml, overwriting if already found."""
+        if tool.id in self.tool_ids:
+            entry = self.get_entry(tool.id)
+            log.debug(f"Updating {tool.id} in tools.yml: {entry} ---> {tool.data}")
+            entry.update(tool.data)
+        else:
+            log.debug(f"Adding {tool.id} to tools.yml: {tool.data}")
+            self.yaml_data["tools"].append(tool.data)
+
+        log.info(f"Updated {tool.id} in tools.yml")
+
+
+class Tool:
+    """
+    View on an individual tool.
+
+    Contains:
+    - ToolData that resembles the yaml, for this particular tool
+    - write method, to update the (many-tools) yaml via ToolsYamlIO
+    - install and update methods
+    """
+
+    data: ToolData
+    yaml_io: ToolsYamlIO
+
+    def __init__(
+        self,
+        yaml_io: ToolsYamlIO,
+        data: ToolData | PromptResponse[ToolData],
+    ) -> None:
+        self.yaml_io = yaml_io
+        if isinstance(data, PromptResponse):
+            data = data.answers
+        self.data = deepcopy(data)
+
+    @property
+    def id(self):
+        return self.data["id"]
+
+    @property
+    def coasti_base_dir(self):
+        return self.yaml_io.coasti_base_dir.absolute()
+
+    @property
+    def dst_path(self):
+        return self.coasti_base_dir / self.data["dst_path"]
+
+    @property
+    def log_dir(self):
+        """Where this tool logs, `logs/<id>` (shared by all products)."""
+        return self.coasti_base_dir / "logs" / self.id
+
+    @property
+    def installed_digest(self) -> str | None:
+        try:
+            return (self.dst_path / ARTIFACT_MARKER).read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    def write(self):
+        """Persist the current state of this tool in tools.yml."""
+        self.yaml_io.upsert_tool(self)
+        self.yaml_io.write()
+
+    def install(self, refresh: bool = False):
+        """
+        Install this tool from its artifact, downloading it only if not cached.
+
+        With `refresh`, the url is downloaded again (unless the artifact is
+        pinned by sha256), and the tool is only reinstalled if it changed.
+        Unpacks into a new version of the tool, which `dst_path` links to once
+        complete.
+        """
+        url = self.data["url"]
+        with (
+            product_log_file(self.id, self.log_dir),
+            span("tool.install", tool=self.id) as attrs,
+        ):
+            artifact = ArtifactCache().fetch(
+                url, sha256=self.data.get("sha256", ""), refresh=refresh
+            )
+            digest = stored_digest(artifact)
+            if refresh and digest == self.installed_digest:
+                log.info(f"{self.id} is up to date")
+                return
+
+            log.info(f"Installing {self.id} from {url}")
+            with (
+                staged(self.dst_path) as version_path,
+                span("tool.unpack", tool=self.id),
+            ):
+                unpack(artifact, artifact_name(normalize_url(url)), version_path)
+                files = [
+                    p.relative_to(version_path).as_posix()
+                    for p in version_path.rglob("*")
+                ]
+                attrs.update(FileStore().link_tree(version_path, files))
+                (version_path / ARTIFACT_MARKER).write_text(f"{digest}\n")
+
+    def update(self, url: str | None = None):
+        """
+        Reinstall this tool if its artifact changed, optionally from a new `url`.
+
+        A new url drops the sha256 pin of the old one. Only writes tools.yml
+        after the update succeeded.
+        """
+        if url is None or url == self.data["url"]:
+            self.install(refresh=True)
+            return
+
+        old: ToolData = deepcopy(self.data)
+        self.data["url"] = url
+        self.data["sha256"] = ""
+        try:
+            self.install(refresh=True)
+        except BaseException:
+            self.data.update(old)
+            raise
+        log.debug(f"Writing tool to update tools.yml to new url '{url}'")
+        self.write()
+
+
+def run_parallel(
+    tools: list[Tool], run: Callable[[Tool], None], max_workers: int | None = None
+) -> dict[str, BaseException]:
+    """Run `run` on all tools concurrently. Returns the errors by tool id.
+
+    Downloads of the same artifact are shared (see `ArtifactCache`).
+    """
+    errors: dict[str, BaseException] = {}
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="coasti-tool"
+    ) as pool:
+        futures = {tool.id: pool.submit(run, tool) for tool in tools}
+        for tid, future in futures.items():
+            if (e := future.exception()) is not None:
+                errors[tid] = e
+    return errors
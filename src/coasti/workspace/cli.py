@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Annotated
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from coasti.logger import log
+from coasti.product import reconcile as product_reconcile
+from coasti.product.cli import coasti_base_dir_from_env_or_prompt
+from coasti.product.product import ProductsYamlIO
+from coasti.timing import format_bytes, recorder, span
+
+from .du import PARTS, workspace_usage
+from .walk import DEFAULT_IGNORE, tree_lines
+
+app = typer.Typer()
+
+
+@app.callback()
+def entrypoint(ctx: typer.Context):
+    """Callback to make sure we are in a coasti workspace."""
+
+    quiet: bool = ctx.obj.get("quiet", False)
+    coasti_base_dir = coasti_base_dir_from_env_or_prompt(quiet)
+    ctx.obj["coasti_base_dir"] = coasti_base_dir
+    recorder.workspace = coasti_base_dir
+
+
+@app.command()
+def tree(
+    ctx: typer.Context,
+    path: Annotated[
+        Path | None,
+        typer.Argument(
+            help="Directory to show, relative to the coasti dir. Default: all.",
+        ),
+    ] = None,
+    depth: Annotated[
+        int | None,
+        typer.Option("--depth", "-L", min=1, help="Only show this many levels."),
+    ] = None,
+    ignore: Annotated[
+        list[str] | None,
+        typer.Option(
+            "--ignore",
+            "-I",
+            help="Skip entries matching this pattern, e.g. 'logs/**' (repeatable). "
+            f"Added to the defaults: {', '.join(DEFAULT_IGNORE)}",
+        ),
+    ] = None,
+    all_entries: Annotated[
+        bool,
+        typer.Option("--all", "-a", help="Do not skip the default patterns."),
+    ] = False,
+    sizes: Annotated[
+        bool,
+        typer.Option("--sizes", "-s", help="Show sizes of files and directories."),
+    ] = False,
+    max_entries: Annotated[
+        int | None,
+        typer.Option(
+            "--max-entries", min=1, help="Per directory, show at most this many."
+        ),
+    ] = 200,
+):
+    """
+    Show the workspace as a tree
+
+    Symlinks (e.g. config/<product>) are shown with their target, but not followed.
+    """
+    coasti_base_dir: Path = ctx.obj["coasti_base_dir"]
+    root = coasti_base_dir / path if path is not None else coasti_base_dir
+    if not root.is_dir():
+        raise typer.BadParameter(f"Not a directory: {str(root)}", param_hint="PATH")
+
+    patterns = (*([] if all_entries else DEFAULT_IGNORE), *(ignore or []))
+    typer.echo(str(root))
+    for line in tree_lines(
+        root,
+        max_depth=depth,
+        ignore=patterns,
+        sizes=sizes,
+        max_entries=max_entries,
+    ):
+        typer.echo(line)
+
+
+@app.command()
+def du(
+    ctx: typer.Context,
+    as_json: Annotated[
+        bool,
+        typer.Option("--json", help="Print the usage as JSON."),
+    ] = False,
+    refresh: Annotated[
+        bool,
+        typer.Option(
+            "--refresh",
+            help="Ignore the cached sizes of unchanged product directories.",
+        ),
+    ] = False,
+):
+    """
+    Show the disk usage of each product, its data and its logs
+
+    Directory sizes of product code are cached in .coasti/du_cache.json, so
+    repeated runs only rescan directories that changed. Data and logs are
+    always scanned.
+    """
+    yaml_io = ProductsYamlIO(ctx.obj["coasti_base_dir"])
+    products = {pid: yaml_io.get_product(pid).dst_path for pid in yaml_io.product_ids}
+    with span("workspace.du", products=len(products)):
+        usages = workspace_usage(yaml_io.coasti_base_dir, products, refresh=refresh)
+
+    if as_json:
+        typer.echo(json.dumps([u.as_dict() for u in usages], indent=2))
+        return
+
+    table = Table(title="Disk Usage")
+    table.add_column("Product", style="cyan", no_wrap=True)
+    for part in PARTS:
+        table.add_column(part.capitalize(), justify="right")
+    table.add_column("Total", style="green", justify="right")
+    table.add_column("Files", justify="right")
+
+    for u in usages:
+        table.add_row(
+            u.product if u.installed else f"{u.product} (not installed)",
+            *(format_bytes(u.parts[part].bytes) for part in PARTS),
+            format_bytes(u.total.bytes),
+            str(u.total.files),
+        )
+
+    console = Console()
+    console.print(table)
+
+
+@app.command()
+def reconcile(
+    ctx: typer.Context,
+    dry_run: Annotated[
+        bool,
+        typer.Option("--dry-run", "-n", help="Only show what would be changed."),
+    ] = False,
+):
+    """
+    Make the links into products (config/<id>, data/<id>, ...) match products.yml
+
+    Creates missing links, fixes links that point elsewhere and removes stale
+    ones. Real files or directories in place of a link are reported, not touched.
+    """
+    yaml_io = ProductsYamlIO(ctx.obj["coasti_base_dir"])
+    products = [yaml_io.get_product(pid) for pid in yaml_io.product_ids]
+    with span("workspace.reconcile", products=len(products)) as attrs:
+        desired = product_reconcile.desired_links(products)
+        ops = product_reconcile.plan(yaml_io.coasti_base_dir, desired)
+        attrs["operations"] = len(ops)
+        if not ops:
+            log.info("Links are up to date.")
+            return
+        if dry_run:
+            for op in ops:
+                log.info(f"Would {op}")
+            return
+        failed = product_reconcile.apply(ops)
+
+    log.info(f"Applied {len(ops) - failed} of {len(ops)} changes.")
+    if failed:
+        raise typer.Exit(code=1)
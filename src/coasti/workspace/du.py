@@ -0,0 +1,247 @@
+"""
+Disk usage per product, for `coasti workspace du`.
+
+For each product, we size its code (`products/<id>`), its `data/<id>` and its
+`logs/<id>` (following the workspace symlinks once, and not counting data and
+logs twice when they live inside the product dir). All roots are walked in
+parallel on a thread pool, `os.scandir` releases the GIL while listing.
+
+Sizes of product dirs are cached per directory in `.coasti/du_cache.json`,
+keyed by the directory's mtime. A directory whose mtime did not change is not
+listed again, only its subdirectories are checked. Files that grow in place
+(without adding or removing entries) do not change the mtime of their
+directory, so data and logs, where products append to files, are always
+scanned. Use `--refresh` to rescan product dirs too.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from coasti.logger import log
+from coasti.timing import count
+
+CACHE_PATH = Path(".coasti") / "du_cache.json"
+CACHE_VERSION = 1
+
+PARTS = ("product", "data", "logs")
+
+
+@dataclass
+class Usage:
+    bytes: int = 0
+    files: int = 0
+    dirs: int = 0
+
+    def __iadd__(self, other: Usage) -> Usage:
+        self.bytes += other.bytes
+        self.files += other.files
+        self.dirs += other.dirs
+        return self
+
+
+@dataclass
+class ProductUsage:
+    product: str
+    installed: bool
+    parts: dict[str, Usage]
+
+    @property
+    def total(self) -> Usage:
+        total = Usage()
+        for usage in self.parts.values():
+            total += usage
+        return total
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "product": self.product,
+            "installed": self.installed,
+            **{part: vars(usage) for part, usage in self.parts.items()},
+            "total": vars(self.total),
+        }
+
+
+class DuCache:
+    """Thread-safe `{dir: [mtime_ns, bytes, files, subdirs]}` of the last run."""
+
+    def __init__(self, path: Path, refresh: bool = False) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._old: dict[str, list] = {} if refresh else self._load()
+        self._new: dict[str, list] = {}
+
+    def get(self, path: str, mtime_ns: int) -> list | None:
+        entry = self._old.get(path)
+        if entry is None or entry[0] != mtime_ns:
+            return None
+        return entry
+
+    def put(self, path: str, entry: list) -> None:
+        with self._lock:
+            self._new[path] = entry
+
+    def save(self) -> None:
+        """Persist entries of this run, dropping dirs that were not seen."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": CACHE_VERSION, "dirs": self._new}, f)
+            Path(tmp).replace(self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def _load(self) -> dict[str, list]:
+        try:
+            data = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            log.debug(f"Ignoring broken du cache {str(self.path)}: {e}")
+            return {}
+        if data.get("version") != CACHE_VERSION:
+            return {}
+        return data.get("dirs", {})
+
+
+def disk_usage(
+    root: str,
+    cache: DuCache,
+    exclude: frozenset[str] = frozenset(),
+    cached: bool = True,
+) -> Usage:
+    """Disk usage of the tree at `root`, without subtrees in `exclude`.
+
+    Symlinks count with their own size, they are not followed. Without
+    `cached`, all dirs are scanned and none are cached.
+    """
+    usage = Usage()
+    hits = 0
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            mtime_ns = os.lstat(path).st_mtime_ns
+        except OSError:
+            continue  # vanished while walking
+
+        entry = cache.get(path, mtime_ns) if cached else None
+        if entry is None:
+            entry = _scan_dir(path, mtime_ns)
+        else:
+            hits += 1
+        if cached:
+            cache.put(path, entry)
+
+        _, nbytes, nfiles, subdirs = entry
+        usage += Usage(bytes=nbytes, files=nfiles, dirs=1)
+        for name in subdirs:
+            if (sub := f"{path}{os.sep}{name}") not in exclude:
+                stack.append(sub)
+
+    if cached:
+        count("cache_hit.du", hits)
+        count("cache_miss.du", usage.dirs - hits)
+    return usage
+
+
+def _scan_dir(path: str, mtime_ns: int) -> list:
+    nbytes = nfiles = 0
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    subdirs.append(e.name)
+                    continue
+                try:
+                    nbytes += _disk_bytes(e.stat(follow_symlinks=False))
+                except OSError:
+                    continue
+                nfiles += 1
+    except OSError:
+        pass  # unreadable, count as empty
+    return [mtime_ns, nbytes, nfiles, subdirs]
+
+
+def _disk_bytes(st: os.stat_result) -> int:
+    """Allocated size like `du`, falling back to the apparent size (Windows)."""
+    blocks = getattr(st, "st_blocks", None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+
+def product_roots(
+    coasti_base_dir: Path, product_id: str, dst_path: Path
+) -> dict[str, str | None]:
+    """Real paths of the dirs to size per part (None if missing)."""
+
+    def real_dir(*candidates: Path) -> str | None:
+        for path in candidates:
+            if path.is_dir():
+                return os.path.realpath(path)
+        return None
+
+    return {
+        "product": real_dir(dst_path),
+        "data": real_dir(coasti_base_dir / "data" / product_id, dst_path / "data"),
+        "logs": real_dir(coasti_base_dir / "logs" / product_id, dst_path / "logs"),
+    }
+
+
+def workspace_usage(
+    coasti_base_dir: Path,
+    products: dict[str, Path],
+    refresh: bool = False,
+    max_workers: int | None = None,
+) -> list[ProductUsage]:
+    """Disk usage of `products` (id -> dst_path), largest first."""
+    cache = DuCache(coasti_base_dir / CACHE_PATH, refresh=refresh)
+
+    jobs: dict[tuple[str, str], tuple[str, frozenset[str]]] = {}
+    for pid, dst_path in products.items():
+        roots = product_roots(coasti_base_dir, pid, dst_path)
+        for part in PARTS:
+            if (root := roots[part]) is None:
+                continue
+            # data and logs are usually linked from inside the product dir
+            exclude = frozenset(
+                r for p, r in roots.items() if p != part and r is not None
+            )
+            if part != "product" and root == roots["product"]:
+                continue
+            jobs[pid, part] = (root, exclude)
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="coasti-du"
+    ) as pool:
+        futures = {
+            # files in data and logs grow in place, unseen by dir mtimes
+            key: pool.submit(disk_usage, root, cache, exclude, key[1] == "product")
+            for key, (root, exclude) in jobs.items()
+        }
+        results = {key: future.result() for key, future in futures.items()}
+
+    try:
+        cache.save()
+    except OSError as e:
+        log.warning(f"Could not save du cache: {e}")
+
+    usages = [
+        ProductUsage(
+            product=pid,
+            installed=(pid, "product") in results,
+            parts={part: results.get((pid, part), Usage()) for part in PARTS},
+        )
+        for pid in products
+    ]
+    usages.sort(key=lambda u: u.total.bytes, reverse=True)
+    return usages
@@ -0,0 +1,200 @@
+"""
+Fast walks over (large) workspaces.
+
+Built on `os.scandir`: its entries know from the directory listing whether they
+are directories or symlinks, so we do not stat every entry. Ignored entries are
+skipped without being entered, and symlinks are shown but never followed (the
+workspace links `config/<id>`, `data/<id>` and `logs/<id>` into `products/`).
+
+Ignore patterns work like in `.gitignore`, with `fnmatch` syntax: patterns
+without a slash match the name at any depth (`.git`), patterns with a slash
+match the path relative to the walked root (`data/**` keeps `data` itself, but
+skips all its contents).
+
+```
+for line in tree_lines(Path("/coasti"), max_depth=2):
+    print(line)
+```
+"""
+
+from __future__ import annotations
+
+import os
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+from coasti.timing import format_bytes
+
+DEFAULT_IGNORE = (".git", "data/**", "*/data/**")
+
+# tree drawing
+_SPACE = "    "
+_BRANCH = "│   "
+_TEE = "├── "
+_LAST = "└── "
+
+
+@dataclass(frozen=True)
+class Entry:
+    """A directory entry, relative to the root of the walk."""
+
+    path: str
+    rel: str  # posix path relative to the root
+    name: str
+    depth: int  # 1 for children of the root
+    is_dir: bool  # not following symlinks
+    is_symlink: bool
+
+    @property
+    def link_target(self) -> str | None:
+        return str(Path(self.path).readlink()) if self.is_symlink else None
+
+
+def is_ignored(rel: str, name: str, ignore: Iterable[str]) -> bool:
+    for pattern in ignore:
+        if "/" in pattern:
+            if fnmatchcase(rel, pattern):
+                return True
+        elif fnmatchcase(name, pattern):
+            return True
+    return False
+
+
+def scan(
+    path: str | Path,
+    rel: str = "",
+    depth: int = 1,
+    ignore: Iterable[str] = DEFAULT_IGNORE,
+) -> list[Entry]:
+    """Entries of a single directory, sorted by name, without ignored ones."""
+    ignore = tuple(ignore)
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for e in it:
+                e_rel = f"{rel}/{e.name}" if rel else e.name
+                if is_ignored(e_rel, e.name, ignore):
+                    continue
+                entries.append(
+                    Entry(
+                        path=e.path,
+                        rel=e_rel,
+                        name=e.name,
+                        depth=depth,
+                        is_dir=e.is_dir(follow_symlinks=False),
+                        is_symlink=e.is_symlink(),
+                    )
+                )
+    except (PermissionError, FileNotFoundError, NotADirectoryError):
+        pass  # unreadable or vanished while walking, show as empty
+    entries.sort(key=lambda e: e.name)
+    return entries
+
+
+def walk(
+    root: str | Path,
+    max_depth: int | None = None,
+    ignore: Iterable[str] = DEFAULT_IGNORE,
+) -> Iterator[Entry]:
+    """All entries below `root`, depth first, directories before their contents."""
+    ignore = tuple(ignore)
+    stack = [iter(scan(root, ignore=ignore))]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+            continue
+        yield entry
+        if entry.is_dir and (max_depth is None or entry.depth < max_depth):
+            stack.append(
+                iter(scan(entry.path, entry.rel, entry.depth + 1, ignore=ignore))
+            )
+
+
+class DirSizes:
+    """
+    Memoized apparent sizes of directory trees (without ignored entries).
+
+    Sizing a directory also sizes all directories below it, so asking for the
+    size of each directory of a tree (top down) walks every entry only once.
+    """
+
+    def __init__(self, root: str | Path, ignore: Iterable[str] = DEFAULT_IGNORE):
+        self.root = str(root)
+        self.ignore = tuple(ignore)
+        self._sizes: dict[str, int] = {}
+
+    def __call__(self, entry: Entry) -> int:
+        return self._size(entry.path, entry.rel)
+
+    def _size(self, path: str, rel: str) -> int:
+        if (size := self._sizes.get(path)) is not None:
+            return size
+        size = 0
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    e_rel = f"{rel}/{e.name}" if rel else e.name
+                    if is_ignored(e_rel, e.name, self.ignore):
+                        continue
+                    if e.is_dir(follow_symlinks=False):
+                        size += self._size(e.path, e_rel)
+                    else:
+                        size += e.stat(follow_symlinks=False).st_size
+        except (PermissionError, FileNotFoundError, NotADirectoryError):
+            pass
+        self._sizes[path] = size
+        return size
+
+
+def tree_lines(
+    root: str | Path,
+    max_depth: int | None = None,
+    ignore: Iterable[str] = DEFAULT_IGNORE,
+    sizes: bool = False,
+    max_entries: int | None = None,
+    prefix: str = "",
+) -> Iterator[str]:
+    """
+    Lines of a visual tree below `root`, yielded as the walk goes.
+
+    - `max_depth`, do not show entries deeper than this (1: only children)
+    - `sizes`, append the size of each file and directory tree
+    - `max_entries`, per directory, summarize the rest as `… N more`
+    """
+    ignore = tuple(ignore)
+    dir_sizes = DirSizes(root, ignore) if sizes else None
+
+    def lines(path: str | Path, rel: str, depth: int, prefix: str) -> Iterator[str]:
+        entries = scan(path, rel, depth, ignore=ignore)
+        hidden = 0
+        if max_entries is not None and len(entries) > max_entries:
+            hidden = len(entries) - max_entries
+            entries = entries[:max_entries]
+
+        for i, entry in enumerate(entries):
+            last = i == len(entries) - 1 and not hidden
+            line = prefix + (_LAST if last else _TEE) + entry.name
+            if entry.is_symlink:
+                line += f" -> {entry.link_target}"
+            elif entry.is_dir:
+                line += "/"
+            if dir_sizes is not None and not entry.is_symlink:
+                size = (
+                    dir_sizes(entry)
+                    if entry.is_dir
+                    else Path(entry.path).lstat().st_size
+                )
+                line += f"  [{format_bytes(size)}]"
+            yield line
+
+            if entry.is_dir and (max_depth is None or depth < max_depth):
+                extension = _SPACE if last else _BRANCH
+                yield from lines(entry.path, entry.rel, depth + 1, prefix + extension)
+
+        if hidden:
+            yield f"{prefix}{_LAST}… {hidden} more"
+
+    yield from lines(root, "", 1, prefix)
@@ -1,15 +1,37 @@
 """Pytest configuration and fixtures for coasti tests."""
 
+import os
 import shutil
 import subprocess
 import tempfile
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
 import pytest
 from typer.testing import CliRunner
 
 
+@pytest.fixture(scope="session", autouse=True)
+def file_store_dir(tmp_path_factory):
+    """Keep linked product files out of the user's file store."""
+    store_dir = tmp_path_factory.mktemp("store")
+    with mock.patch.dict(os.environ, {"COASTI_STORE_DIR": str(store_dir)}):
+        yield store_dir
+
+
+@pytest.fixture(autouse=True)
+def restored_copier():
+    """Undo the patches of concurrent product installs after each test."""
+    from coasti.product.threads import restore_copier
+
+    yield
+    restore_copier()
+
+
 @pytest.fixture
 def cli_runner():
     """Return a Typer CliRunner for testing CLI commands."""
@@ -103,3 +125,47 @@ def mock_product_repo():
         run(["git", "tag", "v1.0.0"])
 
         yield repo_path
+
+
+@pytest.fixture(scope="class")
+def http_product_repo(mock_product_repo):
+    """
+    Serve the mock product over HTTP, like GitLab would, and yield its url.
+
+    Git reads the repo over git's "dumb" HTTP protocol (static files), archives
+    come from GitLab's `repository/archive.tar.gz` endpoint.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        bare = Path(root) / "group" / "mock_product.git"
+        for cmd in (
+            ["git", "clone", "--bare", str(mock_product_repo), str(bare)],
+            ["git", "-C", str(bare), "update-server-info"],
+        ):
+            subprocess.run(cmd, check=True, capture_output=True)
+
+        class Handler(SimpleHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if not url.path.endswith("/repository/archive.tar.gz"):
+                    return super().do_GET()
+                ref = parse_qs(url.query)["sha"][0]
+                prefix = f"--prefix=mock_product-{ref}/"
+                body = subprocess.run(
+                    ["git", "-C", str(bare), "archive", "--format=tar.gz", prefix, ref],
+                    check=True,
+                    capture_output=True,
+                ).stdout
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(Handler, directory=root))
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        try:
+            yield f"http://127.0.0.1:{httpd.server_port}/group/mock_product.git"
+        finally:
+            httpd.shutdown()
@@ -1,3 +1,5 @@
+import json
+import pstats
 from unittest import mock
 
 import pytest
@@ -24,3 +26,35 @@ def test_verbose_levels(cli_runner, verbose_args, expected_level):
         args = verbose_args + ["version"]
         cli_runner.invoke(cli.app, args)
         mock_setup.assert_called_once_with(expected_level)
+
+
+def test_trace_writes_trace_event_file(cli_runner, tmp_path):
+    trace_path = tmp_path / "trace.json"
+    result = cli_runner.invoke(cli.app, ["--trace", str(trace_path), "version"])
+
+    assert result.exit_code == 0
+    trace = json.loads(trace_path.read_text())
+    assert trace["otherData"]["command"] == "version"
+    assert any(e["name"] == "process_name" for e in trace["traceEvents"])
+
+
+def test_profile_writes_pstats(cli_runner, tmp_path):
+    profile_path = tmp_path / "version.pstats"
+    result = cli_runner.invoke(cli.app, ["--profile-out", str(profile_path), "version"])
+
+    assert result.exit_code == 0
+    stats = pstats.Stats(str(profile_path))
+    assert stats.total_calls > 0  # type: ignore[attr-defined]
+    assert "Profile saved to" in result.output
+
+
+def test_profile_sample_writes_folded_stacks(cli_runner, tmp_path):
+    profile_path = tmp_path / "version.folded"
+    result = cli_runner.invoke(
+        cli.app,
+        ["--profile-sample", "--profile-out", str(profile_path), "version"],
+    )
+
+    assert result.exit_code == 0
+    assert profile_path.is_file()
+    assert "samples, every" in result.output
@@ -1,4 +1,7 @@
 import json
+import re
+import shutil
+import stat
 from pathlib import Path
 
 import pytest
@@ -6,6 +9,7 @@ import yaml
 from typer.testing import CliRunner
 
 from coasti import cli
+from coasti.timing import recorder
 
 
 class TestProductFlow:
@@ -139,9 +143,10 @@ class TestProductFlow:
         self,
         cli_runner: CliRunner,
         coasti_instance_dir: Path,
+        tmp_path: Path,
     ):
 
-        command = ["product", "install", "mock_skip"]
+        command = ["--metrics-dir", str(tmp_path), "product", "install", "mock_skip"]
         result = cli_runner.invoke(
             app=cli.app, args=command, env={"COASTI_BASE_DIR": str(coasti_instance_dir)}
         )
@@ -154,3 +159,401 @@ class TestProductFlow:
         assert (product_dir / "data").is_dir()
         assert (product_dir / "README.md").is_file()  # normal file
         assert (product_dir / "config" / ".env").is_file()  # .jinja template resolved
+
+        # verbatim template files are reflinked from the file store (or copies),
+        # never hardlinked, users may edit them
+        readme = (product_dir / "README.md").stat()
+        assert readme.st_nlink == 1
+        assert readme.st_mode & stat.S_IWUSR
+        assert (product_dir / "config" / ".env").stat().st_nlink == 1
+
+        # product operations are also logged to the product's log dir
+        product_log = product_dir / "logs" / "coasti.log"
+        assert "Using copier to install mock_skip" in product_log.read_text()
+
+        # per-phase timings end up in the run log
+        run_logs = sorted((coasti_instance_dir / "logs" / "coasti").glob("run-*.jsonl"))
+        assert run_logs
+        records = [json.loads(line) for line in run_logs[-1].read_text().splitlines()]
+        span_names = {r["name"] for r in records if r["type"] == "span"}
+        assert {"product.install", "copier.run_copy", "copier.render"} <= span_names
+        assert records[-1]["type"] == "run"
+
+        # and a prometheus textfile with the result
+        (prom,) = tmp_path.glob("*.prom")
+        assert 'product="mock_skip",operation="install",status="success"} 1' in (
+            prom.read_text()
+        )
+
+    def test_product_install_reflinks_rendered_files(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        def reflink(src: Path, dst: Path) -> bool:
+            shutil.copyfile(src, dst)
+            shutil.copymode(src, dst)
+            return True
+
+        # as on a filesystem with reflinks
+        monkeypatch.setattr("coasti.store._reflinks", {})
+        monkeypatch.setattr("coasti.store._reflink", reflink)
+        command = ["product", "install", "mock_skip"]
+        result = cli_runner.invoke(
+            app=cli.app, args=command, env={"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        )
+        assert result.exit_code == 0, result.output
+
+        (span,) = [s for s in recorder.spans if s.name == "product.store"]
+        assert span.attrs["reflink"] > 0
+        assert span.attrs["copy"] == span.attrs["hardlink"] == 0
+        readme = (coasti_instance_dir / "products" / "mock_skip" / "README.md").stat()
+        assert readme.st_nlink == 1
+
+        # without reflinks, nothing is hashed or linked
+        monkeypatch.setattr("coasti.store._reflinks", {})
+        monkeypatch.setattr("coasti.store._reflink", lambda src, dst: False)
+        result = cli_runner.invoke(
+            app=cli.app, args=command, env={"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        )
+        assert result.exit_code == 0, result.output
+        (span,) = [s for s in recorder.spans if s.name == "product.store"]
+        assert "reflink" not in span.attrs
+
+    def test_product_install_many_continues_after_failure(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        from coasti.product.product import Product
+
+        original_install = Product.install
+
+        def install(self, commit=None):
+            if self.id == "mock_auth_token":
+                raise RuntimeError("simulated failure")
+            original_install(self, commit)
+
+        monkeypatch.setattr(Product, "install", install)
+
+        command = ["product", "install", "mock_auth_token", "mock_ssh_key"]
+        result = cli_runner.invoke(
+            app=cli.app, args=command, env={"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        )
+
+        assert result.exit_code == 1
+        assert "Failed to install: mock_auth_token" in result.output
+        # the second product is still installed
+        assert (
+            coasti_instance_dir / "products" / "mock_ssh_key" / "README.md"
+        ).is_file()
+
+    def test_product_install_resume_runs_unfinished(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        from coasti.product.product import Product
+
+        installed: list[str] = []
+        commits: dict[str, str | None] = {}
+        failures = ["mock_auth_token"]
+
+        def install(self, commit=None):
+            installed.append(self.id)
+            commits[self.id] = commit
+            if self.id in failures:
+                failures.remove(self.id)
+                raise RuntimeError("simulated failure")
+
+        monkeypatch.setattr(Product, "install", install)
+        env = {"COASTI_BASE_DIR": str(coasti_instance_dir)}
+
+        command = ["product", "install", "mock_auth_token", "mock_ssh_key"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 1
+        journal = json.loads(
+            (coasti_instance_dir / ".coasti" / "journal" / "install.json").read_text()
+        )
+        states = {pid: e["state"] for pid, e in journal["products"].items()}
+        assert states == {"mock_auth_token": "failed", "mock_ssh_key": "done"}
+        # pinned to the sha the product's ref pointed to when the batch started
+        pinned = {pid: e["commit"] for pid, e in journal["products"].items()}
+        assert all(re.fullmatch(r"[0-9a-f]{40}", sha) for sha in pinned.values())
+        assert commits == pinned
+
+        # a ref that moves on in between does not change the resumed batch
+        monkeypatch.setattr(Product, "resolve_commit", lambda self, ref=None: "0" * 40)
+        installed.clear()
+        command = ["product", "install", "--resume"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0, result.output
+        assert installed == ["mock_auth_token"]
+        assert commits["mock_auth_token"] == pinned["mock_auth_token"]
+
+        # nothing left to do
+        installed.clear()
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0, result.output
+        assert installed == []
+
+    @pytest.mark.parametrize(
+        ("depends_on", "expected"),
+        [
+            ({"mock_ssh_key": ["mock_auth_token"]}, "Skipped mock_ssh_key"),
+            (
+                {
+                    "mock_ssh_key": ["mock_auth_token"],
+                    "mock_auth_token": ["mock_ssh_key"],
+                },
+                "Dependency cycle",
+            ),
+        ],
+    )
+    def test_product_install_follows_dependencies(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        depends_on: dict[str, list[str]],
+        expected: str,
+    ):
+        from coasti.product.product import Product
+
+        products_yml = coasti_instance_dir / "config" / "products.yml"
+        original = products_yml.read_text()
+        config = yaml.safe_load(original)
+        for product in config["products"]:
+            product["depends_on"] = depends_on.get(product["id"], [])
+        products_yml.write_text(yaml.safe_dump(config))
+
+        installed: list[str] = []
+
+        def install(self, commit=None):
+            installed.append(self.id)
+            if self.id == "mock_auth_token":
+                raise RuntimeError("simulated failure")
+
+        monkeypatch.setattr(Product, "install", install)
+
+        command = ["product", "install", "-j", "2", "mock_ssh_key", "mock_auth_token"]
+        try:
+            result = cli_runner.invoke(
+                app=cli.app,
+                args=command,
+                env={"COASTI_BASE_DIR": str(coasti_instance_dir)},
+            )
+        finally:
+            products_yml.write_text(original)
+
+        assert result.exit_code == 1
+        assert expected in result.output
+        # mock_ssh_key waits for mock_auth_token, which fails
+        assert "mock_ssh_key" not in installed
+
+    def test_product_update_vcs_ref_needs_single_product(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+    ):
+        journal = coasti_instance_dir / ".coasti" / "journal" / "update.json"
+        journal.parent.mkdir(parents=True, exist_ok=True)
+        journal.write_text("{}")
+        command = ["product", "update", "--all", "--vcs-ref", "main"]
+        result = cli_runner.invoke(
+            app=cli.app, args=command, env={"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        )
+
+        assert result.exit_code == 1
+        # the last update's journal is kept, to be resumed
+        assert journal.read_text() == "{}"
+        assert "--vcs-ref can only be used" in result.output
+
+    def test_status_lists_uncommitted_files_without_failing(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+    ):
+        command = ["status", "--json"]
+        result = cli_runner.invoke(
+            app=cli.app, args=command, env={"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        )
+
+        statuses = {s["product"]: s for s in json.loads(result.output)}
+        skip = statuses["mock_skip"]
+        assert skip["installed"]
+        assert skip["modified"] == []  # same as the cached render of the install
+        assert skip["link_problems"] == []
+        assert skip["secret_ok"] is None
+        # freshly installed products are not committed yet, which is healthy
+        assert "README.md" in skip["uncommitted"]
+        assert skip["healthy"]
+        assert not statuses["mock_auth_token"]["installed"]
+        assert result.exit_code == 1
+
+    def test_status_fails_for_modified_template_files(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        env = {"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        product_dir = coasti_instance_dir / "products" / "mock_skip"
+        readme = (product_dir / "README.md").read_text()
+        (product_dir / "README.md").write_text("local change\n")
+        (product_dir / "notes.txt").write_text("added by a user")
+
+        result = cli_runner.invoke(app=cli.app, args=["status", "--json"], env=env)
+
+        assert result.exit_code == 1
+        skip = {s["product"]: s for s in json.loads(result.output)}["mock_skip"]
+        assert skip["modified"] == ["README.md"]
+        assert not skip["healthy"]
+
+        monkeypatch.setenv("COASTI_STORE_DIR", str(coasti_instance_dir / "empty"))
+        result = cli_runner.invoke(app=cli.app, args=["status", "--json"], env=env)
+        skip = {s["product"]: s for s in json.loads(result.output)}["mock_skip"]
+        assert skip["modified"] is None  # no cached render to compare with
+        assert skip["healthy"]
+
+        (product_dir / "README.md").write_text(readme)
+        (product_dir / "notes.txt").unlink()
+
+    def test_workspace_reconcile_fixes_links(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+    ):
+        env = {"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        link = coasti_instance_dir / "data" / "mock_skip"
+        link.unlink()
+
+        command = ["workspace", "reconcile", "--dry-run"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0
+        assert f"Would create {str(link)}" in result.output
+        assert not link.exists()
+
+        command = ["workspace", "reconcile"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0
+        assert (
+            link.readlink() == coasti_instance_dir / "products" / "mock_skip" / "data"
+        )
+
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert "Links are up to date." in result.output
+
+    def test_product_diff_previews_update(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+    ):
+        env = {"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        product_dir = coasti_instance_dir / "products" / "mock_skip"
+
+        command = ["product", "diff", "mock_skip", "--json", "--exit-code"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0, result.output
+        summary = json.loads(result.output)
+        assert summary["modified"] == summary["added"] == summary["removed"] == []
+        assert summary["unchanged"] > 0
+
+        # e.g. outputs of template tasks, an update keeps them
+        (product_dir / ".venv").mkdir()
+        (product_dir / ".venv" / "pyvenv.cfg").write_text("home = /usr/bin\n")
+        command = ["product", "diff", "mock_skip", "--json", "--exit-code"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0, result.output
+        assert json.loads(result.output)["untracked"] == 1
+
+        (product_dir / "README.md").write_text("local change\n")
+        command = ["product", "diff", "mock_skip", "--exit-code"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 1
+        assert "--- a/README.md" in result.output
+        assert "-local change" in result.output
+        # the second preview of the same version is cached
+        assert recorder.counters["cache_hit.preview"] == 1
+
+    def test_product_update_and_rollback(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+    ):
+        env = {"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        product_dir = coasti_instance_dir / "products" / "mock_skip"
+        previous_dir = coasti_instance_dir / "products" / ".mock_skip.previous"
+        (product_dir / "data" / "state.db").write_text("keep me")
+        (product_dir / "README.md").write_text("local change")
+
+        command = ["product", "update", "mock_skip"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0, result.output
+        # copier's render of the installed version came from the install
+        assert recorder.counters["cache_hit.render"] == 1
+
+        # the live product was swapped, both versions share its data
+        assert (previous_dir / "README.md").read_text() == "local change"
+        assert (product_dir / "data" / "state.db").read_text() == "keep me"
+        assert (previous_dir / "data").resolve() == (product_dir / "data").resolve()
+        assert not (product_dir / ".git").exists()
+
+        (product_dir / "README.md").write_text("after update")
+        command = ["product", "rollback", "mock_skip"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0, result.output
+        assert (product_dir / "README.md").read_text() == "local change"
+        assert (previous_dir / "README.md").read_text() == "after update"
+        assert (product_dir / "data" / "state.db").read_text() == "keep me"
+        assert (
+            "Rolled back mock_skip" in (product_dir / "logs" / "coasti.log").read_text()
+        )
+
+
+class TestArchiveTransport:
+    def test_product_install_from_archive_and_update(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+        http_product_repo: str,
+    ):
+        env = {"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        products_yml = coasti_instance_dir / "config" / "products.yml"
+        config = yaml.safe_load(products_yml.read_text())
+        config["products"] = [
+            {
+                "id": "mock_archive",
+                "dst_path": "products/mock_archive",
+                "vcs_repo": http_product_repo,
+                "vcs_ref": "v1.0.0",
+                "vcs_auth_type": "skip",
+                "transport": "archive",
+            }
+        ]
+        products_yml.write_text(yaml.safe_dump(config))
+
+        command = ["product", "install", "mock_archive"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0, result.output
+
+        product_dir = coasti_instance_dir / "products" / "mock_archive"
+        assert (product_dir / "README.md").is_file()
+        span_names = {s.name for s in recorder.spans}
+        assert "archive.fetch" in span_names
+        assert "git.clone" not in span_names
+        # the answers name the repo and tag, as after a clone
+        answers = yaml.safe_load(
+            (product_dir / "config" / "install_answers.yml").read_text()
+        )
+        assert answers["_src_path"] == http_product_repo
+        assert answers["_commit"] == "v1.0.0"
+
+        # updates clone the recorded repo, and diff against the install's render
+        command = ["product", "update", "mock_archive"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0, result.output
+        assert recorder.counters["cache_hit.render"] == 1
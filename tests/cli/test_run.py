@@ -0,0 +1,94 @@
+import json
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from coasti import cli
+from coasti import run as coasti_run
+
+
+@pytest.fixture
+def run_workspace(tmp_path: Path) -> Path:
+    """A coasti dir with products that only have run definitions."""
+    products = {
+        "extract": "run:\n  command: echo extracted > out.txt\n",
+        "transform": (
+            "run:\n"
+            "  command: [sh, -c, 'cat ../extract/out.txt; echo transformed']\n"
+            "  depends_on: [extract]\n"
+        ),
+        "slow": "run:\n  command: sleep 30\n  timeout: 0.5\n",
+        "after_slow": "run:\n  command: 'true'\n  depends_on: [slow]\n",
+        "limited": "run:\n  command: ulimit -t\n  cpu_seconds: 60\n",
+        "long": "run:\n  command: sleep 30\n",
+        "after_long": "run:\n  command: 'true'\n  depends_on: [long]\n",
+    }
+    entries = []
+    for pid, definition in products.items():
+        product_dir = tmp_path / "products" / pid
+        product_dir.mkdir(parents=True)
+        (product_dir / "coasti.yml").write_text(definition)
+        entries.append(
+            {
+                "id": pid,
+                "dst_path": f"products/{pid}",
+                "vcs_repo": "",
+                "vcs_ref": "main",
+                "vcs_auth_type": "skip",
+            }
+        )
+    (tmp_path / "config").mkdir()
+    (tmp_path / "config" / "products.yml").write_text(json.dumps({"products": entries}))
+    return tmp_path
+
+
+def test_run_follows_dependencies_and_logs_output(
+    cli_runner: CliRunner, run_workspace: Path
+):
+    env = {"COASTI_BASE_DIR": str(run_workspace)}
+    result = cli_runner.invoke(app=cli.app, args=["run", "transform"], env=env)
+    assert result.exit_code == 0, result.output
+
+    logs = run_workspace / "products" / "transform" / "logs"
+    (output,) = logs.glob("run-*.log")
+    assert output.read_text() == "extracted\ntransformed\n"
+    assert "Running transform" in (logs / "coasti.log").read_text()
+    # not selected, nor a dependency
+    assert not (run_workspace / "products" / "slow" / "logs").exists()
+
+
+def test_run_times_out_and_skips_dependents(cli_runner: CliRunner, run_workspace: Path):
+    env = {"COASTI_BASE_DIR": str(run_workspace)}
+    command = ["run", "after_slow", "limited"]
+    result = cli_runner.invoke(app=cli.app, args=command, env=env)
+
+    assert result.exit_code == 1
+    assert "slow timed out after 0.5 seconds" in result.output
+    assert "Skipped after_slow" in result.output
+    (output,) = (run_workspace / "products" / "limited" / "logs").glob("run-*.log")
+    assert output.read_text() == "60\n"
+
+
+def test_run_stops_products_when_interrupted(
+    cli_runner: CliRunner, run_workspace: Path
+):
+    def interrupt():
+        while not coasti_run._live:
+            time.sleep(0.01)
+        os.kill(os.getpid(), signal.SIGINT)
+
+    threading.Thread(target=interrupt, daemon=True).start()
+    env = {"COASTI_BASE_DIR": str(run_workspace)}
+    started = time.monotonic()
+    result = cli_runner.invoke(app=cli.app, args=["run", "after_long"], env=env)
+
+    assert result.exit_code == 130  # 128 + SIGINT
+    # the sleep was killed, instead of waited for
+    assert time.monotonic() - started < 10
+    assert not coasti_run._live
+    assert not (run_workspace / "products" / "after_long" / "logs").exists()
@@ -0,0 +1,78 @@
+import io
+import json
+import stat
+import tarfile
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from coasti import cli
+from coasti.timing import recorder
+
+
+@pytest.fixture(scope="module")
+def tool_archive(tmp_path_factory) -> Path:
+    path = tmp_path_factory.mktemp("artifacts") / "mock_tool-1.0.tar.gz"
+    with tarfile.open(path, "w:gz") as tar:
+        content = b"#!/bin/sh\necho mock\n"
+        info = tarfile.TarInfo("bin/mock_tool")
+        info.size = len(content)
+        info.mode = 0o755
+        tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+class TestToolFlow:
+    def test_tool_add_writes_to_yaml(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+        tool_archive: Path,
+    ):
+        env = {"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        for tid in ("mock_tool", "mock_tool_copy"):
+            command = ["--quiet", "tool", "add", str(tool_archive)]
+            data = {"id": tid, "sha256": "", "dst_path": f"tools/{tid}"}
+            command += ["--data", json.dumps(data)]
+            result = cli_runner.invoke(app=cli.app, args=command, env=env)
+            assert result.exit_code == 0, result.output
+
+        tools_yml = (coasti_instance_dir / "config" / "tools.yml").read_text()
+        assert "id: mock_tool\n" in tools_yml
+        assert "dst_path: tools/mock_tool\n" in tools_yml
+
+    def test_tool_install_all_fetches_once(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+    ):
+        env = {"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        command = ["tool", "install", "--all"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0, result.output
+
+        # both tools come from the same artifact, downloaded once
+        assert recorder.counters["cache_miss.artifact"] == 1
+        assert recorder.counters["cache_hit.artifact"] == 1
+
+        binary = coasti_instance_dir / "tools" / "mock_tool" / "bin" / "mock_tool"
+        copy = coasti_instance_dir / "tools" / "mock_tool_copy" / "bin" / "mock_tool"
+        assert binary.samefile(copy)  # both linked to the store
+        assert binary.stat().st_mode & stat.S_IXUSR
+        assert (
+            "Installing mock_tool"
+            in (coasti_instance_dir / "logs" / "mock_tool" / "coasti.log").read_text()
+        )
+
+    def test_tool_update_skips_unchanged(
+        self,
+        cli_runner: CliRunner,
+        coasti_instance_dir: Path,
+    ):
+        env = {"COASTI_BASE_DIR": str(coasti_instance_dir)}
+        command = ["tool", "update", "mock_tool"]
+        result = cli_runner.invoke(app=cli.app, args=command, env=env)
+        assert result.exit_code == 0, result.output
+        assert "mock_tool is up to date" in result.output
+        assert not (coasti_instance_dir / "tools" / ".mock_tool.previous").exists()
@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+
+from typer.testing import CliRunner
+
+from coasti import cli
+
+
+def test_workspace_tree(cli_runner: CliRunner, coasti_instance_dir: Path):
+    command = ["workspace", "tree", "--depth", "1"]
+    result = cli_runner.invoke(
+        app=cli.app, args=command, env={"COASTI_BASE_DIR": str(coasti_instance_dir)}
+    )
+
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0] == str(coasti_instance_dir)
+    assert "├── config/" in lines
+    assert "├── products/" in lines
+    assert "├── .git/" not in lines
+    # only the first level
+    assert not any(line.startswith("│") for line in lines)
+
+
+def test_workspace_tree_rejects_files(cli_runner: CliRunner, coasti_instance_dir: Path):
+    command = ["workspace", "tree", "config/products.yml"]
+    result = cli_runner.invoke(
+        app=cli.app, args=command, env={"COASTI_BASE_DIR": str(coasti_instance_dir)}
+    )
+
+    assert result.exit_code == 2
+    assert "Not a directory" in result.output
+
+
+def test_workspace_du_json(cli_runner: CliRunner, coasti_instance_dir: Path):
+    command = ["workspace", "du", "--json"]
+    result = cli_runner.invoke(
+        app=cli.app, args=command, env={"COASTI_BASE_DIR": str(coasti_instance_dir)}
+    )
+
+    assert result.exit_code == 0
+    assert json.loads(result.output) == []  # no products added yet
+    assert (coasti_instance_dir / ".coasti" / "du_cache.json").is_file()
@@ -0,0 +1,135 @@
+import io
+import subprocess
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from coasti.git import archive
+from coasti.timing import recorder
+
+SHA = "0123456789abcdef0123456789abcdef01234567"
+
+
+def _tarball(files: dict[str, str]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content.encode())
+            tar.addfile(info, io.BytesIO(content.encode()))
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def server():
+    """A stand-in for GitLab, serving `routes` (path -> body)."""
+    routes: dict[str, bytes] = {}
+    requests: list[dict[str, str]] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append({"path": self.path, **self.headers})
+            if (body := routes.get(self.path)) is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.routes, httpd.requests = routes, requests  # type: ignore[attr-defined]
+    httpd.url = f"http://127.0.0.1:{httpd.server_port}"  # type: ignore[attr-defined]
+    yield httpd
+    httpd.shutdown()
+
+
+def test_archive_url():
+    assert (
+        archive.archive_url("https://github.com/org/repo.git", "v1.0")
+        == "https://api.github.com/repos/org/repo/tarball/v1.0"
+    )
+    assert (
+        archive.archive_url("https://user@gitlab.example.com/a/b/repo.git", "v1/x")
+        == "https://gitlab.example.com/api/v4/projects/a%2Fb%2Frepo"
+        "/repository/archive.tar.gz?sha=v1%2Fx"
+    )
+    with pytest.raises(ValueError):
+        archive.archive_url("git@github.com:org/repo.git", "v1.0")
+
+
+@pytest.mark.parametrize("data_filter", [True, False], ids=["filter", "no-filter"])
+def test_fetch_archive_streams_and_extracts(
+    server, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, data_filter
+):
+    if not data_filter:  # python < 3.11.4
+        monkeypatch.delattr(tarfile, "data_filter", raising=False)
+    server.routes[
+        f"/api/v4/projects/group%2Frepo/repository/archive.tar.gz?sha={SHA}"
+    ] = _tarball({f"repo-{SHA}/copier.yml": "a: 1\n", f"repo-{SHA}/sub/f.txt": "f"})
+    recorder.reset()
+
+    root = archive.fetch_archive(
+        f"{server.url}/group/repo.git", SHA, tmp_path, token="secret"
+    )
+
+    assert root == tmp_path / f"repo-{SHA}"
+    assert archive.snapshot_files(root) == ["copier.yml", "sub/f.txt"]
+    assert server.requests[0]["Private-Token"] == "secret"
+    assert recorder.counters["bytes_fetched"] > 0
+    assert "archive.fetch" in [s.name for s in recorder.spans]
+
+
+@pytest.mark.parametrize("data_filter", [True, False], ids=["filter", "no-filter"])
+@pytest.mark.parametrize(
+    "files",
+    [None, {"../outside.txt": "escaped"}],
+    ids=["missing", "unsafe"],
+)
+def test_failed_downloads_fall_back_to_clones(
+    server, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, files, data_filter
+):
+    if not data_filter:  # python < 3.11.4
+        monkeypatch.delattr(tarfile, "data_filter", raising=False)
+    if files is not None:
+        path = f"/api/v4/projects/repo/repository/archive.tar.gz?sha={SHA}"
+        server.routes[path] = _tarball(files)
+
+    with archive.template_snapshot(f"{server.url}/repo.git", SHA) as snapshot:
+        assert snapshot is None
+    assert not (Path(archive.tempfile.gettempdir()) / "outside.txt").exists()
+
+
+def test_only_tags_and_shas_are_pinned(tmp_path: Path):
+    def git(*args: str):
+        subprocess.run(["git", *args], cwd=tmp_path, check=True, capture_output=True)
+
+    git("init", "-b", "main")
+    git("config", "user.email", "test@example.com")
+    git("config", "user.name", "Test User")
+    git("commit", "--allow-empty", "-m", "Initial commit")
+    git("tag", "v1.0.0")
+
+    assert archive.pinned_ref(str(tmp_path), "v1.0.0") == "v1.0.0"
+    assert archive.pinned_ref(str(tmp_path), "main") is None
+    assert archive.pinned_ref(str(tmp_path), SHA) == SHA
+
+
+def test_record_source(tmp_path: Path):
+    answers = tmp_path / "answers.yml"
+    answers.write_text("# comment\n_src_path: /tmp/snapshot\nname: x\n")
+
+    archive.record_source(answers, "https://gitlab.example.com/repo.git", "v1.0.0")
+
+    assert answers.read_text() == (
+        "# comment\n_commit: v1.0.0\n"
+        "_src_path: https://gitlab.example.com/repo.git\nname: x\n"
+    )
@@ -0,0 +1,85 @@
+import io
+import tarfile
+import threading
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from coasti import artifacts
+from coasti.artifacts import ArtifactCache, ChecksumError, stored_digest, unpack
+from coasti.store import FileStore, file_digest
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> ArtifactCache:
+    return ArtifactCache(FileStore(tmp_path / "store"))
+
+
+def _tar_gz(path: Path, files: dict[str, bytes]) -> Path:
+    with tarfile.open(path, "w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mode = 0o755 if name.startswith("bin/") else 0o644
+            tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+def test_fetch_downloads_once(tmp_path: Path, cache: ArtifactCache):
+    src = tmp_path / "tool.bin"
+    src.write_bytes(b"v1")
+
+    with mock.patch.object(
+        artifacts, "urlopen", side_effect=artifacts.urlopen
+    ) as urlopen:
+        threads = [
+            threading.Thread(target=cache.fetch, args=(str(src),)) for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        obj = cache.fetch(src.as_uri())
+
+    assert urlopen.call_count == 1
+    assert obj.read_bytes() == b"v1"
+    assert stored_digest(obj) == file_digest(src)
+
+    # refresh downloads again, and notices the change
+    src.write_bytes(b"v2")
+    assert cache.fetch(str(src)).read_bytes() == b"v1"
+    assert cache.fetch(str(src), refresh=True).read_bytes() == b"v2"
+
+
+def test_fetch_verifies_pinned_checksum(tmp_path: Path, cache: ArtifactCache):
+    src = tmp_path / "tool.bin"
+    src.write_bytes(b"v1")
+
+    with pytest.raises(ChecksumError):
+        cache.fetch(str(src), sha256="0" * 64)
+
+    pinned = cache.fetch(str(src), sha256=file_digest(src))
+    # a pinned artifact in the store needs no download at all
+    src.unlink()
+    assert cache.fetch(str(src), sha256=file_digest(pinned)) == pinned
+
+
+def test_unpack(tmp_path: Path):
+    archive = _tar_gz(
+        tmp_path / "tool.tar.gz", {"bin/tool": b"#!/bin/sh\n", "README": b"hi"}
+    )
+    unpack(archive, "tool-1.0.tar.gz", tmp_path / "tar")
+    assert (tmp_path / "tar" / "bin" / "tool").stat().st_mode & 0o100
+    assert (tmp_path / "tar" / "README").read_bytes() == b"hi"
+
+    with zipfile.ZipFile(tmp_path / "tool.zip", "w") as zf:
+        info = zipfile.ZipInfo("bin/tool")
+        info.external_attr = 0o755 << 16
+        zf.writestr(info, "#!/bin/sh\n")
+    unpack(tmp_path / "tool.zip", "tool.zip", tmp_path / "zip")
+    assert (tmp_path / "zip" / "bin" / "tool").stat().st_mode & 0o100
+
+    unpack(tmp_path / "tool.zip", "tool", tmp_path / "binary")
+    assert (tmp_path / "binary" / "tool").stat().st_mode & 0o100
@@ -0,0 +1,78 @@
+import sys
+
+import copier._vcs as copier_vcs
+import pytest
+from plumbum.commands.processes import ProcessExecutionError
+
+from coasti.git import _git_env, copier_git_injection, credentials
+from coasti.timing import recorder
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="credentials are not served on Windows"
+)
+
+
+def _fill(host: str) -> str:
+    """The credential git would use for https://<host>/repo.git."""
+    fill = copier_vcs.get_git()["credential", "fill"]
+    return (fill << f"protocol=https\nhost={host}\npath=repo.git\n\n")()
+
+
+def _store() -> credentials.CredentialStore:
+    return credentials.credential_server().store
+
+
+def test_tokens_are_served_to_their_host_only():
+    recorder.reset()
+    with copier_git_injection(
+        https_token="s3cret", repo_url="https://GitLab.example.com/repo.git"
+    ):
+        assert "s3cret" not in _git_env.get().values()
+        assert "password=s3cret" in _fill("gitlab.example.com")
+        with pytest.raises(ProcessExecutionError):
+            # no prompt, and no token for other hosts
+            _fill("github.com")
+
+    assert recorder.counters["git_credential_lookups"] == 1
+    assert len(_store()) == 0
+
+
+def test_products_with_the_same_token_share_an_entry():
+    url = "https://gitlab.example.com/a.git"
+    with (
+        copier_git_injection(https_token="t1", repo_url=url),
+        copier_git_injection(https_token="t1", repo_url=url),
+        copier_git_injection(https_token="t2", repo_url=url),
+    ):
+        assert len(_store()) == 2
+        # the innermost context's label wins
+        assert "password=t2" in _fill("gitlab.example.com")
+    assert len(_store()) == 0
+
+
+def test_lookups_by_host_for_urls_with_a_user():
+    store = credentials.CredentialStore()
+    label = store.register("t1", "gitlab.example.com")
+    assert store.lookup(label, "gitlab.example.com") == "t1"
+    assert store.lookup("user", "gitlab.example.com") == "t1"
+    assert store.lookup(label, "github.com") is None
+    store.register("t2", "gitlab.example.com")
+    assert store.lookup("user", "gitlab.example.com") is None
+
+
+def test_askpass_without_the_socket(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("COASTI_GIT_CREDENTIAL_SOCKET", "0")
+    with copier_git_injection(https_token="s3cret"):
+        env = _git_env.get()
+    assert env["GIT_AUTH_TOKEN"] == "s3cret"
+    assert "GIT_CONFIG_COUNT" not in env
+
+
+def test_git_config_env_appends(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("GIT_CONFIG_COUNT", "1")
+    env = credentials._git_config_env([("credential.helper", "")])
+    assert env == {
+        "GIT_CONFIG_COUNT": "2",
+        "GIT_CONFIG_KEY_1": "credential.helper",
+        "GIT_CONFIG_VALUE_1": "",
+    }
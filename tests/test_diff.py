@@ -0,0 +1,82 @@
+import io
+from pathlib import Path
+
+from coasti.product.diff import FileChange, compare_trees, write_diff
+
+
+def _tree(root: Path, files: dict[str, bytes]) -> Path:
+    for rel, content in files.items():
+        (root / rel).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel).write_bytes(content)
+    return root
+
+
+def test_compare_trees(tmp_path: Path):
+    installed = _tree(
+        tmp_path / "installed",
+        {
+            "same.txt": b"same\n",
+            "edited.txt": b"abc\n",
+            "grown.txt": b"a\n",
+            "dropped.txt": b"only in the installed version\n",
+            "local.txt": b"only here\n",
+            ".venv/bin/python": b"task output",
+            "data/state.db": b"runtime state",
+            ".git/HEAD": b"ref",
+        },
+    )
+    base = _tree(
+        tmp_path / "base",
+        {"same.txt": b"same\n", "dropped.txt": b"only in the installed version\n"},
+    )
+    rendered = _tree(
+        tmp_path / "rendered",
+        {
+            "same.txt": b"same\n",
+            "edited.txt": b"xyz\n",
+            "grown.txt": b"a\nb\n",
+            "sub/new.txt": b"new\n",
+        },
+    )
+    (installed / "linked.txt").hardlink_to(rendered / "same.txt")
+    (rendered / "linked.txt").hardlink_to(rendered / "same.txt")
+
+    changes, unchanged, untracked = compare_trees(installed, rendered, base)
+
+    assert changes == [
+        FileChange("dropped.txt", "removed"),
+        FileChange("edited.txt", "modified"),
+        FileChange("grown.txt", "modified"),
+        FileChange("sub/new.txt", "added"),
+    ]
+    assert unchanged == 2
+    assert untracked == 2  # local.txt, .venv/bin/python
+
+    # without the installed render, only the new version is tracked
+    changes, _, untracked = compare_trees(installed, rendered)
+    assert FileChange("dropped.txt", "removed") not in changes
+    assert untracked == 3
+
+
+def test_write_diff(tmp_path: Path):
+    installed = _tree(tmp_path / "a", {"x.txt": b"one\ntwo", "bin": b"\0\1"})
+    rendered = _tree(tmp_path / "b", {"x.txt": b"one\nthree\n", "bin": b"\0\2"})
+    out = io.StringIO()
+
+    write_diff(
+        [FileChange("bin", "modified"), FileChange("x.txt", "modified")],
+        installed,
+        rendered,
+        out,
+    )
+
+    assert out.getvalue().splitlines() == [
+        "Binary files a/bin and b/bin differ",
+        "--- a/x.txt",
+        "+++ b/x.txt",
+        "@@ -1,2 +1,2 @@",
+        " one",
+        "-two",
+        "\\ No newline at end of file",
+        "+three",
+    ]
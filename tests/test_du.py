@@ -0,0 +1,82 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from coasti.timing import recorder
+from coasti.workspace.du import CACHE_PATH, workspace_usage
+
+
+@pytest.fixture
+def workspace(tmp_path: Path) -> Path:
+    product = tmp_path / "products" / "p1"
+    for part in ("data", "logs", "config"):
+        (product / part).mkdir(parents=True)
+        (tmp_path / part).mkdir(exist_ok=True)
+        (tmp_path / part / "p1").symlink_to(product / part)
+    (product / "README.md").write_bytes(b"x" * 10_000)
+    (product / "data" / "big").write_bytes(b"x" * 100_000)
+    (product / "logs" / "coasti.log").write_bytes(b"x" * 1_000)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def fresh_recorder():
+    recorder.reset(command="test")
+    yield recorder
+    recorder.reset()
+
+
+def test_parts_are_not_counted_twice(workspace: Path):
+    products = {"p1": workspace / "products" / "p1", "p2": workspace / "nope"}
+    p1, p2 = workspace_usage(workspace, products)
+
+    assert p1.product == "p1" and p1.installed
+    assert p1.parts["product"].files == 1  # README.md, but not data and logs
+    assert p1.parts["data"].files == 1
+    assert p1.parts["logs"].files == 1
+    assert p1.parts["data"].bytes >= 100_000
+    assert p1.total.files == 3
+    assert p1.total.bytes == sum(u.bytes for u in p1.parts.values())
+
+    assert p2.product == "p2" and not p2.installed
+    assert p2.total.bytes == 0
+
+
+def test_unchanged_dirs_are_not_rescanned(workspace: Path):
+    products = {"p1": workspace / "products" / "p1"}
+    (first,) = workspace_usage(workspace, products)
+    # products/p1 and its config, but not data and logs
+    assert recorder.counters["cache_miss.du"] == 2
+    assert (workspace / CACHE_PATH).is_file()
+
+    (second,) = workspace_usage(workspace, products)
+    assert recorder.counters["cache_hit.du"] == 2
+    assert second == first
+
+    # a new file changes the mtime of its dir, only that one is rescanned
+    (workspace / "products" / "p1" / "config" / "new.yml").write_bytes(b"x")
+    (third,) = workspace_usage(workspace, products)
+    assert recorder.counters["cache_miss.du"] == 3
+    assert third.parts["product"].files == 2
+
+
+def test_growing_logs_are_not_stale(workspace: Path):
+    products = {"p1": workspace / "products" / "p1"}
+    (first,) = workspace_usage(workspace, products)
+
+    # appending does not change the mtime of the dir
+    with (workspace / "products" / "p1" / "logs" / "coasti.log").open("ab") as f:
+        f.write(b"x" * 100_000)
+    (second,) = workspace_usage(workspace, products)
+
+    assert second.parts["logs"].bytes >= 100_000 > first.parts["logs"].bytes
+
+
+def test_broken_cache_is_ignored(workspace: Path):
+    (workspace / CACHE_PATH).parent.mkdir()
+    (workspace / CACHE_PATH).write_text("{not json")
+
+    (usage,) = workspace_usage(workspace, {"p1": workspace / "products" / "p1"})
+    assert usage.total.files == 3
+    assert json.loads((workspace / CACHE_PATH).read_text())["version"] == 1
@@ -0,0 +1,62 @@
+import subprocess
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from coasti.git import sparse
+
+
+@pytest.fixture
+def template_repo(tmp_path: Path) -> Path:
+    """A small template repo whose copier.yml includes another file."""
+    repo = tmp_path / "template"
+    (repo / "questions").mkdir(parents=True)
+    (repo / "copier.yml").write_text(
+        "_min_copier_version: 9.11.3\n---\n!include questions/*.yml\n---\n"
+    )
+    (repo / "questions" / "main.yml").write_text("name:\n  type: str\n")
+    (repo / "large_file.txt").write_text("x" * 10_000)
+
+    def run(*cmd: str):
+        subprocess.run(["git", *cmd], cwd=repo, check=True, capture_output=True)
+
+    run("init")
+    run("config", "user.email", "test@example.com")
+    run("config", "user.name", "Test User")
+    run("add", ".")
+    run("commit", "-m", "Initial commit")
+    run("tag", "v1.0.0")
+    return repo
+
+
+@pytest.fixture
+def metadata_cache(tmp_path: Path):
+    cache_dir = tmp_path / "cache"
+    with mock.patch.object(sparse, "_metadata_cache_dir", return_value=cache_dir):
+        yield cache_dir
+
+
+def test_fetch_template_metadata_only_fetches_config(template_repo, metadata_cache):
+    url = f"file://{template_repo}"
+    target = sparse.fetch_template_metadata(url, vcs_ref="v1.0.0")
+
+    assert target.parent == metadata_cache
+    assert (target / "copier.yml").is_file()
+    assert (target / "questions" / "main.yml").is_file()
+    assert not (target / "large_file.txt").exists()
+
+
+def test_fetch_template_metadata_is_cached_by_sha(template_repo, metadata_cache):
+    url = f"file://{template_repo}"
+    first = sparse.fetch_template_metadata(url, vcs_ref="v1.0.0")
+
+    with mock.patch.object(sparse, "_fetch_blobless") as mock_fetch:
+        second = sparse.fetch_template_metadata(url, vcs_ref="v1.0.0")
+        mock_fetch.assert_not_called()
+
+    assert first == second
+    sha = subprocess.check_output(
+        ["git", "rev-parse", "v1.0.0^{commit}"], cwd=template_repo, text=True
+    ).strip()
+    assert first.name == sha
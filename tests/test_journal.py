@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from coasti.product.journal import BatchJournal, journal_path
+
+
+def test_journal_survives_reload(tmp_path: Path):
+    journal = BatchJournal.start(
+        tmp_path, "update", ["a", "b", "c"], {"vcs_ref": "v2"}, {"a": "abc", "b": None}
+    )
+    journal.mark("a", "done")
+    journal.mark("b", "running")
+
+    loaded = BatchJournal.load(tmp_path, "update")
+    assert loaded is not None
+    assert loaded.options == {"vcs_ref": "v2"}
+    # the pinned commits are kept as products finish
+    assert loaded.entries["a"].commit == "abc"
+    assert loaded.entries["c"].commit is None
+    # interrupted and pending products are run again, in the order of the batch
+    assert loaded.unfinished() == ["b", "c"]
+
+
+def test_broken_journal_is_ignored(tmp_path: Path):
+    assert BatchJournal.load(tmp_path, "install") is None
+
+    path = journal_path(tmp_path, "install")
+    path.parent.mkdir(parents=True)
+    path.write_text("{not json")
+    assert BatchJournal.load(tmp_path, "install") is None
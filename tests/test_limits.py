@@ -0,0 +1,166 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from plumbum import local
+
+from coasti.git import retry
+from coasti.git.limits import NetworkLimiter, QueueTimeoutError, repo_host
+from coasti.timing import recorder
+
+
+@pytest.mark.parametrize(
+    ("url", "host"),
+    [
+        ("https://GitLab.example.com/group/repo.git", "gitlab.example.com"),
+        ("ssh://git@example.com:2222/repo.git", "example.com"),
+        ("git@github.com:org/repo.git", "github.com"),
+        ("file:///srv/repos/repo.git", None),
+        ("/srv/repos/repo.git", None),
+        ("C:\\repos\\repo", None),
+        ("../repo", None),
+    ],
+)
+def test_repo_host(url, host):
+    assert repo_host(url) == host
+
+
+def test_remote_url():
+    argv = ["git", "-c", "x=y", "clone", "--no-checkout", "-b", "main", "url", "dst"]
+    assert retry._remote_url(argv, "clone") == "url"
+    argv = ["git", "fetch", "--quiet", "--depth=1", "url", "main"]
+    assert retry._remote_url(argv, "fetch") == "url"
+    assert retry._remote_url(["git", "ls-remote", "url", "-q"], "ls_remote") == "url"
+
+
+def test_fetches_of_remotes_are_limited_by_the_remote_host(
+    tmp_path, monkeypatch: pytest.MonkeyPatch
+):
+    retry.retry_git_network()
+    git = local["git"]
+    git("init", "-q", tmp_path)
+    git("-C", tmp_path, "remote", "add", "origin", "https://gitlab.example.com/r.git")
+    hosts: list[str] = []
+
+    class Limiter(NetworkLimiter):
+        @contextmanager
+        def slot(self, host, subcommand, timeout=None):
+            # record the host, instead of going to the network
+            hosts.append(host)
+            raise QueueTimeoutError(host)
+            yield 0.0
+
+    monkeypatch.setattr(retry, "network_limiter", Limiter)
+    with pytest.raises(QueueTimeoutError), local.cwd(tmp_path):
+        git("fetch", "origin", "main")
+    with pytest.raises(QueueTimeoutError):
+        git("-C", tmp_path, "fetch", "origin")
+
+    assert hosts == ["gitlab.example.com"] * 2
+
+
+def test_limits_per_host_and_in_total():
+    limiter = NetworkLimiter(max_connections=3, max_per_host=2)
+    running = {"a": 0, "b": 0}
+    peak = {"a": 0, "b": 0, "total": 0}
+    lock = threading.Lock()
+
+    def operation(host: str):
+        with limiter.slot(host, "clone"):
+            with lock:
+                running[host] += 1
+                peak[host] = max(peak[host], running[host])
+                peak["total"] = max(peak["total"], sum(running.values()))
+            time.sleep(0.02)
+            with lock:
+                running[host] -= 1
+
+    threads = [
+        threading.Thread(target=operation, args=(host,))
+        for host in ["a"] * 6 + ["b"] * 2
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak["a"] == 2
+    assert peak["total"] == 3
+    assert limiter.running == limiter.queued == 0
+
+
+def test_higher_priorities_start_first():
+    limiter = NetworkLimiter(max_connections=1)
+    started: list[str] = []
+
+    def operation(subcommand: str):
+        with limiter.slot("host", subcommand):
+            started.append(subcommand)
+
+    threads = []
+    with limiter.slot("host", "clone"):
+        for subcommand in ("clone", "fetch", "ls_remote"):
+            threads.append(threading.Thread(target=operation, args=(subcommand,)))
+            threads[-1].start()
+            while limiter.queued < len(threads):
+                time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+
+    assert started == ["ls_remote", "fetch", "clone"]
+
+
+def test_busy_hosts_do_not_hold_back_others():
+    limiter = NetworkLimiter(max_connections=4, max_per_host=1)
+
+    def probe():
+        with limiter.slot("a", "ls_remote"):
+            pass
+
+    blocked = threading.Thread(target=probe)
+    with limiter.slot("a", "clone"):
+        blocked.start()
+        while limiter.queued == 0:
+            time.sleep(0.001)
+        # the waiting probe of `a` has priority, but cannot start
+        with limiter.slot("b", "clone", timeout=1) as waited:
+            assert waited == 0
+    blocked.join()
+
+
+def test_queue_timeout_and_metrics():
+    limiter = NetworkLimiter(max_connections=1)
+    recorder.reset()
+    with limiter.slot("host", "clone"):
+        with pytest.raises(QueueTimeoutError):
+            with limiter.slot("host", "fetch", timeout=0.05):
+                pass
+    with limiter.slot("host", "fetch", timeout=1) as waited:
+        assert waited == 0
+    assert limiter.queued == 0
+
+    def hold():
+        with limiter.slot("host", "clone"):
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    while limiter.running == 0:
+        time.sleep(0.001)
+    with limiter.slot("host", "fetch") as waited:
+        assert waited > 0
+    thread.join()
+
+    assert recorder.counters["git_queue_waits.host"] == 1
+    assert recorder.counters["git_queue_wait_ms.host"] > 0
+    assert [s.name for s in recorder.spans].count("git.queue") == 2
+
+
+def test_from_env(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("COASTI_GIT_MAX_PER_HOST", "1")
+    monkeypatch.setenv("COASTI_GIT_PRIORITIES", "clone, ls-remote")
+    limiter = NetworkLimiter.from_env()
+    assert limiter.max_per_host == 1
+    assert limiter.priority("clone") < limiter.priority("ls_remote")
+    assert limiter.priority("fetch") == 2
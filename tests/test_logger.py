@@ -1,9 +1,19 @@
+import gzip
 import logging
+import re
+import threading
 from unittest.mock import patch
 
 import pytest
 
-from coasti.logger import log, setup_logging_handler
+from coasti.logger import (
+    PlainHandler,
+    _RecordQueueHandler,
+    log,
+    product_log_file,
+    setup_logging_handler,
+    stop_logging,
+)
 
 
 @pytest.mark.parametrize(
@@ -37,3 +47,72 @@ def test_setup_logging_handler_level_mapping(verbose_level, expected_level):
             # For other levels, setLevel should be called on the log object
             mock_basicConfig.assert_not_called()
             mock_setLevel.assert_called_once_with(expected_level)
+
+
+def test_non_terminal_falls_back_to_plain_handler():
+    setup_logging_handler(0)
+    try:
+        queue_handler = log.handlers[0]
+        assert isinstance(queue_handler, _RecordQueueHandler)
+        assert isinstance(queue_handler.target, PlainHandler)
+    finally:
+        stop_logging()
+
+
+def test_concurrent_records_never_interleave(capsys):
+    setup_logging_handler(0)
+
+    def work(worker: int):
+        for i in range(100):
+            log.info(f"worker-{worker} line-{i} " + "x" * 200)
+
+    threads = [threading.Thread(target=work, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop_logging()
+
+    lines = [line for line in capsys.readouterr().out.splitlines() if "worker-" in line]
+    assert len(lines) == 800
+    assert all(re.fullmatch(r"worker-\d line-\d+ x{200}", line) for line in lines)
+
+
+@pytest.fixture
+def info_level():
+    previous = log.level
+    log.setLevel(logging.INFO)
+    yield
+    log.setLevel(previous)
+
+
+def test_product_log_file_only_gets_records_of_its_product(tmp_path, info_level):
+    def other_product():
+        with product_log_file("other", tmp_path / "other"):
+            log.info("message for other")
+
+    with product_log_file("mine", tmp_path / "mine"):
+        log.info("message for mine")
+        thread = threading.Thread(target=other_product)
+        thread.start()
+        thread.join()
+
+    mine = (tmp_path / "mine" / "coasti.log").read_text()
+    assert "message for mine" in mine
+    assert "message for other" not in mine
+    assert "message for other" in (tmp_path / "other" / "coasti.log").read_text()
+
+
+def test_product_log_file_rotates_compressed(tmp_path, monkeypatch, info_level):
+    monkeypatch.setenv("COASTI_LOG_MAX_BYTES", "500")
+    monkeypatch.setenv("COASTI_LOG_BACKUP_COUNT", "2")
+
+    with product_log_file("mine", tmp_path):
+        for i in range(100):
+            log.info(f"line {i} " + "x" * 50)
+
+    assert (tmp_path / "coasti.log").stat().st_size <= 500
+    rotated = sorted(p.name for p in tmp_path.glob("coasti.log.*"))
+    assert rotated == ["coasti.log.1.gz", "coasti.log.2.gz"]
+    with gzip.open(tmp_path / "coasti.log.1.gz", "rt") as f:
+        assert "line" in f.read()
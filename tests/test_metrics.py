@@ -0,0 +1,71 @@
+import time
+from pathlib import Path
+
+from coasti.metrics import write_metrics
+from coasti.timing import Recorder, Span
+
+
+def _span(name: str, status: str = "ok", start: float = 1000.0, **counters) -> Span:
+    span = Span(
+        name=name,
+        start=start,
+        duration=2.5,
+        thread_id=1,
+        thread_name="MainThread",
+        depth=0,
+        parent=None,
+        attrs={"product": "p1", "status": status},
+    )
+    span.counters.update(counters)
+    return span
+
+
+def test_write_metrics_accumulates_counters(tmp_path: Path):
+    recorder = Recorder()
+    recorder.reset(command="product")
+    recorder.workspace = tmp_path / "coasti"
+    recorder.add(_span("product.install", bytes_fetched=100))
+    recorder.count("cache_hit.template_metadata")
+    recorder.count("git_queue_waits.gitlab.example.com", 2)
+    recorder.count("git_queue_wait_ms.gitlab.example.com", 1500)
+
+    prom = write_metrics(tmp_path / "metrics", recorder)
+    text = prom.read_text()
+    assert prom.suffix == ".prom"
+    assert (
+        'coasti_product_operation_duration_seconds{workspace="'
+        f'{tmp_path / "coasti"}",product="p1",operation="install"}} 2.5'
+    ) in text
+    assert 'operation="install",status="success"} 1\n' in text
+    assert 'product="p1"} 100\n' in text  # bytes fetched
+    assert 'cache="template_metadata",result="hit"} 1\n' in text
+    assert "coasti_product_last_success_timestamp_seconds" in text
+    assert "coasti_git_queue_waits_total{" in text
+    assert 'host="gitlab.example.com"} 1.5\n' in text  # seconds waited
+
+    # a second run adds to the counters, and failures do not update last success
+    recorder.reset(command="product")
+    recorder.workspace = tmp_path / "coasti"
+    recorder.add(_span("product.install", status="error"))
+    text = write_metrics(tmp_path / "metrics", recorder).read_text()
+    assert 'operation="install",status="success"} 1\n' in text
+    assert 'operation="install",status="failure"} 1\n' in text
+    assert 'operation="install"} 1002.5\n' in text  # last success unchanged
+
+    # only the .prom file is visible to the collector, written atomically
+    assert [p.name for p in (tmp_path / "metrics").glob("*.prom")] == [prom.name]
+
+
+def test_write_metrics_keeps_full_precision(tmp_path: Path):
+    recorder = Recorder()
+    recorder.reset(command="product")
+    start = time.time()
+    recorder.add(_span("product.update", start=start, bytes_fetched=12_345_678))
+
+    text = write_metrics(tmp_path / "metrics", recorder).read_text()
+    assert f'operation="update"}} {start + 2.5!r}\n' in text
+    assert 'product="p1"} 12345678\n' in text
+    finished = [
+        line for line in text.splitlines() if line.startswith("coasti_run_timestamp")
+    ]
+    assert abs(float(finished[0].rpartition(" ")[2]) - time.time()) < 60
@@ -0,0 +1,50 @@
+import io
+
+import pytest
+from rich.console import Console
+
+from coasti import logger, timing
+from coasti.logger import product_log_file
+from coasti.progress import ProductProgress
+from coasti.timing import count, span
+
+
+def _console(monkeypatch: pytest.MonkeyPatch, terminal: bool) -> io.StringIO:
+    out = io.StringIO()
+    console = Console(file=out, force_terminal=terminal, width=120)
+    monkeypatch.setattr(logger, "_console", console)
+    return out
+
+
+def test_progress_tracks_phase_and_throughput(monkeypatch, tmp_path):
+    _console(monkeypatch, terminal=True)
+
+    with ProductProgress(["p1", "p2"], "install") as progress:
+        assert timing.listeners == [progress]
+        with progress.track("p1"), product_log_file("p1", tmp_path):
+            with span("copier.run_copy") as attrs:
+                fields = progress._progress.tasks[0].fields
+                assert fields["phase"] == "copier.run_copy"
+                attrs["bytes_written"] = 2048
+            count("bytes_fetched", 1024)
+
+        with pytest.raises(RuntimeError), progress.track("p2"):
+            raise RuntimeError("boom")
+
+    p1, p2 = progress._progress.tasks
+    assert p1.finished and p1.fields["phase"] == "[green]done"
+    assert p1.fields["throughput"].startswith("3.1 kB")
+    assert not p2.finished and p2.fields["phase"] == "[red]failed"
+    assert timing.listeners == []
+
+
+def test_progress_is_disabled_without_terminal(monkeypatch, tmp_path):
+    out = _console(monkeypatch, terminal=False)
+
+    with ProductProgress(["p1", "p2"], "install") as progress:
+        with progress.track("p1"), product_log_file("p1", tmp_path), span("x"):
+            pass
+
+    assert not progress.enabled
+    assert timing.listeners == []
+    assert out.getvalue() == ""
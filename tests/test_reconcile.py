@@ -0,0 +1,80 @@
+from pathlib import Path
+
+import pytest
+
+from coasti.product.reconcile import Operation, apply, plan
+
+
+@pytest.fixture
+def base(tmp_path: Path) -> Path:
+    for pid in ("p1", "p2"):
+        for part in ("config", "data", "logs"):
+            (tmp_path / "products" / pid / part).mkdir(parents=True)
+    (tmp_path / "config").mkdir()
+    (tmp_path / "config" / "products.yml").write_text("products: []\n")
+    return tmp_path
+
+
+def _desired(base: Path, *pids: str) -> dict[Path, Path]:
+    return {
+        base / part / pid: base / "products" / pid / part
+        for pid in pids
+        for part in ("config", "data", "logs")
+    }
+
+
+def test_plan_and_apply(base: Path):
+    desired = _desired(base, "p1", "p2")
+    ops = plan(base, desired)
+    # config/ exists, data/ and logs/ not
+    assert Operation("mkdir", base / "data") in ops
+    assert Operation("mkdir", base / "logs") in ops
+    link = base / "config" / "p1"
+    assert Operation("create", link, desired[link]) in ops
+    assert len([op for op in ops if op.action == "create"]) == 6
+
+    assert apply(ops) == 0
+    assert plan(base, desired) == []
+    assert (base / "data" / "p2").resolve() == base / "products" / "p2" / "data"
+
+
+def test_fix_delete_and_conflict(base: Path):
+    apply(plan(base, _desired(base, "p1", "p2")))
+
+    # wrong target, stale product, real dir instead of a link, unrelated link
+    (base / "data" / "p1").unlink()
+    (base / "data" / "p1").symlink_to(base / "products" / "p2" / "data")
+    (base / "logs" / "p1").unlink()
+    (base / "logs" / "p1").mkdir()
+    (base / "logs" / "mine").symlink_to(base / "products")
+
+    desired = _desired(base, "p1")  # p2 was removed from products.yml
+    ops = plan(base, desired)
+    assert ops == [
+        Operation("delete", base / "config" / "p2"),
+        Operation("fix", base / "data" / "p1", base / "products" / "p1" / "data"),
+        Operation("delete", base / "data" / "p2"),
+        Operation("conflict", base / "logs" / "p1", base / "products" / "p1" / "logs"),
+        Operation("delete", base / "logs" / "p2"),
+    ]
+
+    assert apply(ops) == 1  # the conflict
+    assert (base / "data" / "p1").resolve() == base / "products" / "p1" / "data"
+    assert not (base / "config" / "p2").exists()
+    assert (base / "logs" / "p1").is_dir()
+    assert (base / "logs" / "mine").is_symlink()
+    assert [op.action for op in plan(base, desired)] == ["conflict"]
+
+
+def test_plan_without_prune_keeps_other_links(base: Path):
+    apply(plan(base, _desired(base, "p1", "p2")))
+
+    assert plan(base, _desired(base, "p1"), prune=False) == []
+
+
+def test_relative_links_are_compared_resolved(base: Path):
+    (base / "data").mkdir()
+    (base / "data" / "p1").symlink_to(Path("..") / "products" / "p1" / "data")
+    desired = {base / "data" / "p1": base / "products" / "p1" / "data"}
+
+    assert plan(base, desired, prune=False) == []
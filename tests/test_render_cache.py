@@ -0,0 +1,60 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from coasti.product import render_cache
+from coasti.product.render_cache import _temp_copy_role, prune, render_key
+
+
+@pytest.fixture
+def store_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setenv("COASTI_STORE_DIR", str(tmp_path / "store"))
+    return tmp_path / "store"
+
+
+def test_render_key_ignores_private_answers_and_exclude_order():
+    answers = {"_src_path": "repo", "_commit": "v1", "name": "x"}
+    key = render_key(answers, ["a", "b"])
+    assert key == render_key({**answers, "_copier_conf": {}}, ["b", "a", "a"])
+    assert key != render_key({**answers, "name": "y"}, ["a", "b"])
+    assert key != render_key({**answers, "_commit": "v2"}, ["a", "b"])
+    assert key != render_key(answers, ["a"])
+    # without a commit, nothing pins the template version
+    assert render_key({"_src_path": "repo", "name": "x"}, []) is None
+
+
+def test_temp_copy_role():
+    assert _temp_copy_role(Path("/tmp/copier._main.old_copy.abc/sub")) == "old"
+    assert _temp_copy_role(Path("/tmp/copier._main.new_copy.abc")) == "new"
+    assert _temp_copy_role(Path("/coasti/products/.a.versions/1")) is None
+
+
+def test_prune_keeps_most_recently_used(store_dir: Path):
+    for i in range(3):
+        entry = render_cache.cache_dir() / f"render{i}"
+        entry.mkdir(parents=True)
+        os.utime(entry, (i, i))
+
+    prune(render_cache.cache_dir(), keep=2)
+
+    assert sorted(p.name for p in render_cache.cache_dir().iterdir()) == [
+        "render1",
+        "render2",
+    ]
+
+
+def test_installed_render_is_found_by_answers(store_dir: Path):
+    answers = {"_src_path": "repo", "_commit": "v1", "name": "x"}
+    key = render_key(answers, ["copier.yml"])
+    assert key is not None
+    (render_cache.cache_dir() / key).mkdir(parents=True)
+    assert render_cache.installed_render(answers) is None
+
+    render_cache._index(answers, key)
+    assert render_cache.installed_render(answers) == render_cache.cache_dir() / key
+    assert render_cache.installed_render({**answers, "name": "y"}) is None
+
+    prune(render_cache.cache_dir(), keep=0)
+    assert render_cache.installed_render(answers) is None
+    assert not any((render_cache.cache_dir() / ".answers").iterdir())
@@ -0,0 +1,93 @@
+from pathlib import Path
+
+import pytest
+from plumbum import local
+from plumbum.commands.processes import ProcessExecutionError, ProcessTimedOut
+
+from coasti.git import retry
+from coasti.timing import recorder
+
+
+def _failure(stderr: str) -> ProcessExecutionError:
+    return ProcessExecutionError(["git", "fetch"], 128, "", stderr)
+
+
+@pytest.mark.parametrize(
+    ("error", "transient"),
+    [
+        (_failure("fatal: unable to access 'x': Could not resolve host: x"), True),
+        (_failure("fatal: the remote end hung up unexpectedly"), True),
+        (_failure("The requested URL returned error: 503"), True),
+        (ProcessTimedOut("timed out", ["git", "fetch"]), True),
+        (_failure("fatal: Authentication failed for 'https://x/'"), False),
+        (_failure("git@x: Permission denied (publickey)."), False),
+        (_failure("fatal: couldn't find remote ref nope"), False),
+        (_failure("something else"), False),
+    ],
+)
+def test_is_transient(error, transient):
+    assert retry.is_transient(error) is transient
+
+
+@pytest.fixture
+def no_delay(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(retry.RetryPolicy, "delay", lambda self, retry: 0.0)
+
+
+def test_transient_failures_are_retried(no_delay):
+    attempts = []
+
+    def run(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise _failure("Connection reset by peer")
+        return "ok"
+
+    assert retry.with_retries(run, "git fetch", retry.RetryPolicy(retries=3)) == "ok"
+    assert len(attempts) == 3
+    # no time limit, unless configured
+    assert attempts == [None] * 3
+
+    attempts.clear()
+    policy = retry.RetryPolicy(retries=3, timeout=600)
+    assert retry.with_retries(run, "git fetch", policy) == "ok"
+    assert all(0 < t <= 600 for t in attempts)
+
+
+def test_fatal_failures_and_budgets_are_not_retried(no_delay):
+    attempts = []
+
+    def run(timeout):
+        attempts.append(timeout)
+        raise _failure("fatal: Authentication failed")
+
+    with pytest.raises(ProcessExecutionError):
+        retry.with_retries(run, "git fetch")
+    assert len(attempts) == 1
+
+    with retry.batch_budget(0), pytest.raises(retry.BudgetExceededError):
+        retry.with_retries(run, "git fetch")
+    assert len(attempts) == 1
+
+
+def test_failed_clones_are_retried_in_a_clean_dir(
+    tmp_path: Path, no_delay, monkeypatch: pytest.MonkeyPatch
+):
+    retry.retry_git_network()
+    monkeypatch.setenv("COASTI_GIT_RETRIES", "2")
+    dst = tmp_path / "clone"
+    dst.mkdir()
+    recorder.reset()
+
+    # nothing listens on port 1: connection refused, a transient failure
+    with pytest.raises(ProcessExecutionError):
+        local["git"]("clone", "--no-checkout", "http://127.0.0.1:1/repo.git", dst)
+
+    assert recorder.counters["git_retries"] == 2
+    assert dst.is_dir()
+
+
+def test_clone_destination():
+    argv = ["git", "clone", "--filter=blob:none", "-b", "main", "url", "/tmp/dst"]
+    assert retry._clone_destination(argv) == Path("/tmp/dst")
+    assert retry._clone_destination(["git", "clone", "url"]) is None
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from coasti.scheduler import CycleError, run_dag, topological_order
+
+
+def test_topological_order_keeps_order_where_possible():
+    deps = {"c": ["b"], "a": [], "b": ["a"], "d": []}
+    assert topological_order(deps) == ["a", "d", "b", "c"]
+
+
+def test_topological_order_reports_cycle():
+    with pytest.raises(CycleError) as e:
+        topological_order({"a": ["b"], "b": ["c"], "c": ["b"]})
+    assert e.value.cycle == ["b", "c", "b"]
+
+    with pytest.raises(ValueError, match="unknown"):
+        topological_order({"a": ["x"]})
+
+
+def test_run_dag_runs_independent_jobs_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+    order = []
+
+    def job(name, wait=False):
+        def run():
+            if wait:
+                barrier.wait()  # fails unless both run at the same time
+            order.append(name)
+
+        return run
+
+    results = run_dag(
+        {"a": job("a", wait=True), "b": job("b", wait=True), "c": job("c")},
+        depends_on={"c": ["a", "b"]},
+        max_workers=2,
+    )
+
+    assert all(r.status == "ok" for r in results.values())
+    assert order[-1] == "c"
+
+
+def test_run_dag_skips_dependents_of_failures():
+    def fail():
+        time.sleep(0.01)
+        raise RuntimeError("boom")
+
+    results = run_dag(
+        {"a": fail, "b": lambda: None, "c": lambda: None, "d": lambda: None},
+        # dependencies outside of the jobs count as done
+        depends_on={"b": ["a"], "c": ["b"], "d": ["external"]},
+    )
+
+    assert {job: r.status for job, r in results.items()} == {
+        "a": "failed",
+        "d": "ok",
+        "b": "skipped",
+        "c": "skipped",
+    }
+    assert str(results["a"].error) == "boom"
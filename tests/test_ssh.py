@@ -0,0 +1,40 @@
+import shlex
+import stat
+from pathlib import Path
+
+import pytest
+
+from coasti.git import ssh
+
+
+@pytest.fixture
+def control_dir():
+    yield ssh.control_dir()
+    ssh.close_connections()
+
+
+def test_connections_are_shared_per_key(control_dir: Path):
+    first = shlex.split(ssh.ssh_command("/keys/first key"))
+    second = shlex.split(ssh.ssh_command("/keys/second"))
+
+    assert first[:3] == ["ssh", "-i", "/keys/first key"]
+    assert "ControlMaster=auto" in first
+    paths = [
+        next(o for o in command if o.startswith("ControlPath="))
+        for command in (first, second)
+    ]
+    assert paths[0] != paths[1]
+    assert all(p.startswith(f"ControlPath={control_dir}/") for p in paths)
+    assert stat.S_IMODE(control_dir.stat().st_mode) == 0o700
+
+
+def test_multiplexing_can_be_disabled(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("COASTI_SSH_MULTIPLEX", "0")
+    assert ssh.ssh_command("/keys/id") == "ssh -i /keys/id -o IdentitiesOnly=yes"
+
+
+def test_control_dir_is_removed_on_close(control_dir: Path):
+    ssh.close_connections()
+    assert not control_dir.exists()
+    # a new one is created when needed again
+    assert ssh.control_dir() != control_dir
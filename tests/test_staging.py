@@ -0,0 +1,144 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from coasti.product.staging import (
+    previous_path,
+    rollback,
+    runtime_path,
+    staged,
+    versions_path,
+)
+
+
+@pytest.fixture
+def dst(tmp_path: Path) -> Path:
+    """A product dir from before staged versions."""
+    dst = tmp_path / "products" / "p1"
+    (dst / "data").mkdir(parents=True)
+    (dst / "data" / "state.db").write_text("state")
+    (dst / "logs").mkdir()
+    (dst / "README.md").write_text("v1")
+    return dst
+
+
+def _render(path: Path, version: str):
+    (path / "data").mkdir(parents=True, exist_ok=True)
+    (path / "data" / ".gitkeep").write_text("")
+    (path / "data" / "state.db").write_text("template default")
+    (path / "README.md").write_text(version)
+
+
+def _versions(dst: Path) -> list[str]:
+    return sorted(p.name for p in versions_path(dst).iterdir())
+
+
+def test_failed_render_leaves_product_untouched(dst: Path):
+    with pytest.raises(RuntimeError), staged(dst) as version:
+        _render(version, "v2")
+        raise RuntimeError("copier failed")
+
+    assert (dst / "README.md").read_text() == "v1"
+    assert (dst / "data" / "state.db").read_text() == "state"
+    assert _versions(dst) == ["0"]  # the adopted product dir
+    assert not os.path.lexists(previous_path(dst))
+
+
+def test_swap_flips_a_link_and_keeps_runtime_state(dst: Path):
+    with staged(dst) as version:
+        _render(version, "v1")
+    data = (dst / "data").resolve()
+    assert data == runtime_path(dst) / "data"
+
+    with staged(dst) as version:
+        _render(version, "v2")
+        # the live product is untouched while rendering
+        assert (dst / "README.md").read_text() == "v1"
+
+    # rendered at its final path, which is now live
+    assert dst.is_symlink() and dst.resolve() == version.resolve()
+    assert (dst / "README.md").read_text() == "v2"
+    # live data wins and never moves, new entries of the template are added
+    assert (dst / "data").resolve() == data
+    assert (dst / "data" / "state.db").read_text() == "state"
+    assert (dst / "data" / ".gitkeep").is_file()
+    assert (previous_path(dst) / "README.md").read_text() == "v1"
+    assert (previous_path(dst) / "data").resolve() == data
+    assert _versions(dst) == ["1", "2"]
+
+    rollback(dst)
+    assert (dst / "README.md").read_text() == "v1"
+    assert (dst / "data" / "state.db").read_text() == "state"
+    assert (previous_path(dst) / "README.md").read_text() == "v2"
+
+
+def test_snapshot_is_committed_and_cleaned_up(dst: Path):
+    with staged(dst, snapshot=True) as version:
+        assert (version / "README.md").read_text() == "v1"
+        assert (version / ".git").is_dir()
+        assert not (version / "data").exists()
+        (version / "README.md").write_text("v2")
+
+    assert (dst / "README.md").read_text() == "v2"
+    assert (dst / "data" / "state.db").read_text() == "state"
+    assert not (dst / ".git").exists()
+
+
+def test_fresh_install_keeps_no_previous(tmp_path: Path):
+    dst = tmp_path / "p1"
+    (dst / "logs").mkdir(parents=True)  # e.g. written by the product log
+    (dst / "logs" / "coasti.log").write_text("installing")
+
+    with staged(dst) as version:
+        _render(version, "v1")
+
+    assert (dst / "logs" / "coasti.log").read_text() == "installing"
+    assert not os.path.lexists(previous_path(dst))
+    with pytest.raises(FileNotFoundError):
+        rollback(dst)
+
+
+# kills the process at the n-th rename, after `_render` as in the tests above
+_KILLED_AT_RENAME = """
+import os, sys
+from pathlib import Path
+from coasti.product import staging
+
+dst, n = Path(sys.argv[1]), int(sys.argv[2])
+renames = iter(range(n + 1))
+
+def killing(rename):
+    def wrapper(self, target):
+        if next(renames) == n:
+            os._exit(9)
+        return rename(self, target)
+    return wrapper
+
+Path.rename, Path.replace = killing(Path.rename), killing(Path.replace)
+with staging.staged(dst) as path:
+    (path / "data").mkdir(parents=True)
+    (path / "data" / ".gitkeep").write_text("")
+    (path / "README.md").write_text("v2")
+"""
+
+
+@pytest.mark.parametrize("n", range(7))
+def test_interrupted_swaps_are_recovered(dst: Path, n: int):
+    killed = subprocess.run(
+        [sys.executable, "-c", _KILLED_AT_RENAME, str(dst), str(n)], check=False
+    )
+    assert killed.returncode == 9
+    if os.path.lexists(dst):
+        assert (dst / "README.md").read_text() in ("v1", "v2")
+
+    with staged(dst) as version:
+        _render(version, "v3")
+
+    assert (dst / "README.md").read_text() == "v3"
+    assert (dst / "data" / "state.db").read_text() == "state"
+    assert (dst / "logs").is_dir()
+    assert previous_path(dst).is_dir()
+    assert len(_versions(dst)) == 2
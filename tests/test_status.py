@@ -0,0 +1,64 @@
+import subprocess
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from coasti.status import git_changes, link_problems
+
+
+def _git(repo: Path, *args: str):
+    subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Path:
+    for pid in ("p1", "p2", "p3"):
+        (tmp_path / "products" / pid).mkdir(parents=True)
+        (tmp_path / "products" / pid / "README.md").write_text(pid)
+    _git(tmp_path, "init")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-m", "i")
+    return tmp_path
+
+
+def test_git_changes_per_product(repo: Path, tmp_path_factory):
+    (repo / "products" / "p1" / "README.md").write_text("changed")
+    (repo / "products" / "p2" / "new.txt").write_text("new")
+    _git(repo, "mv", "products/p2/README.md", "products/p2/MOVED.md")
+    outside = tmp_path_factory.mktemp("outside")
+
+    paths = [repo / "products" / pid for pid in ("p1", "p2", "p3")] + [outside]
+    changes = git_changes(repo, paths)
+
+    assert changes == {
+        repo / "products" / "p1": ["README.md"],
+        repo / "products" / "p2": ["MOVED.md", "new.txt"],
+        repo / "products" / "p3": [],
+    }
+
+
+def test_git_changes_without_repo(tmp_path: Path):
+    (tmp_path / "p1").mkdir()
+    # avoid finding a repo above tmp_path
+    with mock.patch.dict("os.environ", {"GIT_CEILING_DIRECTORIES": str(tmp_path)}):
+        assert git_changes(tmp_path, [tmp_path / "p1"]) is None
+
+
+def test_link_problems(tmp_path: Path):
+    base = tmp_path
+    dst = base / "products" / "p1"
+    product = mock.Mock(id="p1", coasti_base_dir=base, dst_path=dst)
+    links = {base / part / "p1": dst / part for part in ("config", "data", "logs")}
+    product.expected_symlinks.return_value = links
+    for link, target in links.items():
+        target.mkdir(parents=True)
+        link.parent.mkdir()
+    (base / "config" / "p1").symlink_to(dst / "config")
+    (base / "data" / "p1").symlink_to(dst / "logs")
+    (base / "logs" / "p1").mkdir()
+
+    assert link_problems(product) == [
+        f"data/p1 points to {dst / 'logs'}",
+        "logs/p1 is not a symlink",
+    ]
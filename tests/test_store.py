@@ -0,0 +1,117 @@
+import errno
+import os
+import stat
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from coasti.store import FileStore, copy_writable, file_digest
+
+
+@pytest.fixture
+def store(tmp_path: Path) -> FileStore:
+    return FileStore(tmp_path / "store")
+
+
+def _tree(root: Path) -> Path:
+    (root / "bin").mkdir(parents=True)
+    (root / "README.md").write_text("same everywhere")
+    (root / "bin" / "run.sh").write_text("same everywhere")
+    (root / "bin" / "run.sh").chmod(0o755)
+    (root / "empty").write_text("")
+    return root
+
+
+def test_trees_share_files(store: FileStore, tmp_path: Path):
+    a, b = _tree(tmp_path / "a"), _tree(tmp_path / "b")
+    files = ["README.md", "bin/run.sh", "empty", "missing"]
+
+    assert store.link_tree(a, files) == {
+        "hardlink": 2,
+        "reflink": 0,
+        "copy": 0,
+        "shared_bytes": 30,
+    }
+    store.link_tree(b, files)
+
+    assert (a / "README.md").samefile(b / "README.md")
+    assert (a / "bin" / "run.sh").samefile(b / "bin" / "run.sh")
+    # same content, but the executable bit is part of the key
+    assert not (a / "README.md").samefile(a / "bin" / "run.sh")
+    assert os.access(b / "bin" / "run.sh", os.X_OK)
+    assert (a / "README.md").stat().st_nlink == 3
+    assert not (a / "README.md").stat().st_mode & stat.S_IWUSR
+    assert (a / "empty").stat().st_nlink == 1
+
+
+def test_keeps_copy_without_hardlinks(store: FileStore, tmp_path: Path):
+    a = _tree(tmp_path / "a")
+    store.add(a / "README.md")
+    b = _tree(tmp_path / "b")
+
+    cross_device = OSError(errno.EXDEV, "Invalid cross-device link")
+    with (
+        mock.patch("coasti.store.os.link", side_effect=cross_device),
+        mock.patch("coasti.store._reflink", return_value=False),
+    ):
+        assert store.link(b / "README.md") == "copy"
+    assert (b / "README.md").read_text() == "same everywhere"
+    assert not (a / "README.md").samefile(b / "README.md")
+
+
+def test_copy_writable_breaks_the_link(store: FileStore, tmp_path: Path):
+    a = _tree(tmp_path / "a")
+    store.link(a / "README.md")
+
+    copy_writable(str(a / "README.md"), str(tmp_path / "copy.md"))
+    (tmp_path / "copy.md").write_text("changed")
+
+    assert (a / "README.md").read_text() == "same everywhere"
+
+
+def test_editable_files_are_never_hardlinked(store: FileStore, tmp_path: Path):
+    a, b = _tree(tmp_path / "a"), _tree(tmp_path / "b")
+    store.link_tree(a, ["README.md"])
+
+    stats = store.link_tree(b, ["README.md", "bin/run.sh"], editable=True)
+
+    # reflinks where the filesystem has them, else the copies stay
+    assert stats["hardlink"] == 0
+    assert stats["reflink"] + stats["copy"] == 2
+    readme = b / "README.md"
+    assert readme.stat().st_nlink == 1
+    assert readme.stat().st_mode & stat.S_IWUSR
+    readme.write_text("edited")
+    assert (a / "README.md").read_text() == "same everywhere"
+
+
+def test_reflink_support_is_probed_once(store: FileStore, tmp_path: Path):
+    with (
+        mock.patch("coasti.store._reflinks", {}),
+        mock.patch("coasti.store._reflink", return_value=False) as reflink,
+    ):
+        assert not store.can_reflink(tmp_path)
+        assert not store.can_reflink(tmp_path)
+    assert reflink.call_count == 1
+    assert not list(tmp_path.glob(".coasti-probe.*"))
+    assert not list(store.root.glob(".probe.*"))
+
+
+def test_prune_removes_unlinked_files(store: FileStore, tmp_path: Path):
+    a = _tree(tmp_path / "a")
+    store.link_tree(a, ["README.md", "bin/run.sh"])
+    artifact = tmp_path / "artifact.tar.gz"
+    artifact.write_text("downloaded")
+    kept = store.add(artifact)
+    artifact.unlink()
+
+    assert store.prune(keep=[file_digest(kept)]).files == 0
+    (a / "bin" / "run.sh").unlink()
+
+    dry = store.prune(keep=[file_digest(kept)], dry_run=True)
+    assert (dry.files, dry.bytes) == (1, len("same everywhere"))
+    assert store.prune(keep=[file_digest(kept)]) == dry
+    assert not store.object_path(file_digest(a / "README.md"), True).exists()
+    assert store.object_path(file_digest(a / "README.md"), False).exists()
+    assert kept.exists()
@@ -0,0 +1,77 @@
+import threading
+from pathlib import Path
+
+import pytest
+from plumbum import local
+
+from coasti.product import threads
+
+
+@pytest.fixture
+def patched_copier():
+    assert threads.thread_safe_copier()
+    yield
+    threads.restore_copier()
+
+
+@pytest.mark.usefixtures("patched_copier")
+def test_plumbum_cwd_is_per_thread(tmp_path: Path):
+    dirs = [tmp_path / "a", tmp_path / "b"]
+    for d in dirs:
+        d.mkdir()
+    process_cwd = Path.cwd()
+    both_inside = threading.Barrier(len(dirs))
+    seen: dict[str, tuple[Path, Path]] = {}
+
+    def work(path: Path):
+        with local.cwd(path):
+            both_inside.wait(timeout=10)
+            # commands run in the thread's working dir
+            seen[path.name] = (Path(str(local.cwd)), Path(local["pwd"]().strip()))
+            both_inside.wait(timeout=10)
+
+    threads = [threading.Thread(target=work, args=(d,)) for d in dirs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for d in dirs:
+        cwd, pwd = seen[d.name]
+        assert cwd == d
+        assert pwd.resolve() == d.resolve()
+    assert Path.cwd() == process_cwd
+    assert Path(str(local.cwd)) == process_cwd
+
+
+@pytest.mark.usefixtures("patched_copier")
+def test_plumbum_cwd_fails_like_chdir(tmp_path: Path):
+    (tmp_path / "file").touch()
+
+    with pytest.raises(FileNotFoundError), local.cwd(tmp_path / "missing"):
+        pass
+    with pytest.raises(NotADirectoryError), local.cwd(tmp_path / "file"):
+        pass
+
+
+def test_restore_copier():
+    from copier._main import Worker
+    from plumbum.machines.local import LocalMachine
+
+    originals = (vars(LocalMachine)["cwd"], Worker._ask, Worker._apply_update)
+    assert threads.thread_safe_copier()
+    assert vars(LocalMachine)["cwd"] is not originals[0]
+
+    threads.restore_copier()
+
+    assert (vars(LocalMachine)["cwd"], Worker._ask, Worker._apply_update) == originals
+
+
+def test_untested_copier_versions_are_not_patched(monkeypatch: pytest.MonkeyPatch):
+    from copier._main import Worker
+
+    monkeypatch.setattr(threads, "TESTED_COPIER_VERSIONS", ("9.0",))
+    ask = Worker._ask
+
+    assert not threads.thread_safe_copier()
+    assert Worker._ask is ask
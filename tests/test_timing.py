@@ -0,0 +1,85 @@
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from coasti.timing import _git_subcommand, count, recorder, span
+
+
+@pytest.fixture(autouse=True)
+def fresh_recorder():
+    recorder.reset(command="test")
+    yield recorder
+    recorder.reset()
+
+
+def test_spans_are_nested_and_count_per_span():
+    with span("outer", product="p1"):
+        count("git_commands")
+        with span("inner") as attrs:
+            count("git_commands", 2)
+            attrs["bytes_written"] = 10
+
+    inner, outer = recorder.spans  # inner finishes first
+    assert outer.name == "outer" and outer.depth == 0 and outer.parent is None
+    assert inner.name == "inner" and inner.depth == 1 and inner.parent == "outer"
+    assert outer.counters["git_commands"] == 3
+    assert inner.counters["git_commands"] == 2
+    assert recorder.counters["git_commands"] == 3
+    assert outer.attrs == {"product": "p1", "status": "ok"}
+    assert inner.attrs["bytes_written"] == 10
+
+
+def test_failing_span_is_recorded_as_error():
+    with pytest.raises(RuntimeError), span("broken"):
+        raise RuntimeError("boom")
+
+    assert recorder.spans[0].attrs["status"] == "error"
+
+
+def test_write_jsonl(tmp_path: Path):
+    with span("outer"), span("inner"):
+        count("git_commands")
+
+    path = recorder.write_jsonl(tmp_path / "logs" / "coasti")
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+
+    assert [r["name"] for r in records[:-1]] == ["outer", "inner"]  # by start time
+    assert records[1]["counters"] == {"git_commands": 1}
+    assert records[-1]["type"] == "run"
+    assert records[-1]["command"] == "test"
+    assert records[-1]["counters"] == {"git_commands": 1}
+
+
+def test_write_chrome_trace_has_a_lane_per_thread(tmp_path: Path):
+    def work():
+        with span("worker"):
+            pass
+
+    with span("main"):
+        thread = threading.Thread(target=work, name="worker-1")
+        thread.start()
+        thread.join()
+
+    path = recorder.write_chrome_trace(tmp_path / "trace.json")
+    events = json.loads(path.read_text())["traceEvents"]
+
+    complete = {e["name"]: e for e in events if e["ph"] == "X"}
+    assert complete["main"]["tid"] != complete["worker"]["tid"]
+    assert complete["main"]["dur"] >= complete["worker"]["dur"]
+    lanes = {e["args"]["name"] for e in events if e["name"] == "thread_name"}
+    assert "worker-1" in lanes
+
+
+@pytest.mark.parametrize(
+    "argv,expected",
+    [
+        (["git", "clone", "url", "dst"], "clone"),
+        (["/usr/bin/git", "-C", "/some/dir", "rev-parse", "HEAD"], "rev_parse"),
+        (["git", "-c", "core.fsmonitor=false", "checkout", "-f"], "checkout"),
+        (["git", "--version"], "unknown"),
+    ],
+)
+def test_git_subcommand(argv, expected):
+    assert _git_subcommand(argv) == expected
@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import pytest
+
+from coasti.prompt import tree
+from coasti.workspace.walk import DirSizes, is_ignored, tree_lines, walk
+
+
+@pytest.fixture
+def workspace(tmp_path: Path) -> Path:
+    (tmp_path / ".git" / "objects").mkdir(parents=True)
+    (tmp_path / "data" / "big").mkdir(parents=True)
+    (tmp_path / "data" / "big" / "blob").write_bytes(b"x" * 1000)
+    (tmp_path / "products" / "p1" / "config").mkdir(parents=True)
+    (tmp_path / "products" / "p1" / "config" / ".env").write_text("a=1\n")
+    (tmp_path / "products" / "p1" / "README.md").write_text("hello")
+    (tmp_path / "config").mkdir()
+    (tmp_path / "config" / "p1").symlink_to(tmp_path / "products" / "p1" / "config")
+    return tmp_path
+
+
+def test_is_ignored():
+    ignore = (".git", "data/**")
+    assert is_ignored(".git", ".git", ignore)
+    assert is_ignored("products/p1/.git", ".git", ignore)
+    assert not is_ignored("data", "data", ignore)
+    assert is_ignored("data/big", "big", ignore)
+    assert not is_ignored("products/p1/data", "data", ignore)
+
+
+def test_walk_skips_ignored_and_does_not_follow_symlinks(workspace: Path):
+    rels = [e.rel for e in walk(workspace)]
+    assert rels == [
+        "config",
+        "config/p1",
+        "data",
+        "products",
+        "products/p1",
+        "products/p1/README.md",
+        "products/p1/config",
+        "products/p1/config/.env",
+    ]
+    assert [e.rel for e in walk(workspace, max_depth=1)] == [
+        "config",
+        "data",
+        "products",
+    ]
+
+
+def test_tree_lines(workspace: Path):
+    link_target = str(workspace / "products" / "p1" / "config")
+    lines = list(tree_lines(workspace, sizes=True))
+    assert lines == [
+        # links count with their own size, not the size of their target
+        f"├── config/  [{len(link_target)} B]",
+        f"│   └── p1 -> {link_target}",
+        "├── data/  [0 B]",
+        "└── products/  [9 B]",
+        "    └── p1/  [9 B]",
+        "        ├── README.md  [5 B]",
+        "        └── config/  [4 B]",
+        "            └── .env  [4 B]",
+    ]
+
+    lines = list(tree_lines(workspace / "products" / "p1", max_entries=1))
+    assert lines == ["├── README.md", "└── … 1 more"]
+
+
+def test_dir_sizes_are_memoized(workspace: Path, monkeypatch: pytest.MonkeyPatch):
+    entries = {e.rel: e for e in walk(workspace)}
+    sizes = DirSizes(workspace)
+    assert sizes(entries["products"]) == 9
+
+    # sizes below were computed along the way, no further scans
+    monkeypatch.setattr("coasti.workspace.walk.os.scandir", None)
+    assert sizes(entries["products/p1"]) == 9
+
+
+def test_prompt_tree_shows_everything(workspace: Path):
+    lines = list(tree(workspace / "data"))
+    assert lines == ["└── big/", "    └── blob"]